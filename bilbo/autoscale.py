@@ -0,0 +1,232 @@
+"""Dask 워커 자동 확장 모듈.
+
+스케쥴러의 JSON 엔드포인트에서 대기 작업 수, 워커 점유율, 메모리 사용률을
+주기적으로 읽어 워커 인스턴스 수를 늘리거나 줄인다. 늘리는 기준과 줄이는
+기준을 따로 두고(히스테리시스), 줄일 때는 한가한 상태가 여러 번 이어져야
+하며, 확장 후에는 정해진 시간 동안 다시 확장하지 않는다(쿨다운).
+모든 확장 결정은 `~/.bilbo/logs/<클러스터>_autoscale.jsonl` 에 남는다.
+"""
+import os
+import json
+import math
+import time
+
+from bilbo.cluster import fetch_scheduler_identity, scale_cluster
+from bilbo.state import check_cluster, load_cluster_info
+from bilbo.util import info, warning, error, critical, log_dir
+
+INTERVAL = 30
+# 기본 확장 기준
+AUTOSCALE_DEFAULTS = {
+    'interval': INTERVAL,
+    # 쓰레드당 대기 작업 수가 이보다 많으면 늘림
+    'up_backlog': 2.0,
+    # 메모리 사용률이 이보다 높으면 늘림
+    'up_memory': 0.8,
+    # 쓰레드 점유율이 이보다 낮고
+    'down_occupancy': 0.25,
+    # 메모리 사용률도 이보다 낮은 상태가
+    'down_memory': 0.4,
+    # 이 횟수만큼 이어지면 줄임
+    'idle_polls': 3,
+    # 늘린 후 / 줄인 후 다시 확장하지 않는 시간 (초)
+    'up_cooldown': 120,
+    'down_cooldown': 600
+}
+
+
+def autoscale_options(clinfo, min_worker=None, max_worker=None):
+    """프로파일과 명령행 값으로 자동 확장 옵션 구성.
+
+    Args:
+        clinfo (dict): 클러스터 정보
+        min_worker (int): 최소 워커 인스턴스 수. None 이면 프로파일 값
+        max_worker (int): 최대 워커 인스턴스 수. None 이면 프로파일 값
+
+    Returns:
+        dict: 자동 확장 옵션
+    """
+    pro = clinfo['profile'].get('dask', {}).get('autoscale', {})
+    opts = dict(AUTOSCALE_DEFAULTS, **pro)
+    if min_worker is not None:
+        opts['min'] = min_worker
+    if max_worker is not None:
+        opts['max'] = max_worker
+    if 'min' not in opts or 'max' not in opts:
+        raise RuntimeError("Minimum and maximum worker counts are needed.")
+    if not 1 <= opts['min'] <= opts['max']:
+        raise RuntimeError("Invalid worker count range: {} - {}".
+                           format(opts['min'], opts['max']))
+    return opts
+
+
+def load_metrics(identity):
+    """스케쥴러 정보에서 확장 판단에 쓸 지표를 모음.
+
+    Args:
+        identity (dict): 스케쥴러의 `/json/identity.json` 응답
+
+    Returns:
+        dict: workers (워커 프로세스 수), threads, backlog (실행 대기 작업
+            수), occupancy (실행 중 작업 / 쓰레드), memory (사용 / 한도)
+    """
+    threads = executing = backlog = memory = limit = 0
+    workers = identity.get('workers', {})
+    for winfo in workers.values():
+        metrics = winfo.get('metrics', {})
+        threads += winfo.get('nthreads', winfo.get('ncores', 0))
+        executing += metrics.get('executing', 0)
+        backlog += metrics.get('ready', 0)
+        memory += metrics.get('memory', 0)
+        limit += winfo.get('memory_limit') or 0
+    return {
+        'workers': len(workers),
+        'threads': threads,
+        'backlog': backlog,
+        'occupancy': executing / threads if threads > 0 else 0.0,
+        'memory': memory / limit if limit > 0 else 0.0
+    }
+
+
+def decide(metrics, cur, opts, state, now):
+    """지표로 원하는 워커 인스턴스 수를 결정.
+
+    Args:
+        metrics (dict): load_metrics 의 결과
+        cur (int): 현재 워커 인스턴스 수
+        opts (dict): 자동 확장 옵션
+        state (dict): 폴링 사이에 유지되는 상태. `last_up`, `last_down`,
+            `idle` 을 갱신한다.
+        now (float): 현재 시간 (epoch 초)
+
+    Returns:
+        tuple: (원하는 워커 인스턴스 수, 이유)
+    """
+    lo, hi = opts['min'], opts['max']
+    if cur < lo:
+        return lo, 'below min'
+    if cur > hi:
+        return hi, 'above max'
+
+    threads = metrics['threads']
+    pressure = metrics['backlog'] / threads if threads > 0 else 0.0
+    busy = pressure > opts['up_backlog'] or \
+        metrics['memory'] > opts['up_memory']
+    idle = metrics['backlog'] == 0 and \
+        metrics['occupancy'] < opts['down_occupancy'] and \
+        metrics['memory'] < opts['down_memory']
+    state['idle'] = state.get('idle', 0) + 1 if idle else 0
+    since_up = now - state.get('last_up', 0)
+    since_down = now - state.get('last_down', 0)
+
+    if busy:
+        if cur >= hi:
+            return cur, 'busy at max'
+        if since_up < opts['up_cooldown'] or \
+                since_down < opts['up_cooldown']:
+            return cur, 'busy in cooldown'
+        # 대기 작업 비율만큼, 한 번에 최대 두 배까지
+        want = math.ceil(cur * pressure / opts['up_backlog'])
+        return min(hi, cur * 2, max(cur + 1, want)), 'busy'
+
+    if state['idle'] >= opts['idle_polls']:
+        if cur <= lo:
+            return cur, 'idle at min'
+        if since_up < opts['down_cooldown'] or \
+                since_down < opts['down_cooldown']:
+            return cur, 'idle in cooldown'
+        # 한 번에 1/4 씩 줄임
+        return max(lo, cur - max(1, cur // 4)), 'idle'
+
+    return cur, 'steady'
+
+
+def decision_log_path(clname):
+    """자동 확장 결정 기록 파일 경로."""
+    return os.path.join(log_dir, '{}_autoscale.jsonl'.format(clname))
+
+
+def record_decision(clname, decision):
+    """자동 확장 결정을 기록 파일에 한 줄로 추가."""
+    line = json.dumps(decision, sort_keys=True) + '\n'
+    with open(decision_log_path(clname), 'at', encoding='utf-8') as f:
+        f.write(line)
+
+
+def load_decisions(clname):
+    """자동 확장 결정 기록 읽기.
+
+    Returns:
+        list: 결정 dict 리스트
+    """
+    path = decision_log_path(clname)
+    if not os.path.isfile(path):
+        return []
+    decisions = []
+    with open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            try:
+                decisions.append(json.loads(line))
+            except ValueError:
+                continue
+    return decisions
+
+
+def autoscale_cluster(clname, min_worker=None, max_worker=None,
+                      interval=None, rounds=None):
+    """스케쥴러 부하에 따라 Dask 워커 인스턴스 수를 계속 조정.
+
+    Args:
+        clname (str): 클러스터명
+        min_worker (int): 최소 워커 인스턴스 수
+        max_worker (int): 최대 워커 인스턴스 수
+        interval (int): 폴링 간격 (초). None 이면 프로파일 값
+        rounds (int): 폴링 횟수. None 이면 중단될 때까지
+    """
+    check_cluster(clname)
+    clinfo = load_cluster_info(clname)
+    if clinfo.get('type') != 'dask':
+        raise RuntimeError("Only Dask clusters can be autoscaled.")
+    opts = autoscale_options(clinfo, min_worker, max_worker)
+    if interval is None:
+        interval = opts['interval']
+    dash_url = clinfo.get('dask_dashboard_url') or \
+        'http://{}:8787'.format(clinfo['instance']['scheduler']['public_ip'])
+    critical("Autoscale '{}' between {} and {} workers.".
+             format(clname, opts['min'], opts['max']))
+
+    state = {}
+    cnt = 0
+    while rounds is None or cnt < rounds:
+        if cnt > 0:
+            time.sleep(interval)
+        cnt += 1
+
+        clinfo = load_cluster_info(clname)
+        cur = len(clinfo['instance']['workers'])
+        try:
+            metrics = load_metrics(fetch_scheduler_identity(dash_url))
+        except Exception as e:
+            warning("Can not get scheduler metrics: {}".format(e))
+            continue
+
+        now = time.time()
+        target, reason = decide(metrics, cur, opts, state, now)
+        info("autoscale: {} => {} ({}) {}".
+             format(cur, target, reason, metrics))
+        if reason == 'steady':
+            continue
+
+        decision = dict(metrics, time=now, current=cur, target=target,
+                        reason=reason)
+        if target != cur:
+            warning("Scale workers {} => {} ({}).".format(cur, target,
+                                                         reason))
+            try:
+                scale_cluster(clname, target)
+            except Exception as e:
+                error("Scaling failed: {}".format(e))
+                decision['error'] = str(e)
+            state['last_up' if target > cur else 'last_down'] = time.time()
+            state['idle'] = 0
+        record_decision(clname, decision)
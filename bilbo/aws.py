@@ -0,0 +1,111 @@
+"""AWS 세션/클라이언트 모듈.
+
+크레덴셜과 엔드포인트 해석은 비싸기에, 프로세스에서 리전별로 세션을 하나만
+만들고 클라이언트도 재사용한다. 클라이언트는 여러 쓰레드에서 함께 써도
+되지만, 리소스(boto3.resource)는 그렇지 않아 쓰레드별로 만든다.
+"""
+import threading
+
+import boto3
+from botocore.config import Config
+
+from bilbo.util import info
+
+DEFAULT_MAX_POOL = 50
+DEFAULT_MAX_ATTEMPTS = 10
+
+_lock = threading.Lock()
+# 리전 => 세션
+_sessions = {}
+# (서비스, 리전, 최대 연결 수) => 클라이언트
+_clients = {}
+_local = threading.local()
+
+
+def aws_options(clinfo):
+    """클러스터 프로파일에서 AWS 접속 옵션 얻기.
+
+    Returns:
+        dict: get_client/get_resource 에 넘길 region, max_pool
+    """
+    aopt = clinfo['profile'].get('aws', {})
+    return {'region': aopt.get('region'),
+            'max_pool': aopt.get('max_pool_connections', DEFAULT_MAX_POOL)}
+
+
+def client_config(max_pool=DEFAULT_MAX_POOL):
+    """적응형 재시도와 연결 풀 크기를 지정한 botocore 설정."""
+    return Config(retries={'mode': 'adaptive',
+                           'max_attempts': DEFAULT_MAX_ATTEMPTS},
+                  max_pool_connections=max_pool)
+
+
+def get_session(region=None):
+    """리전별 공용 boto3 세션.
+
+    Args:
+        region (str): 리전. None 이면 AWS 설정의 기본 리전
+
+    Returns:
+        boto3.session.Session: 세션
+    """
+    with _lock:
+        if region not in _sessions:
+            info("get_session: {}".format(region))
+            _sessions[region] = boto3.session.Session(region_name=region)
+        return _sessions[region]
+
+
+def get_client(service='ec2', region=None, max_pool=DEFAULT_MAX_POOL):
+    """공용 boto3 클라이언트. 여러 쓰레드에서 함께 써도 된다.
+
+    Args:
+        service (str): AWS 서비스 이름
+        region (str): 리전. None 이면 AWS 설정의 기본 리전
+        max_pool (int): 최대 HTTP 연결 수
+
+    Returns:
+        botocore.client.BaseClient: 클라이언트
+    """
+    key = (service, region, max_pool)
+    session = get_session(region)
+    with _lock:
+        # 세션의 클라이언트 생성은 쓰레드 안전하지 않음
+        if key not in _clients:
+            _clients[key] = session.client(
+                service, config=client_config(max_pool))
+        return _clients[key]
+
+
+def get_resource(service='ec2', region=None, max_pool=DEFAULT_MAX_POOL):
+    """쓰레드별 boto3 리소스.
+
+    Args:
+        service (str): AWS 서비스 이름
+        region (str): 리전. None 이면 AWS 설정의 기본 리전
+        max_pool (int): 최대 HTTP 연결 수
+
+    Returns:
+        boto3.resources.base.ServiceResource: 리소스
+    """
+    key = (service, region, max_pool)
+    resources = getattr(_local, 'resources', None)
+    if resources is None:
+        resources = _local.resources = {}
+    if key not in resources:
+        session = get_session(region)
+        with _lock:
+            resources[key] = session.resource(
+                service, config=client_config(max_pool))
+    return resources[key]
+
+
+def reset():
+    """공용 세션과 클라이언트, 현재 쓰레드의 리소스를 버림.
+
+    크레덴셜이 바뀐 경우 등에 사용.
+    """
+    with _lock:
+        _sessions.clear()
+        _clients.clear()
+    _local.__dict__.clear()
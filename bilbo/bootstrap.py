@@ -0,0 +1,230 @@
+"""호스트 부트스트랩 모듈.
+
+역할별 초기화 단계들을 하나의 쉘 스크립트로 만들어, 한 번의 SSH 세션으로
+보내 실행한다. 스크립트에는 크레덴셜이 들어있기에 원격 디스크에 쓰지 않는다. 스크립트는 단계마다 이름, exit code, 소요 시간을 JSON 한
+줄로 보고하고, 처음 실패한 단계에서 멈춘다.
+
+Jupyter, Dask 같은 서비스는 로그 파일로 출력하도록 띄우고, 그 로그를 하나의
+채널로 따라 읽어 준비 완료를 확인한다.
+"""
+import re
+import json
+import base64
+import shlex
+from collections import deque
+
+from bilbo.ssh import open_channel, CmdStream, STDOUT
+from bilbo.util import info, warning
+
+REPORT_MARK = 'BILBO_STEP '
+ERR_TAIL = 20
+
+SCRIPT_HEAD = r"""#!/bin/bash
+# bilbo bootstrap: {role}
+LOG=~/.bilbo_bootstrap_{role}.log
+(umask 077; : > "$LOG")
+_step() {{
+    local name="$1" cmd="$2" st rc
+    st=$(date +%s%N)
+    echo "### $name" >> "$LOG"
+    (eval "$cmd") >> "$LOG" 2>&1 < /dev/null
+    rc=$?
+    printf '{mark}{{"step": "%s", "excode": %d, "duration": %d}}\n' \
+        "$name" $rc $(( ($(date +%s%N) - st) / 1000000 ))
+    if [ $rc -ne 0 ]; then
+        tail -n {tail} "$LOG" >&2
+        exit $rc
+    fi
+}}
+"""
+
+
+def step_name(name):
+    """보고용 JSON 에 그대로 쓸 수 있는 단계 이름."""
+    return re.sub(r'[^\w.:\[\]-]', '_', name)
+
+
+def build_script(role, steps):
+    """단계들을 실행하는 부트스트랩 스크립트 생성.
+
+    각 단계는 서브쉘에서 실행되기에, 한 단계의 `cd` 등은 다음 단계에 영향을
+    주지 않는다. 단계의 출력은 원격 호스트의 `~/.bilbo_bootstrap_<역할>.log`
+    에 남는다.
+
+    Args:
+        role (str): 역할 (notebook, scheduler, worker)
+        steps (list): (단계 이름, 쉘 명령) 리스트
+
+    Returns:
+        str: bash 스크립트
+    """
+    lines = [SCRIPT_HEAD.format(role=role, mark=REPORT_MARK, tail=ERR_TAIL)]
+    for name, cmd in steps:
+        lines.append('_step {} {}'.format(shlex.quote(step_name(name)),
+                                          shlex.quote(cmd)))
+    return '\n'.join(lines) + '\n'
+
+
+def script_cmd(script):
+    """스크립트를 파일로 남기지 않고 bash 에 바로 넘겨 실행하는 원격 명령.
+
+    단계들의 표준 입력은 /dev/null 이기에 스크립트를 읽는 입력과 섞이지
+    않는다.
+    """
+    b64 = base64.b64encode(script.encode('utf-8')).decode('ascii')
+    return 'echo {} | base64 -d | bash -s'.format(b64)
+
+
+def parse_report(lines):
+    """스크립트 출력에서 단계별 보고를 추림.
+
+    Returns:
+        list: 단계별 {'step', 'excode', 'duration'} 리스트. duration 은 초
+    """
+    report = []
+    for line in lines:
+        if not line.startswith(REPORT_MARK):
+            continue
+        try:
+            step = json.loads(line[len(REPORT_MARK):])
+        except ValueError:
+            continue
+        step['duration'] = step['duration'] / 1000.0
+        report.append(step)
+    return report
+
+
+def run_bootstrap(user, private_key, ip, role, steps, send_cmd):
+    """역할의 부트스트랩 스크립트를 한 번의 세션으로 실행.
+
+    Args:
+        user (str): SSH 유저
+        private_key (str): SSH Private Key 경로
+        ip (str): 대상 인스턴스 IP
+        role (str): 역할
+        steps (list): (단계 이름, 쉘 명령) 리스트
+        send_cmd (callable): send_instance_cmd 와 같은 형식의 명령 함수
+
+    Returns:
+        list: 단계별 보고
+
+    Raises:
+        RuntimeError: 접속할 수 없거나 실패한 단계가 있을 때
+    """
+    if len(steps) == 0:
+        return []
+    info("run_bootstrap: {} {} ({} steps)".format(role, ip, len(steps)))
+    cmd = script_cmd(build_script(role, steps))
+    res = send_cmd(user, private_key, ip, cmd, show_stderr=False,
+                   get_excode=True)
+    if res is None:
+        raise RuntimeError("Bootstrap of {} '{}' failed: can not connect.".
+                           format(role, ip))
+    stdouts, stderr, excode = res
+    report = parse_report(stdouts)
+    for step in report:
+        info("  {} {}: exit {} in {:.2f}s".format(
+            ip, step['step'], step['excode'], step['duration']))
+
+    if excode != 0:
+        # 단계 보고가 없으면 스크립트 자체를 실행하지 못한 것
+        failed = '(script)'
+        if len(report) > 0 and report[-1]['excode'] != 0:
+            failed = report[-1]['step']
+        warning(stderr)
+        raise RuntimeError("Bootstrap of {} '{}' failed at step '{}' "
+                           "(exit {}).".format(role, ip, failed, excode))
+    total = sum(step['duration'] for step in report)
+    warning("Bootstrapped {} '{}': {} steps in {:.1f}s.".
+            format(role, ip, len(report), total))
+    return report
+
+
+SERVICE_TIMEOUT = 600
+EXIT_MARK = 'BILBO_EXIT '
+# 서비스별 준비 완료를 알리는 로그 패턴
+JUPYTER_URL_PTRN = re.compile(r'(https?://\S+[?&]token=\w+)')
+SCHEDULER_PTRN = re.compile(r'Scheduler at:\s+(\S+)')
+WORKER_PTRN = re.compile(r'Registered to:\s+(\S+)')
+
+
+def service_log(name):
+    """서비스 로그 파일 경로."""
+    return '~/.bilbo_{}.log'.format(name)
+
+
+def service_cmd(name, cmd):
+    """screen 으로 서비스를 띄우는 명령.
+
+    서비스 출력은 로그 파일로 보내고, 서비스가 끝나면 exit code 를 로그에
+    남겨 기다리는 쪽이 바로 알 수 있게 한다.
+    """
+    log = service_log(name)
+    inner = '({}) > {} 2>&1; echo "{}$?" >> {}'.format(cmd, log, EXIT_MARK,
+                                                       log)
+    return 'rm -f {}; screen -S bilbo -d -m bash -c {}'.\
+        format(log, shlex.quote(inner))
+
+
+def match_service_log(lines, pattern, count=1):
+    """서비스 로그 줄들에서 준비 완료 패턴을 찾음.
+
+    Args:
+        lines (iterable): 도착하는 대로 생성되는 로그 줄
+        pattern (re.Pattern): 첫 그룹을 결과로 쓰는 패턴
+        count (int): 찾을 패턴 수
+
+    Returns:
+        list: 찾은 첫 그룹 문자열 리스트
+
+    Raises:
+        RuntimeError: 패턴을 찾기 전에 서비스가 끝났을 때
+        TimeoutError: 패턴을 찾기 전에 로그가 끝났을 때
+    """
+    found = []
+    tail = deque(maxlen=ERR_TAIL)
+    for line in lines:
+        if line.startswith(EXIT_MARK):
+            raise RuntimeError("Service exited with {} before ready:\n{}".
+                               format(line[len(EXIT_MARK):].strip(),
+                                      '\n'.join(tail)))
+        tail.append(line)
+        match = pattern.search(line)
+        if match is not None:
+            found.append(match.group(1))
+            if len(found) >= count:
+                return found
+    raise TimeoutError("Service is not ready:\n{}".format('\n'.join(tail)))
+
+
+def wait_service(user, private_key, ip, name, pattern, count=1,
+                 timeout=SERVICE_TIMEOUT):
+    """서비스 로그를 하나의 채널로 따라 읽으며 준비될 때까지 기다림.
+
+    Args:
+        user (str): SSH 유저
+        private_key (str): SSH Private Key 경로
+        ip (str): 대상 인스턴스 IP
+        name (str): 서비스 이름 (service_cmd 에 쓴 이름)
+        pattern (re.Pattern): 준비 완료 패턴
+        count (int): 찾을 패턴 수
+        timeout (int): 최대 대기 시간 (초)
+
+    Returns:
+        list: 찾은 첫 그룹 문자열 리스트
+    """
+    info("wait_service: {} {}".format(ip, name))
+    # pty 를 받아 두면 채널을 닫을 때 원격 tail 이 SIGHUP 으로 끝난다
+    cmd = 'timeout {} tail -n +1 -F {} 2>/dev/null'.format(
+        timeout, service_log(name))
+    channel = open_channel(user, private_key, ip)
+    if channel is None:
+        raise RuntimeError("Can not connect to '{}'.".format(ip))
+    channel.get_pty()
+    channel.exec_command(cmd)
+    try:
+        lines = (line.rstrip('\r') for kind, line in CmdStream(channel)
+                 if kind == STDOUT)
+        return match_service_log(lines, pattern, count)
+    finally:
+        channel.close()
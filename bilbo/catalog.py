@@ -0,0 +1,119 @@
+"""EC2 인스턴스 타입 카탈로그 모듈."""
+import os
+import json
+import time
+
+from bilbo.aws import get_client
+from bilbo.util import info, warning, bilbo_dir
+
+CATALOG_FILE = 'instance_types.json'
+CATALOG_TTL = 60 * 60 * 24 * 7
+MIB = 1024 * 1024
+# 공칭 메모리 중 커널과 OS 몫으로 남길 비율. 인스턴스에서 free 로 보이는
+# 전체 메모리는 공칭의 95% 정도이고, 데몬들의 몫까지 더해 10% 를 남긴다.
+OS_MEM_RESERVE = 0.1
+
+
+def catalog_path():
+    return os.path.join(bilbo_dir, CATALOG_FILE)
+
+
+def load_catalog():
+    """로컬 카탈로그 읽기."""
+    path = catalog_path()
+    if not os.path.isfile(path):
+        return {}
+    with open(path, 'rt') as f:
+        try:
+            return json.loads(f.read())
+        except ValueError:
+            warning("Broken instance type catalog '{}'.".format(path))
+            return {}
+
+
+def save_catalog(catalog):
+    """로컬 카탈로그 쓰기."""
+    path = catalog_path()
+    tmp = path + '.tmp'
+    with open(tmp, 'wt') as f:
+        f.write(json.dumps(catalog, indent=4, sort_keys=True))
+    os.replace(tmp, path)
+
+
+def _type_entry(itype):
+    """DescribeInstanceTypes 항목에서 필요한 사양만 추림."""
+    vcpu = itype['VCpuInfo']
+    return {
+        'VCpus': vcpu['DefaultVCpus'],
+        'Cores': vcpu.get('DefaultCores', vcpu['DefaultVCpus']),
+        'ThreadsPerCore': vcpu.get('DefaultThreadsPerCore', 1),
+        'MemTotal': itype['MemoryInfo']['SizeInMiB'] * MIB,
+        'fetched': time.time()
+    }
+
+
+def fetch_instance_types(client, ec2types):
+    """DescribeInstanceTypes 로 인스턴스 타입 사양을 얻어 카탈로그에 기록.
+
+    Args:
+        client (botocore.client.EC2): boto EC2 client
+        ec2types (list): 인스턴스 타입 리스트
+
+    Returns:
+        dict: 갱신된 카탈로그
+    """
+    info("fetch_instance_types: {}".format(ec2types))
+    catalog = load_catalog()
+    paginator = client.get_paginator('describe_instance_types')
+    for page in paginator.paginate(InstanceTypes=list(ec2types)):
+        for itype in page['InstanceTypes']:
+            catalog[itype['InstanceType']] = _type_entry(itype)
+    save_catalog(catalog)
+    return catalog
+
+
+def _is_fresh(entry, ttl):
+    return entry is not None and time.time() - entry['fetched'] < ttl
+
+
+def get_instance_type_info(ec2type, client=None, ttl=CATALOG_TTL,
+                           **aws_opts):
+    """카탈로그에서 인스턴스 타입 사양 얻기.
+
+    카탈로그에 없거나 TTL 이 지났으면 DescribeInstanceTypes 로 갱신한다.
+
+    Args:
+        ec2type (str): 인스턴스 타입
+        client (botocore.client.EC2): boto EC2 client. None 이면 aws_opts
+            로 얻은 공용 client
+        ttl (int): 카탈로그 항목 유효 시간 (초)
+        aws_opts: get_client 에 넘길 region, max_pool (aws_options 의 결과)
+
+    Returns:
+        dict: VCpus, Cores, ThreadsPerCore, MemTotal. 얻을 수 없으면 None
+    """
+    entry = load_catalog().get(ec2type)
+    if _is_fresh(entry, ttl):
+        return entry
+
+    try:
+        if client is None:
+            client = get_client('ec2', **aws_opts)
+        entry = fetch_instance_types(client, [ec2type]).get(ec2type)
+    except Exception as e:
+        # 오프라인 등의 이유로 갱신할 수 없으면 오래된 항목이라도 사용
+        warning("Can not describe instance type '{}': {}".format(ec2type, e))
+    return entry
+
+
+def type_facts(entry):
+    """카탈로그 항목을 호스트 사양 정보 형식으로 변환.
+
+    CoreCount 는 물리 코어 수이고, MemTotal 은 공칭 메모리에서
+    OS_MEM_RESERVE 만큼 뺀 값이다.
+    """
+    return {
+        'CoreCount': entry['Cores'],
+        'ThreadsPerCore': entry['ThreadsPerCore'],
+        'MemTotal': int(entry['MemTotal'] * (1 - OS_MEM_RESERVE))
+    }
@@ -1,19 +1,14 @@
-"""명령행 인터페이스."""
+"""명령행 인터페이스.
+
+boto3, paramiko, jsonschema 등 무거운 모듈을 쓰는 `bilbo.cluster` 는
+필요한 명령에서만 임포트해, 가벼운 명령의 시작 시간을 줄인다.
+"""
 import sys
 
 import click
-import botocore
 
 from bilbo.version import VERSION
 from bilbo.util import set_log_verbosity, iter_profiles, CTRL_C_EXCODE
-from bilbo.profile import check_profile
-from bilbo.cluster import create_cluster, show_cluster, \
-    destroy_cluster, show_all_cluster, send_instance_cmd, \
-    find_cluster_instance_by_public_ip, stop_cluster, start_cluster, \
-    open_dashboard, open_notebook, run_notebook_or_python, \
-    stop_notebook_or_python, pause_cluster, resume_cluster, show_plan, \
-    start_services, save_cluster_info, init_instances, load_cluster_info, \
-    run_cmd_and_store_result
 
 @click.group()
 @click.option('-v', '--verbose', count=True, help="Increase message verbosity.")
@@ -23,12 +18,13 @@ def main(ctx, verbose):
     set_log_verbosity(verbose)
 
 
-def _after_create(clinfo, open_nb, open_db):
-    # 인스턴스 정보만 저장
-    save_cluster_info(clinfo)
+def _after_create(clinfo, open_nb, open_db, wait_fleet=False):
+    from bilbo.cluster import start_services, show_cluster, open_notebook, \
+        open_dashboard, fill_fleet_workers, spawn_fill_workers, \
+        fill_log_path
     name = clinfo['name']
+    # 서비스 시작과 초기화 명령은 호스트별 부트스트랩으로 실행
     remote_nb = start_services(clinfo)
-    init_instances(clinfo)
     show_cluster(name)
 
     if open_nb:
@@ -40,6 +36,18 @@ def _after_create(clinfo, open_nb, open_db):
     if open_db:
         open_dashboard(name, False)
 
+    # Fleet 으로 모자랐던 워커는 클러스터를 쓸 수 있게 된 후에 채움
+    pending = clinfo.get('fleet_pending', 0)
+    if pending == 0:
+        return
+    if wait_fleet:
+        fill_fleet_workers(name)
+        show_cluster(name)
+    else:
+        spawn_fill_workers(name)
+        print("{} pending workers will be added in background. See '{}'.".
+              format(pending, fill_log_path(name)))
+
 
 @main.command(help="Create a cluster.")
 @click.argument('PROFILE')
@@ -51,17 +59,22 @@ def _after_create(clinfo, open_nb, open_db):
               "notebook when cluster is ready.")
 @click.option('-d', '--dashboard', 'open_db', is_flag=True, help="Open remote "
               "dashboard when cluster is ready.")
-def create(profile, name, param, open_nb, open_db):
+@click.option('--wait-fleet', is_flag=True, help="Wait until pending fleet "
+              "workers are filled instead of filling them in background.")
+def create(profile, name, param, open_nb, open_db, wait_fleet):
     """클러스터 생성."""
+    from bilbo.profile import check_profile
+    from bilbo.cluster import create_cluster
     check_profile(profile)
     clinfo = create_cluster(profile, name, param)
-    _after_create(clinfo, open_nb, open_db)
+    _after_create(clinfo, open_nb, open_db, wait_fleet)
 
 
 @main.command(help="Pause a cluster.")
 @click.argument('CLUSTER')
 def pause(cluster):
     """클러스터 정지."""
+    from bilbo.cluster import pause_cluster
     pause_cluster(cluster)
 
 
@@ -71,10 +84,13 @@ def pause(cluster):
               "notebook when cluster is ready.")
 @click.option('-d', '--dashboard', 'open_db', is_flag=True, help="Open remote "
               "dashboard when cluster is ready.")
-def resume(cluster, open_nb, open_db):
+@click.option('--wait-fleet', is_flag=True, help="Wait until pending fleet "
+              "workers are filled instead of filling them in background.")
+def resume(cluster, open_nb, open_db, wait_fleet):
     """클러스터 재개."""
+    from bilbo.cluster import resume_cluster
     clinfo = resume_cluster(cluster)
-    _after_create(clinfo, open_nb, open_db)
+    _after_create(clinfo, open_nb, open_db, wait_fleet)
 
 
 @main.command(help="Show cluster creation plan.")
@@ -84,13 +100,19 @@ def resume(cluster, open_nb, open_db):
               help="Override profile by parameter.")
 def plan(profile, name, param):
     """클러스터 생성 계획 표시."""
+    from bilbo.cluster import show_plan
     show_plan(profile, name, param)
 
 
 @main.command(help="List active clusters.")
-def ls():
+@click.option('-l', '--long', 'long_', is_flag=True,
+              help="Show type, instance count, state and saved time.")
+@click.option('-j', '--json', 'as_json', is_flag=True,
+              help="Print cluster index as JSON.")
+def ls(long_, as_json):
     """모든 클러스터를 리스팅."""
-    show_all_cluster()
+    from bilbo.state import show_all_cluster
+    show_all_cluster(long_, as_json)
 
 
 @main.command('profiles', help='List all profiles.')
@@ -105,6 +127,7 @@ def profiles():
 @click.option('-f', '--force', is_flag=True, help="Destroy without check.")
 def destroy(cluster, force):
     """클러스터 파괴."""
+    from bilbo.cluster import destroy_cluster
     destroy_cluster(cluster, force)
 
 
@@ -113,12 +136,14 @@ def destroy(cluster, force):
 @click.option('-d', '--detail', is_flag=True,
               help="Show detailed information.")
 def desc(cluster, detail):
+    from bilbo.state import show_cluster
     show_cluster(cluster, detail)
 
 
 def _restart(cluster):
+    from bilbo.cluster import stop_cluster, start_cluster
     clinfo = stop_cluster(cluster)
-    start_cluster(clinfo)
+    start_cluster(clinfo, init=False)
 
 
 @main.command(help="Restart a cluster service.")
@@ -127,30 +152,131 @@ def restart(cluster):
     _restart(cluster)
 
 
-@main.command(help="Command to a cluster instance.")
+@main.command(help="Add or remove Dask workers of a running cluster.")
+@click.argument('CLUSTER')
+@click.option('-w', '--workers', type=click.IntRange(min=1), required=True,
+              help="Number of worker instances.")
+def scale(cluster, workers):
+    """워커 인스턴스 수 변경."""
+    from bilbo.cluster import scale_cluster
+    from bilbo.state import show_cluster
+    scale_cluster(cluster, workers)
+    show_cluster(cluster)
+
+
+@main.command(help="Add Dask workers that EC2 Fleet could not launch yet.")
+@click.argument('CLUSTER')
+@click.option('-t', '--timeout', type=click.IntRange(min=0),
+              help="Seconds to keep requesting capacity (Default: 1800).")
+def fill(cluster, timeout):
+    """Fleet 으로 모자랐던 워커 채우기."""
+    from bilbo.cluster import fill_fleet_workers, show_cluster, \
+        FLEET_FILL_TIMEOUT
+    if timeout is None:
+        timeout = FLEET_FILL_TIMEOUT
+    fill_fleet_workers(cluster, timeout)
+    show_cluster(cluster)
+
+
+@main.command(help="Keep adjusting Dask workers by scheduler load.")
+@click.argument('CLUSTER')
+@click.option('--min', 'min_worker', type=click.IntRange(min=1),
+              help="Minimum number of worker instances.")
+@click.option('--max', 'max_worker', type=click.IntRange(min=1),
+              help="Maximum number of worker instances.")
+@click.option('-i', '--interval', type=click.IntRange(min=1),
+              help="Seconds between scheduler polls.")
+def autoscale(cluster, min_worker, max_worker, interval):
+    """스케쥴러 부하에 따라 워커 인스턴스 수 자동 조정."""
+    from bilbo.autoscale import autoscale_cluster
+    try:
+        autoscale_cluster(cluster, min_worker, max_worker, interval)
+    except KeyboardInterrupt:
+        return sys.exit(CTRL_C_EXCODE)
+
+
+@main.command(help="Command to cluster instances. TARGET selects instances "
+              "by 'all', 'workers', 'scheduler', 'notebook', index or range "
+              "shown by desc (e.g. 3, 2-5), instance ID or IP, joined with "
+              "commas.")
 @click.argument('CLUSTER')
-@click.argument('PUBLIC_IP')
+@click.argument('TARGET')
 @click.argument('CMD')
-def rcmd(cluster, public_ip, cmd):
-    # 존재하는 클러스터에서 인스턴스 IP로 정보를 찾음
-    ret = find_cluster_instance_by_public_ip(cluster, public_ip)
-    if ret is None:
-        print("Can not find instance by ip {} in '{}'".
-              format(public_ip, cluster))
-        return
-    inst, ssh_user, ssh_private_key = ret
+@click.option('-w', '--width', type=click.IntRange(min=1),
+              help="Maximum number of hosts to run concurrently.")
+def rcmd(cluster, target, cmd, width):
+    from bilbo.cluster import run_cmd_on_instances
     try:
-        _, _, excode = run_cmd_and_store_result(cluster, ssh_user, ssh_private_key,
-                                                public_ip, cmd)
+        excode = run_cmd_on_instances(cluster, target, cmd, width)
     except KeyboardInterrupt:
         excode = CTRL_C_EXCODE
     return sys.exit(excode)
 
 
+@main.command(help="Push changed local files to cluster instances.")
+@click.argument('CLUSTER')
+@click.argument('LOCAL_PATH')
+@click.argument('REMOTE_DIR', required=False)
+@click.option('-t', '--target', default='notebook', show_default=True,
+              help="Instances to push to. Same selector as rcmd TARGET.")
+@click.option('-w', '--width', type=click.IntRange(min=1),
+              help="Number of concurrent file transfers per instance.")
+def push(cluster, local_path, remote_dir, target, width):
+    """로컬 파일을 원격 인스턴스로 동기화."""
+    from bilbo.cluster import push_to_cluster
+    push_to_cluster(cluster, local_path, remote_dir, target, width)
+
+
+@main.command(help="Broadcast a file to cluster instances. Uploads once to "
+              "the scheduler, which relays it over the private network.")
+@click.argument('CLUSTER')
+@click.argument('FILE')
+@click.argument('REMOTE_DIR', required=False)
+@click.option('-t', '--target', default='workers', show_default=True,
+              help="Instances to receive. Same selector as rcmd TARGET.")
+def broadcast(cluster, file, remote_dir, target):
+    """파일을 여러 인스턴스에 배포."""
+    from bilbo.cluster import broadcast_to_cluster
+    broadcast_to_cluster(cluster, file, remote_dir, target)
+
+
+@main.command(help="Pull changed remote files from a cluster instance.")
+@click.argument('CLUSTER')
+@click.argument('REMOTE_PATH')
+@click.argument('LOCAL_DIR', default='.')
+@click.option('-t', '--target', default='notebook', show_default=True,
+              help="Instance to pull from. Same selector as rcmd TARGET.")
+@click.option('-w', '--width', type=click.IntRange(min=1),
+              help="Number of concurrent file transfers.")
+def pull(cluster, remote_path, local_dir, target, width):
+    """원격 인스턴스의 파일을 로컬로 동기화."""
+    from bilbo.cluster import pull_from_cluster
+    pull_from_cluster(cluster, remote_path, local_dir, target, width)
+
+
+@main.command(help="Show remote command history of a cluster.")
+@click.argument('CLUSTER')
+@click.option('-H', '--host', help="Show history of this instance IP only.")
+@click.option('-f', '--failed', is_flag=True,
+              help="Show failed commands only.")
+@click.option('-n', '--last', type=int, help="Show last N commands only.")
+@click.option('--since', 'minutes', type=float, metavar='MINUTES',
+              help="Show commands started in the last MINUTES only.")
+@click.option('-s', '--summary', is_flag=True, help="Show count, failures and "
+              "p50/p95/max duration per host.")
+@click.option('-j', '--json', 'as_json', is_flag=True,
+              help="Print history as JSON.")
+def history(cluster, host, failed, last, minutes, summary, as_json):
+    """원격 명령 기록 표시."""
+    from bilbo.state import show_history
+    show_history(cluster, host, failed, last, summary, as_json, minutes)
+
+
 @main.command(help="Open dashboard.")
 @click.argument('CLUSTER')
 @click.option('-u', '--url-only', is_flag=True, help="Show URL only.")
 def dashboard(cluster, url_only):
+    from bilbo.cluster import open_dashboard
     open_dashboard(cluster, url_only)
 
 
@@ -158,6 +284,7 @@ def dashboard(cluster, url_only):
 @click.argument('CLUSTER')
 @click.option('-u', '--url-only', is_flag=True, help="Show URL only.")
 def notebook(cluster, url_only):
+    from bilbo.cluster import open_notebook
     open_notebook(cluster, url_only)
 
 
@@ -169,6 +296,8 @@ def notebook(cluster, url_only):
 @click.option('-r', '--restart', '_restart_after', is_flag=True,
               help="Restart cluster when after running.")
 def run(cluster, file, param, _restart_after):
+    from bilbo.cluster import run_notebook_or_python, \
+        stop_notebook_or_python
     try:
         _, excode = run_notebook_or_python(cluster, file, param)
     except KeyboardInterrupt:
@@ -1,39 +1,56 @@
 """클러스터 모듈."""
 import os
-from os.path import expanduser
 import re
+import sys
+import glob
 import json
+import shlex
+import math
 import datetime
 import warnings
 import time
-import select
 import webbrowser
 import tempfile
-import logging
+import threading
+import subprocess
+from functools import partial
 from urllib.request import urlopen
+from urllib.parse import urlsplit, urlunsplit
 from urllib.error import HTTPError, URLError
 from socket import timeout
 from secrets import token_urlsafe
 
 import botocore
-import boto3
-import paramiko
 
-from bilbo.profile import read_profile
-from bilbo.util import critical, warning, error, clust_dir, iter_clusters, \
-    info, get_aws_config, PARAM_PTRN, pprint, RCMD_DONE_FILE
+from bilbo.profile import read_profile, load_resolved_profile, \
+    save_resolved_profile
+from bilbo.ssh import open_channel, read_channel, get_pool, CmdStream, \
+    STDOUT, CONNECT_TIMEOUT
+from bilbo.parallel import run_parallel, parallel_options
+from bilbo.aws import get_client, get_resource, aws_options
+from bilbo.sync import push_files, pull_files, broadcast_file, \
+    DEFAULT_WIDTH as SYNC_WIDTH
+from bilbo.bootstrap import run_bootstrap, service_cmd, wait_service, \
+    JUPYTER_URL_PTRN, SCHEDULER_PTRN, WORKER_PTRN, SERVICE_TIMEOUT
+from bilbo.hostfacts import get_host_facts, cached_host_facts
+from bilbo.catalog import get_instance_type_info, type_facts
+from bilbo.state import cluster_info_exists, save_cluster_info, \
+    load_cluster_info, show_all_cluster, check_cluster, show_cluster, \
+    check_dup_cluster, get_dask_scheduler_address, remove_cluster_info, \
+    record_command, update_cluster_info, modify_cluster_field
+from bilbo.util import critical, warning, error, info, \
+    get_aws_config, PARAM_PTRN, log_dir, check_dirs, backoff_wait
 
 warnings.filterwarnings("ignore")
-logging.getLogger("paramiko").setLevel(logging.WARNING)
+check_dirs()
 
 NB_WORKDIR = "~/works"
-TRY_SLEEP = 10
-
-
-def cluster_info_exists(clname):
-    """클러스터 정보가 존재하는가?"""
-    path = os.path.join(clust_dir, clname + '.json')
-    return os.path.isfile(path)
+READY_TIMEOUT = 600
+DESCRIBE_CHUNK = 200
+# Fleet 으로 모자란 워커를 다시 요청할 최대 시간 (초)
+FLEET_FILL_TIMEOUT = 1800
+# 클러스터와 호스트별로 남길 원격 명령 로그 수
+CMD_LOG_KEEP = 20
 
 
 def _build_tag_spec(name, desc, _tags):
@@ -74,6 +91,84 @@ def create_ec2_instances(ec2, tpl, cnt, tag_spec):
             raise e
 
 
+def create_fleet_instances(ec2, tpl, cnt, tag_spec):
+    """EC2 Fleet 으로 여러 인스턴스 타입과 서브넷 중 가능한 용량으로 생성.
+
+    `fleet.ec2types` 의 순서대로 우선하며, 요청한 수에 못 미쳐도
+    `fleet.min_count` 이상이면 받아들인다.
+
+    Args:
+        ec2 (boto3.resources.base.ServiceResource): boto EC2 리소스
+        tpl (dict): 인스턴스 템플릿
+        cnt (int): 요청할 인스턴스 수
+        tag_spec (list): 태그 명세
+
+    Returns:
+        list: 생성된 인스턴스 리스트. cnt 보다 적을 수 있다
+
+    Raises:
+        RuntimeError: 생성된 인스턴스가 최소 수보다 적을 때
+    """
+    fleet = tpl['fleet']
+    ec2types = fleet.get('ec2types', [tpl['ec2type']])
+    subnets = fleet.get('subnets', [None])
+    min_cnt = min(fleet.get('min_count', cnt), cnt)
+    client = ec2.meta.client
+
+    ltdata = {'ImageId': tpl['ami'],
+              'KeyName': tpl['keyname'],
+              'SecurityGroupIds': [tpl['security_group']],
+              'BlockDeviceMappings': get_root_dm(ec2, tpl),
+              'TagSpecifications': tag_spec}
+    res = client.create_launch_template(
+        LaunchTemplateName='bilbo-{}'.format(token_urlsafe(8)),
+        LaunchTemplateData=ltdata)
+    ltid = res['LaunchTemplate']['LaunchTemplateId']
+    overrides = []
+    for prio, ec2type in enumerate(ec2types):
+        for subnet in subnets:
+            override = {'InstanceType': ec2type, 'Priority': float(prio)}
+            if subnet is not None:
+                override['SubnetId'] = subnet
+            overrides.append(override)
+    info("create_fleet_instances: {} of {}".format(cnt, ec2types))
+    try:
+        res = client.create_fleet(
+            Type='instant',
+            LaunchTemplateConfigs=[{
+                'LaunchTemplateSpecification': {
+                    'LaunchTemplateId': ltid, 'Version': '$Latest'},
+                'Overrides': overrides}],
+            TargetCapacitySpecification={
+                'TotalTargetCapacity': cnt,
+                'DefaultTargetCapacityType': 'on-demand'},
+            OnDemandOptions={'AllocationStrategy': 'prioritized'})
+    finally:
+        # instant 타입 Fleet 은 요청 후에 시작 템플릿이 필요 없음
+        client.delete_launch_template(LaunchTemplateId=ltid)
+
+    for err in res.get('Errors', []):
+        over = err.get('LaunchTemplateAndOverrides', {}).get('Overrides', {})
+        warning("Fleet {} {}: {}".format(over.get('InstanceType'),
+                                         over.get('SubnetId'),
+                                         err.get('ErrorCode')))
+    inst_ids = []
+    for launched in res.get('Instances', []):
+        inst_ids += launched['InstanceIds']
+        warning("Fleet launched {} x {}.".format(
+            len(launched['InstanceIds']), launched['InstanceType']))
+
+    if len(inst_ids) < min_cnt:
+        if len(inst_ids) > 0:
+            client.terminate_instances(InstanceIds=inst_ids)
+        codes = sorted(set(err.get('ErrorCode')
+                           for err in res.get('Errors', [])))
+        raise RuntimeError("Fleet launched {} of {} instances, less than "
+                           "minimum {}: {}".format(len(inst_ids), cnt,
+                                                  min_cnt, codes))
+    return [ec2.Instance(iid) for iid in inst_ids]
+
+
 def get_type_instance_info(pobj, only_inst=None):
     """인스턴스 종류별 공통 정보."""
     info = {}
@@ -107,51 +202,156 @@ def create_inst(ec2, tpl, role, clname, prefix):
     tags = tpl.get('tags')
     tag_spec = _build_tag_spec(name, desc, tags)
     cnt = tpl['count'] if 'count' in tpl else 1
+    if 'fleet' in tpl:
+        return create_fleet_instances(ec2, tpl, cnt, tag_spec)
     ins = create_ec2_instances(ec2, tpl, cnt, tag_spec)
     return ins
 
 
-def instance_info(inst):
-    """실행 인스턴스 정보."""
+def instance_info(desc):
+    """실행 인스턴스 정보.
+
+    Args:
+        desc (dict): DescribeInstances 의 인스턴스 항목
+    """
     info = {}
-    info['instance_id'] = inst.instance_id
-    info['public_ip'] = inst.public_ip_address
-    info['private_ip'] = inst.private_ip_address
-    info['private_dns_name'] = inst.private_dns_name
+    info['instance_id'] = desc['InstanceId']
+    info['public_ip'] = desc.get('PublicIpAddress')
+    info['private_ip'] = desc.get('PrivateIpAddress')
+    info['private_dns_name'] = desc.get('PrivateDnsName')
+    info['ec2type'] = desc.get('InstanceType')
+    if 'running_secs' in desc:
+        info['running_secs'] = desc['running_secs']
     return info
 
 
-def _wait_until_running(inst):
-    info(f"_wait_until_running: {inst}")
-    try:
-        inst.wait_until_running()
-        inst.load()
-    except Exception as e:
-        error(str(e))
-        raise e
-    return inst
+def _iter_describe_instances(client, inst_ids):
+    """여러 인스턴스 상태를 페이지 단위로 조회."""
+    paginator = client.get_paginator('describe_instances')
+    # 필터 값 개수 제한 때문에 나눠서 요청
+    for i in range(0, len(inst_ids), DESCRIBE_CHUNK):
+        ids = inst_ids[i:i + DESCRIBE_CHUNK]
+        filters = [{'Name': 'instance-id', 'Values': ids}]
+        for page in paginator.paginate(Filters=filters):
+            for reserv in page['Reservations']:
+                for inst in reserv['Instances']:
+                    yield inst
+
+
+def wait_instances_running(client, inst_ids, on_ready=None, delay=5,
+                           max_attempts=120):
+    """여러 인스턴스가 running 상태가 될 때까지 한 번에 폴링하며 기다림.
 
+    Args:
+        client (botocore.client.EC2): boto EC2 client
+        inst_ids (list): 인스턴스 ID 리스트
+        on_ready (callable): 인스턴스가 준비되는 즉시 호출될 함수.
+            DescribeInstances 의 인스턴스 항목을 인자로 받는다.
+        delay (int): 폴링 간격 (초)
+        max_attempts (int): 최대 폴링 횟수
+
+    Returns:
+        dict: 준비된 순서의 인스턴스 ID => 인스턴스 항목. 각 항목의
+            `running_secs` 에 시작부터 running 상태가 될 때까지 걸린 시간을
+            기록
 
-def create_notebook(ec2, clinfo):
-    """노트북 생성."""
+    Raises:
+        TimeoutError: 최대 폴링 횟수를 넘을 때
+        RuntimeError: 인스턴스가 종료되었을 때
+    """
+    info("wait_instances_running: {}".format(inst_ids))
+    pending = set(inst_ids)
+    readies = {}
+    for i in range(max_attempts):
+        try:
+            descs = list(_iter_describe_instances(client, list(pending)))
+        except botocore.exceptions.ClientError as e:
+            # 생성 직후에는 아직 조회되지 않을 수 있음
+            if 'InvalidInstanceID.NotFound' not in str(e):
+                raise
+            descs = []
+
+        for desc in descs:
+            iid = desc['InstanceId']
+            state = desc['State']['Name']
+            if state in ('shutting-down', 'terminated'):
+                raise RuntimeError("Instance {} is {}.".format(iid, state))
+            if state != 'running' or iid not in pending:
+                continue
+            now = datetime.datetime.now(datetime.timezone.utc)
+            elapsed = (now - desc['LaunchTime']).total_seconds()
+            desc['running_secs'] = round(elapsed, 1)
+            info("Instance {} is running ({:.1f} secs after launch).".
+                 format(iid, elapsed))
+            pending.discard(iid)
+            readies[iid] = desc
+            if on_ready is not None:
+                on_ready(desc)
+
+        if len(pending) == 0:
+            return readies
+        time.sleep(delay)
+
+    raise TimeoutError("Instances are not running: {}".format(pending))
+
+
+def connect_on_ready(clinfo, roles):
+    """인스턴스가 running 이 되는 즉시 백그라운드로 SSH 연결을 맺는 함수.
+
+    맺은 연결은 풀에 남아, 이후 부트스트랩이 다른 인스턴스를 기다리지 않고
+    바로 쓴다. 릴레이 모드에서는 워커 경로가 모든 인스턴스가 뜬 뒤에야
+    등록되기에 쓰지 않는다.
+
+    Args:
+        clinfo (dict): 클러스터 정보
+        roles (dict): 인스턴스 ID => 역할
+
+    Returns:
+        callable: wait_instances_running 의 on_ready 함수. 릴레이 모드이면
+            None
+    """
+    if clinfo['profile'].get('relay'):
+        return None
+    private_command = clinfo['profile'].get('private_command')
+    pool = get_pool()
+
+    def _on_ready(desc):
+        tpl = clinfo['template'].get(roles.get(desc['InstanceId']))
+        ip = _get_ip(instance_info(desc), private_command)
+        if tpl is None or ip is None:
+            return
+        args = (tpl['ssh_user'], tpl['ssh_private_key'], ip)
+        threading.Thread(target=pool.get, args=args, daemon=True).start()
+
+    return _on_ready
+
+
+def create_notebook(ec2, clinfo, launched):
+    """노트북 인스턴스 생성 요청.
+
+    Args:
+        ec2 (botocore.client.EC2): boto EC2 client
+        clinfo (dict): 클러스터 정보
+        launched (dict): 역할 => 생성 요청된 인스턴스 리스트. 생성되는 대로
+            추가하고 저장한다.
+    """
     critical("Create notebook.")
     clname = clinfo['name']
     prefix = clinfo['profile'].get('instance_prefix')
     tpl = clinfo['template']
     nb = create_inst(ec2, tpl, 'notebook', clname, prefix)[0]
-
-    info("Wait for notebook instance to be running.")
-    nb = _wait_until_running(nb)
-    clinfo['instance']['notebook'] = instance_info(nb)
-    save_cluster_info(clinfo)
+    launched['notebook'] = [nb]
+    _record_launched(clinfo, launched)
 
 
-def create_dask_cluster(ec2, clinfo):
-    """Dask 클러스터 생성.
+def create_dask_cluster(ec2, clinfo, launched):
+    """Dask 클러스터 인스턴스 생성 요청.
 
     Args:
         ec2 (botocore.client.EC2): boto EC2 client
         clinfo (dict): 클러스터 정보
+        launched (dict): 역할 => 생성 요청된 인스턴스 리스트. 생성되는 대로
+            추가하고 저장한다.
     """
     clname = clinfo['name']
     prefix = clinfo['profile'].get('instance_prefix')
@@ -160,85 +360,119 @@ def create_dask_cluster(ec2, clinfo):
 
     # 스케쥴러/워커 생성
     tpl = clinfo['template']
-    scd = create_inst(ec2, tpl, 'scheduler', clname, prefix)[0]
+    launched['scheduler'] = [create_inst(ec2, tpl, 'scheduler', clname,
+                                         prefix)[0]]
+    launched['worker'] = []
+    _record_launched(clinfo, launched)
     wrks = create_inst(ec2, tpl, 'worker', clname, prefix)
-    winsts = clinfo['instance']['workers'] = []
+    launched['worker'] = wrks
+    # Fleet 으로 일부만 생성되었으면 나머지는 클러스터 시작 후 채움
+    pending = tpl['worker'].get('count', 1) - len(wrks)
+    if pending > 0:
+        warning("{} workers are pending.".format(pending))
+        clinfo['fleet_pending'] = pending
+    _record_launched(clinfo, launched)
+
+
+def _set_cluster_instances(clinfo, launched, readies=None):
+    """역할별 인스턴스 정보를 클러스터 정보에 기록.
+
+    readies 가 없으면 인스턴스 ID 만 기록한다 (제거를 위한 중간 저장용).
+    """
+    def _info(inst):
+        iid = inst.instance_id
+        if readies is None:
+            return {'instance_id': iid}
+        return instance_info(readies[iid])
+
+    insts = clinfo['instance']
+    for role, rinsts in launched.items():
+        if role == 'worker':
+            insts['workers'] = [_info(inst) for inst in rinsts]
+        else:
+            insts[role] = _info(rinsts[0])
+
+
+def _record_launched(clinfo, launched):
+    """생성 요청된 인스턴스 ID 를 바로 저장.
+
+    이후 다른 역할의 생성이 실패해도 destroy 로 제거할 수 있게 한다.
+    """
+    _set_cluster_instances(clinfo, launched)
+    clinfo['state'] = 'launching'
+    save_cluster_info(clinfo)
+
+
+def wait_cluster_running(ec2, clinfo, launched):
+    """생성 요청된 모든 역할의 인스턴스를 함께 기다린 후 정보 기록."""
+    roles = {}
+    for role, rinsts in launched.items():
+        roles.update((inst.instance_id, role) for inst in rinsts)
+    inst_ids = list(roles)
 
     # 사용 가능 상태까지 기다린 후 추가 정보 얻기.
     info("Wait for instance to be running.")
-    scd = _wait_until_running(scd)
-    clinfo['instance']['scheduler'] = instance_info(scd)
-    for wrk in wrks:
-        wrk = _wait_until_running(wrk)
-        winsts.append(instance_info(wrk))
-
+    readies = wait_instances_running(ec2.meta.client, inst_ids,
+                                     connect_on_ready(clinfo, roles))
+    _set_cluster_instances(clinfo, launched, readies)
     save_cluster_info(clinfo)
 
-    # ec2 생성 후 반환값의 `ncpu_options` 가 잘못오고 있어 여기서 요청.
-    if len(wrks) > 0:
-        # 첫 번째 워커의 ip
-        wip = _get_ip(winsts[0], clinfo['profile'].get('private_command'))
-        tpl['worker']['cpu_info'] = get_cpu_info(tpl['worker'], wip)
-
-
-def get_cpu_info(tpl, ip):
-    """생성된 인스턴스에서 lscpu 명령으로 CPU 정보 얻기."""
-    info("get_cpu_info")
-    user = tpl['ssh_user']
-    private_key = tpl['ssh_private_key']
-    # Cores
-    cmd = "lscpu | grep -e ^CPU\(s\): | awk '{print $2}'"
-    res, _ = send_instance_cmd(user, private_key, ip, cmd)
-    num_core = int(res[0])
-    # Threads per core
-    cmd = "lscpu | grep Thread | awk '{print $4}'"
-    res, _ = send_instance_cmd(user, private_key, ip, cmd)
-    threads_per_core = int(res[0])
-    cpu_info = {'CoreCount': num_core, 'ThreadsPerCore': threads_per_core}
-    return cpu_info
-
-
-def save_cluster_info(clinfo):
-    """클러스터 정보파일 쓰기."""
-    clname = clinfo['name']
 
-    def json_default(value):
-        if isinstance(value, datetime.date):
-            return value.strftime('%Y-%m-%d %H:%M:%S')
-        raise TypeError('not JSON serializable')
+def fetch_scheduler_identity(dash_url):
+    """Dask 스케쥴러의 HTTP JSON 엔드포인트에서 스케쥴러 정보 얻기."""
+    with urlopen(dash_url + '/json/identity.json', timeout=8) as res:
+        return json.loads(res.read().decode('utf-8'))
 
-    warning("save_cluster_info: '{}'".format(clname))
-    clinfo['saved_time'] = str(datetime.datetime.now())
 
-    path = os.path.join(clust_dir, clname + '.json')
-    with open(path, 'wt') as f:
-        body = json.dumps(clinfo, default=json_default, indent=4,
-                          sort_keys=True, ensure_ascii=False)
-        f.write(body)
+def wait_dask_ready(dash_url, nworker, nthread, quorum=1.0,
+                    max_wait=READY_TIMEOUT, fetch=fetch_scheduler_identity):
+    """기대한 수의 Dask 워커와 쓰레드가 스케쥴러에 등록될 때까지 기다림.
 
+    스케쥴러의 JSON 엔드포인트를 지수 백오프와 지터로 폴링한다.
 
-def load_cluster_info(clname):
-    """클러스터 정보파일 읽기."""
-    warning("load_cluster_info: '{}'".format(clname))
-    path = os.path.join(clust_dir, clname + '.json')
-    with open(path, 'rt') as f:
-        body = f.read()
-        clinfo = json.loads(body)
-    return clinfo
+    Args:
+        dash_url (str): 스케쥴러 대쉬보드 URL
+        nworker (int): 기대하는 워커 프로세스 수
+        nthread (int): 기대하는 전체 쓰레드 수
+        quorum (float): 기대하는 수 중 이 비율만큼 등록되면 준비된 것으로 봄
+        max_wait (int): 최대 대기 시간 (초)
+        fetch (callable): 스케쥴러 정보를 얻는 함수
 
+    Returns:
+        dict: 워커 주소 => 등록까지 걸린 시간 (초)
 
-def wait_until_connect(url, retry_count=60):
-    """URL 접속이 가능할 때까지 기다림."""
-    info("wait_until_connect: {}".format(url))
-    for i in range(retry_count):
+    Raises:
+        TimeoutError: 최대 대기 시간 안에 준비되지 않을 때
+    """
+    info("wait_dask_ready: {} workers, {} threads, quorum {}".
+         format(nworker, nthread, quorum))
+    need_worker = max(1, math.ceil(nworker * quorum))
+    need_thread = math.ceil(nthread * quorum)
+    st = time.time()
+    joined = {}
+    cur_worker = cur_thread = 0
+    for _ in backoff_wait(st + max_wait):
         try:
-            urlopen(url, timeout=8)
-            return
-        except (HTTPError, URLError, timeout):
-            info("Can not connect to dashboard. Wait for a while.")
-            time.sleep(TRY_SLEEP)
-
-    raise ConnectionError()
+            workers = fetch(dash_url).get('workers', {})
+        except (HTTPError, URLError, timeout, ConnectionError,
+                ValueError) as e:
+            info("Can not get scheduler info: {}".format(e))
+            continue
+
+        for addr in workers:
+            if addr not in joined:
+                joined[addr] = round(time.time() - st, 1)
+                warning("Worker {} joined after {}s ({}/{}).".format(
+                    addr, joined[addr], len(joined), nworker))
+        cur_worker = len(workers)
+        cur_thread = sum(w.get('nthreads', w.get('ncores', 0))
+                         for w in workers.values())
+        if cur_worker >= need_worker and cur_thread >= need_thread:
+            return joined
+
+    raise TimeoutError("Dask cluster is not ready: {}/{} workers, {}/{} "
+                       "threads.".format(cur_worker, nworker, cur_thread,
+                                         nthread))
 
 
 def get_root_dm(ec2, iinfo):
@@ -285,30 +519,28 @@ def create_cluster(profile, clname, params):
 
     check_dup_cluster(clname)
 
-    pro = read_profile(profile, params)
-    ec2 = boto3.resource('ec2')
-
     #
     # 클러스터 정보
-    clinfo = init_clinfo(clname)
-    clinfo['profile'] = pro
-    clinfo = resolve_instances(clinfo)
+    clinfo = resolve_profile(profile, clname, params)
+    pro = clinfo['profile']
+    ec2 = get_resource('ec2', **aws_options(clinfo))
 
-    # 클러스터 인스턴스 생성
+    # 모든 역할의 인스턴스 생성을 먼저 요청. 실패시 제거할 수 있도록
+    # 생성되는 대로 인스턴스 ID 를 저장
+    launched = {}
     if 'dask' in clinfo['profile']:
-        create_dask_cluster(ec2, clinfo)
-
-    # 노트북 생성
+        create_dask_cluster(ec2, clinfo, launched)
     if 'notebook' in pro:
-        create_notebook(ec2, clinfo)
+        create_notebook(ec2, clinfo, launched)
 
+    # 함께 부팅을 기다림
+    wait_cluster_running(ec2, clinfo, launched)
     return clinfo
 
 
-def pause_instance(inst_ids):
+def pause_instance(inst_ids, ec2):
     """인스턴스 정지."""
     warning("pause_instance: '{}'".format(inst_ids))
-    ec2 = boto3.client('ec2')
 
     # 권한 확인
     try:
@@ -355,7 +587,9 @@ def pause_cluster(clname):
     print("Pause Cluster: {}".format(info['name']))
 
     inst_ids = collect_cluster_instances(info)
-    pause_instance(inst_ids)
+    pause_instance(inst_ids, get_client('ec2', **aws_options(info)))
+    info['state'] = 'paused'
+    update_cluster_info(clname, {'state': 'paused'})
 
 
 def resume_instance(inst_ids, ec2):
@@ -387,47 +621,41 @@ def resume_instance(inst_ids, ec2):
 
 def _update_cluster_info(ec2, clname, inst_ids, clinfo):
     # 정보 갱신 대기
-    while True:
-        ready = True
-        warning("Wait until available.")
-        time.sleep(5)
-        res = ec2.describe_instances(InstanceIds=inst_ids)
-        for inst in res['Reservations'][0]['Instances']:
-            if 'PublicIpAddress' not in inst:
-                ready = False
-                print(inst)
-                break
-        if ready:
-            break
+    warning("Wait until available.")
+    insts = clinfo['instance']
+    roles = {wrk['instance_id']: 'worker' for wrk in insts.get('workers', [])}
+    for role in ('notebook', 'scheduler'):
+        if role in insts:
+            roles[insts[role]['instance_id']] = role
+    readies = wait_instances_running(ec2, inst_ids,
+                                     connect_on_ready(clinfo, roles))
 
     # 바뀐 정보 갱신
-    for reserv in res['Reservations']:
-        inst = reserv['Instances'][0]
-        insts = clinfo['instance']
+    for inst in readies.values():
+        new_ip = inst.get('PublicIpAddress')
         if 'notebook' in insts:
             nb = insts['notebook']
             if nb['instance_id'] == inst['InstanceId']:
-                new_ip = inst['PublicIpAddress']
                 nb['public_ip'] = new_ip
         if 'scheduler' in insts:
             scd = insts['scheduler']
             if scd['instance_id'] == inst['InstanceId']:
-                scd['public_ip'] = inst['PublicIpAddress']
+                scd['public_ip'] = new_ip
         if 'workers' in insts:
             wrks = insts['workers']
             for wrk in wrks:
                 if wrk['instance_id'] == inst['InstanceId']:
-                    wrk['public_ip'] = inst['PublicIpAddress']
+                    wrk['public_ip'] = new_ip
 
-    save_cluster_info(clinfo)
+    update_cluster_info(clname, {'instance': insts})
     return clinfo
 
 
 def resume_cluster(clname):
     """클러스터 재개."""
     check_cluster(clname)
-    ec2 = boto3.client('ec2')
     clinfo = load_cluster_info(clname)
+    ec2 = get_client('ec2', **aws_options(clinfo))
 
     print()
     print("Resume Cluster: {}".format(clinfo['name']))
@@ -439,97 +667,6 @@ def resume_cluster(clname):
     return _update_cluster_info(ec2, clname, inst_ids, clinfo)
 
 
-def show_all_cluster():
-    """모든 클러스터를 표시."""
-    for clname in iter_clusters():
-        clinfo = load_cluster_info(clname)
-        name = clinfo['name']
-        desc = clinfo.get('description')
-        if desc is not None:
-            msg = '{} : {}'.format(name, desc)
-        else:
-            msg = name
-        print(msg)
-
-
-def check_cluster(clname):
-    """프로파일을 확인.
-
-    Args:
-        clname (str): 클러스터명 (.json 확장자 제외)
-    """
-    info(f"check_cluster {clname}")
-    if clname.lower().endswith('.json'):
-        rname = '.'.join(clname.split('.')[0:-1])
-        msg = "Wrong cluster name '{}'. Use '{}' instead.". \
-              format(clname, rname)
-        raise NameError(msg)
-
-    # file existence
-    path = os.path.join(clust_dir, clname + '.json')
-    if not os.path.isfile(path):
-        error("Cluster '{}' does not exist.".format(path))
-        raise(FileNotFoundError(path))
-
-    return path
-
-
-def show_cluster(clname, detail=False):
-    """클러스터 정보를 표시."""
-    warning(f"show_cluster {clname}")
-    check_cluster(clname)
-    if detail:
-        clinfo = load_cluster_info(clname)
-        pprint(clinfo)
-        return
-
-    clinfo = load_cluster_info(clname)
-
-    print()
-    print("Cluster Name: {}".format(clinfo['name']))
-    print("Ready Time: {}".format(clinfo['saved_time']))
-
-    insts = clinfo['instance']
-    idx = 1
-    if 'notebook' in insts:
-        print()
-        print("Notebook:")
-        idx = show_instance(idx, insts['notebook'])
-        print()
-
-    if 'type' in clinfo:
-        cltype = clinfo['type']
-        print("Cluster Type: {}".format(cltype))
-        if cltype == 'dask':
-            show_dask_cluster(idx, clinfo)
-        else:
-            raise NotImplementedError()
-    print()
-
-
-def show_instance(idx, inst):
-    print("  [{}] instance_id: {}, public_ip: {}, private_ip: {}".
-          format(idx, inst['instance_id'], inst['public_ip'],
-                 inst['private_ip']))
-    return idx + 1
-
-
-def show_dask_cluster(idx, clinfo):
-    """Dask 클러스터 표시."""
-    print()
-    insts = clinfo['instance']
-    print("Scheduler:")
-    scd = insts['scheduler']
-    idx = show_instance(idx, scd)
-    print("       {}".format(_get_dask_scheduler_address(clinfo)))
-
-    print()
-    print("Workers:")
-    wrks = insts['workers']
-    for wrk in wrks:
-        idx = show_instance(idx, wrk)
-
-
 def check_git_modified(clinfo):
     """로컬 git 저장소 변경 여부.
 
@@ -602,7 +739,7 @@ def destroy_cluster(clname, force):
     critical("Destroy cluster '{}'.".format(clname))
 
     # 인스턴스 제거
-    ec2 = boto3.client('ec2')
+    ec2 = get_client('ec2', **aws_options(clinfo))
     inst_ids = []
     for k, v in clinfo['instance'].items():
         if k == 'workers':
@@ -613,13 +750,12 @@ def destroy_cluster(clname, force):
         ec2.terminate_instances(InstanceIds=inst_ids)
 
     # 클러스터 파일 제거
-    path = os.path.join(clust_dir, clname + '.json')
-    os.unlink(path)
+    remove_cluster_info(clname)
 
 
 def send_instance_cmd(ssh_user, ssh_private_key, ip, cmd,
-                      show_stdout=False, show_stderr=True, retry_count=30,
-                      get_excode=False):
+                      show_stdout=False, show_stderr=True,
+                      timeout=CONNECT_TIMEOUT, get_excode=False):
     """인스턴스에 SSH 명령어 실행
 
     https://stackoverflow.com/questions/42645196/how-to-ssh-and-run-commands-in-ec2-using-boto3
@@ -631,7 +767,7 @@ def send_instance_cmd(ssh_user, ssh_private_key, ip, cmd,
         cmd (list): 커맨드 문자열 리스트
         show_stdout (bool): 표준 출력 메시지 출력 여부
         show_stderr (bool): 에러 메시지 출력 여부
-        retry_count (int): 재시도 횟수
+        timeout (int): 접속 재시도에 허용하는 전체 시간 (초)
         get_excode (bool): exit code 체크 여부. 기본 False
 
     Returns:
@@ -641,55 +777,22 @@ def send_instance_cmd(ssh_user, ssh_private_key, ip, cmd,
     info('send_instance_cmd - user: {}, key: {}, ip {}, cmd {}'
          .format(ssh_user, ssh_private_key, ip, cmd))
 
-    key_path = expanduser(ssh_private_key)
-
-    key = paramiko.RSAKey.from_private_key_file(key_path)
-    client = paramiko.SSHClient()
-    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-
-    connected = False
-    for i in range(retry_count):
-        try:
-            client.connect(hostname=ip, username=ssh_user, pkey=key)
-        except (paramiko.ssh_exception.NoValidConnectionsError,
-            TimeoutError, BlockingIOError):
-            warning("Connection failed to '{}'. Retry after a while.".
-                    format(ip))
-            time.sleep(TRY_SLEEP)
-        else:
-            connected = True
-            break
-
-    if not connected:
-        error("Connection failed to '{}'".format(ip))
+    channel = open_channel(ssh_user, ssh_private_key, ip, timeout)
+    if channel is None:
         return
 
     stdouts = []
     stderrs = []
-    done_file = '/tmp/bilbo_rcmd_done'
-    if get_excode:
-        # embed exit code file
-        cmd = f"rm -f {done_file} && " + cmd + f" ; echo $? > {done_file}"
+
+    def _on_stdout(text):
+        stdouts.append(text)
+        if show_stdout:
+            print(text, end="", flush=True)
 
     # 인터랙티브 모드
-    transport = client.get_transport()
-    transport.set_keepalive(60)
-    channel = transport.open_session()
     channel.exec_command(cmd)
-    while True:
-        time.sleep(0.1)
-        if channel.recv_ready():
-            recv = channel.recv(4096).decode('utf-8')
-            stdouts.append(recv)
-            if show_stdout:
-                print(recv, end="")
-
-        if channel.recv_stderr_ready():
-            recv = channel.recv_stderr(4096).decode('utf-8')
-            stderrs.append(recv)
-
-        if channel.exit_status_ready():
-            break
+    excode = read_channel(channel, _on_stdout, stderrs.append)
+    channel.close()
 
     stdouts = ''.join(stdouts).split('\n')
     stderr = ''.join(stderrs)
@@ -697,61 +800,372 @@ def send_instance_cmd(ssh_user, ssh_private_key, ip, cmd,
     if show_stderr and len(stderr) > 0:
         error(stderr)
 
-    client.close()
-
     if get_excode:
-        ccmd = f'if [ -f {done_file} ]; then cat {done_file}; fi'
-        out, _= send_instance_cmd(ssh_user, ssh_private_key, ip, ccmd)
-        try:
-            excode = int(out[0])
-        except ValueError:
-            excode = -1
         return stdouts, stderr, excode
     else:
         return stdouts, stderr
 
 
-def find_cluster_instance_by_public_ip(clname, public_ip):
-    """Public IP로 클러스터 인스턴스 정보 찾기."""
-    check_cluster(clname)
-    clinfo = load_cluster_info(clname)
+def stream_instance_cmd(ssh_user, ssh_private_key, ip, cmd, log_path=None,
+                        timeout=CONNECT_TIMEOUT):
+    """인스턴스에 SSH 명령을 실행하고 출력을 줄 단위로 흘려받음.
+
+    Args:
+        ssh_user (str): SSH 유저
+        ssh_private_key (str): SSH Private Key 경로
+        ip (str): 대상 인스턴스의 IP
+        cmd (str): 커맨드 문자열
+        log_path (str): 전체 출력을 기록할 로그 파일 경로. 기본 None
+        timeout (int): 접속 재시도에 허용하는 전체 시간 (초)
+
+    Returns:
+        CmdStream: 순회하면 (stream, line) 을 생성하는 스트림. 순회가 끝나면
+            excode, tail_out, tail_err 를 얻을 수 있다.
+    """
+    info('stream_instance_cmd - user: {}, key: {}, ip {}, cmd {}'
+         .format(ssh_user, ssh_private_key, ip, cmd))
+
+    channel = open_channel(ssh_user, ssh_private_key, ip, timeout)
+    if channel is None:
+        raise ConnectionError("Connection failed to '{}'".format(ip))
+    channel.exec_command(cmd)
+    return CmdStream(channel, log_path)
+
+
+def cmd_log_path(clname, ip):
+    """원격 명령의 전체 출력을 남길 로그 파일 경로."""
+    stamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+    fname = '{}_{}_{}.log'.format(clname, ip, stamp)
+    return os.path.join(log_dir, fname)
 
-    def _res(inst, role):
-        tpl = clinfo['template']
-        ssh_user = tpl[role]['ssh_user']
-        ssh_private_key = tpl[role]['ssh_private_key']
-        return inst, ssh_user, ssh_private_key
 
+def prune_cmd_logs(clname, ip, keep=CMD_LOG_KEEP):
+    """클러스터와 호스트별로 최근 keep 개의 원격 명령 로그만 남김.
+
+    Returns:
+        list: 지운 로그 파일 경로 리스트
+    """
+    ptrn = os.path.join(glob.escape(log_dir), '{}_{}_*.log'.format(
+        glob.escape(clname), glob.escape(ip)))
+    # 파일명의 시간 순서로 정렬
+    paths = sorted(glob.glob(ptrn))
+    removed = paths[:max(0, len(paths) - keep)]
+    for path in removed:
+        try:
+            os.unlink(path)
+        except OSError as e:
+            warning("Can not remove old log '{}': {}".format(path, e))
+    return removed
+
+
+def cluster_hosts(clinfo):
+    """클러스터 인스턴스를 `desc` 에 표시되는 순서로 얻기.
+
+    Returns:
+        list: (인스턴스 정보, 역할) 리스트. 역할은 템플릿 키
+            (notebook, scheduler, worker)
+    """
     insts = clinfo['instance']
+    hosts = []
     if 'notebook' in insts:
-        if insts['notebook']['public_ip'] == public_ip:
-            return _res(insts['notebook'], 'notebook')
+        hosts.append((insts['notebook'], 'notebook'))
+    if clinfo.get('type') == 'dask':
+        hosts.append((insts['scheduler'], 'scheduler'))
+        for wrk in insts['workers']:
+            hosts.append((wrk, 'worker'))
+    elif 'type' in clinfo:
+        raise NotImplementedError()
+    return hosts
 
-    if clinfo['type'] == 'dask':
-        scd = insts['scheduler']
-        if scd['public_ip'] == public_ip:
-            return _res(scd, 'scheduler')
-        wrks = insts['workers']
-        for wrk in wrks:
-            if wrk['public_ip'] == public_ip:
-                return _res(wrk, 'worker')
+
+def _parse_index_range(token, cnt):
+    """'3' 또는 '2-5' 형식의 1 부터 시작하는 인덱스 범위 해석."""
+    if '-' in token:
+        first, last = token.split('-', 1)
+        first = int(first) if first else 1
+        last = int(last) if last else cnt
     else:
-        raise NotImplementedError()
+        first = last = int(token)
+    if first < 1 or last > cnt or first > last:
+        raise RuntimeError("Wrong index range '{}' (1 - {}).".
+                           format(token, cnt))
+    return range(first - 1, last)
+
+
+def select_instances(clinfo, selector):
+    """선택자로 클러스터 인스턴스 고르기.
+
+    선택자는 쉼표로 구분된 다음 항목의 조합이다.
+        all, workers, scheduler, notebook: 역할별 인스턴스
+        3, 2-5, 4-: `desc` 에 표시되는 인스턴스 번호 또는 범위
+        i-0123..: 인스턴스 ID
+        13.124.174.197: Public 또는 Private IP
+
+    Args:
+        clinfo (dict): 클러스터 정보
+        selector (str): 선택자
+
+    Returns:
+        list: (인스턴스 정보, 역할) 리스트. `desc` 순서로 정렬되고 중복 없음
+
+    Raises:
+        RuntimeError: 선택자에 맞는 인스턴스가 없을 때
+    """
+    hosts = cluster_hosts(clinfo)
+    # 인스턴스 ID 와 IP 로 바로 찾기 위한 맵
+    addr_map = {}
+    for i, (inst, _) in enumerate(hosts):
+        for key in ('instance_id', 'public_ip', 'private_ip'):
+            if inst.get(key) is not None:
+                addr_map[inst[key]] = i
+
+    roles = {'notebook': 'notebook', 'scheduler': 'scheduler',
+             'workers': 'worker', 'worker': 'worker'}
+    selected = set()
+    for token in selector.split(','):
+        token = token.strip()
+        if token == 'all':
+            selected.update(range(len(hosts)))
+        elif token in roles:
+            found = [i for i, (_, role) in enumerate(hosts)
+                     if role == roles[token]]
+            if len(found) == 0:
+                raise RuntimeError("There is no {} in the cluster.".
+                                   format(token))
+            selected.update(found)
+        elif token in addr_map:
+            selected.add(addr_map[token])
+        elif re.match(r'^\d*-?\d*$', token) and token not in ('', '-'):
+            selected.update(_parse_index_range(token, len(hosts)))
+        else:
+            raise RuntimeError("Can not find instance by '{}' in '{}'.".
+                               format(token, clinfo['name']))
+    return [hosts[i] for i in sorted(selected)]
 
 
-def dask_worker_options(wtpl, memory):
-    """Dask 클러스터 워커 인스턴스 정보에서 워커 옵션 구하기."""
-    co = wtpl['cpu_info']
-    nproc = wtpl.get('nproc', co['CoreCount'])
-    nthread = wtpl.get('nthread', co['ThreadsPerCore'])
-    return nproc, nthread, memory // nproc
+def _rcmd_status(res):
+    if res['error'] is not None:
+        return 'ERROR'
+    return 'exit {}'.format(res['result'][2])
 
 
-def start_cluster(clinfo):
-    """클러스터 마스터 & 워커를 시작."""
+def run_cmd_on_instances(clname, selector, cmd, width=None):
+    """선택한 인스턴스들에 원격 명령을 동시에 실행.
+
+    여러 인스턴스를 선택하면 출력 줄마다 `[IP]` 접두어를 붙여 표시하고,
+    마지막에 호스트별 exit code 요약을 표시한다.
+
+    Args:
+        clname (str): 클러스터명
+        selector (str): 인스턴스 선택자. `select_instances` 참고
+        cmd (str): 커맨드 문자열
+        width (int): 최대 동시 실행 수. None 이면 프로파일 설정
+
+    Returns:
+        int: 모든 호스트가 성공하면 0, 아니면 가장 큰 exit code.
+            접속 실패는 255
+    """
+    check_cluster(clname)
+    clinfo = load_cluster_info(clname)
+    hosts = select_instances(clinfo, selector)
+    tpl = clinfo['template']
+
+    if len(hosts) == 1:
+        inst, role = hosts[0]
+        rtpl = tpl[role]
+        _, _, excode = run_cmd_and_store_result(
+            clname, rtpl['ssh_user'], rtpl['ssh_private_key'],
+            _cmd_ip(clinfo, inst, role), cmd)
+        return excode
+
+    jobs = []
+    for inst, role in hosts:
+        rtpl = tpl[role]
+        ip = _cmd_ip(clinfo, inst, role)
+        func = partial(run_cmd_and_store_result, prefix='[{}] '.format(ip))
+        args = (clname, rtpl['ssh_user'], rtpl['ssh_private_key'], ip, cmd)
+        jobs.append((ip, func, args))
+    if width is None:
+        width, _ = parallel_options(clinfo)
+    results = run_parallel(jobs, width, False, "Command '{}'".format(cmd),
+                           _rcmd_status)
+
+    excodes = [255 if r['error'] is not None else r['result'][2]
+               for r in results.values()]
+    failed = len([c for c in excodes if c != 0])
+    print("{} host(s): {} succeeded, {} failed.".
+          format(len(excodes), len(excodes) - failed, failed))
+    return max(excodes)
+
+
+def _remote_path(path, workdir):
+    """상대 경로는 작업 폴더 기준으로."""
+    if path is None:
+        return workdir
+    if path.startswith('/') or path.startswith('~'):
+        return path
+    return '{}/{}'.format(workdir.rstrip('/'), path)
+
+
+def _show_sync_stat(host, stat):
+    print("{}: {} file(s), {:.1f} MB transferred, {} unchanged.".
+          format(host, stat['files'], stat['bytes'] / 1024 ** 2,
+                 stat['skipped']))
+
+
+def push_to_cluster(clname, local_path, remote=None, target='notebook',
+                    width=None):
+    """로컬 파일 또는 디렉토리를 클러스터 인스턴스들에 동기화.
+
+    바뀐 파일만 압축된 SFTP 연결로 전송하고, 여러 인스턴스를 선택하면
+    인스턴스별로 동시에 전송한다.
+
+    Args:
+        clname (str): 클러스터명
+        local_path (str): 로컬 파일 또는 디렉토리
+        remote (str): 원격 디렉토리. 상대 경로는 작업 폴더 기준이며, None
+            이면 작업 폴더 (기본 ~/works)
+        target (str): 인스턴스 선택자. `select_instances` 참고. 인스턴스
+            간 동시 실행 수는 프로파일의 병렬 작업 설정을 따른다
+        width (int): 인스턴스별 동시 전송 수
+    """
+    check_cluster(clname)
+    clinfo = load_cluster_info(clname)
+    hosts = select_instances(clinfo, target)
+    pwidth, fail_fast = parallel_options(clinfo)
+    width = width or SYNC_WIDTH
+
+    jobs = []
+    for inst, role in hosts:
+        rtpl = clinfo['template'][role]
+        ip = _cmd_ip(clinfo, inst, role)
+        rpath = _remote_path(remote, rtpl.get('workdir', NB_WORKDIR))
+        jobs.append((ip, push_files, (rtpl['ssh_user'],
+                                      rtpl['ssh_private_key'], ip,
+                                      local_path, rpath, width)))
+    results = run_parallel(jobs, pwidth, fail_fast, "Push")
+    for host, res in sorted(results.items()):
+        if res['error'] is None:
+            _show_sync_stat(host, res['result'])
+
+
+def _sync_host(clinfo, inst, role, remote=None):
+    """파일 전달용 호스트 정보. 원격 디렉토리는 역할의 작업 폴더 기준."""
+    rtpl = clinfo['template'][role]
+    return dict(addr=_cmd_ip(clinfo, inst, role), user=rtpl['ssh_user'],
+                key=rtpl['ssh_private_key'], private_ip=inst['private_ip'],
+                base=_remote_path(remote, rtpl.get('workdir', NB_WORKDIR)))
+
+
+def broadcast_to_cluster(clname, local_path, remote=None, target='workers'):
+    """같은 파일을 여러 인스턴스에 배포.
+
+    로컬에서는 스케쥴러에 한 번만 올리고, 스케쥴러부터 VPC 내부망으로 파일을
+    가진 인스턴스들이 두 배씩 늘어나는 트리 형태로 전달한다. 인스턴스마다
+    받은 파일의 체크섬을 확인한다.
+
+    Args:
+        clname (str): 클러스터명
+        local_path (str): 로컬 파일
+        remote (str): 원격 디렉토리. 상대 경로는 인스턴스 역할의 작업 폴더
+            기준이며, None 이면 작업 폴더 (기본 ~/works)
+        target (str): 인스턴스 선택자. `select_instances` 참고
+
+    Raises:
+        RuntimeError: 전달에 실패한 인스턴스가 있을 때
+    """
+    check_cluster(clname)
+    clinfo = load_cluster_info(clname)
+    if clinfo.get('type') != 'dask':
+        raise RuntimeError("Broadcast needs a cluster with a scheduler.")
+    scd = clinfo['instance']['scheduler']
+    receivers = [_sync_host(clinfo, inst, role, remote) for inst, role
+                 in select_instances(clinfo, target)
+                 if inst['instance_id'] != scd['instance_id']]
+    root = _sync_host(clinfo, scd, 'scheduler', remote)
+    width, _ = parallel_options(clinfo)
+
+    st = time.time()
+    failed = broadcast_file(root, receivers, local_path, root['base'], width)
+    print("Broadcast to {} instance(s) in {:.2f}s.".
+          format(len(receivers) - len(failed), time.time() - st))
+    if len(failed) > 0:
+        raise RuntimeError("Broadcast failed on: {}".format(
+            ', '.join(failed)))
+
+
+def pull_from_cluster(clname, remote_path, local='.', target='notebook',
+                      width=None):
+    """클러스터 인스턴스의 파일 또는 디렉토리를 로컬로 동기화.
+
+    Args:
+        clname (str): 클러스터명
+        remote_path (str): 원격 파일 또는 디렉토리. 상대 경로는 작업 폴더
+            기준
+        local (str): 로컬 디렉토리
+        target (str): 인스턴스 선택자. 하나의 인스턴스만 선택해야 한다
+        width (int): 동시 전송 수
+    """
+    check_cluster(clname)
+    clinfo = load_cluster_info(clname)
+    hosts = select_instances(clinfo, target)
+    if len(hosts) != 1:
+        raise RuntimeError("Select one instance to pull from, not {}.".
+                           format(len(hosts)))
+    inst, role = hosts[0]
+    rtpl = clinfo['template'][role]
+    ip = _cmd_ip(clinfo, inst, role)
+    width = width or SYNC_WIDTH
+    rpath = _remote_path(remote_path, rtpl.get('workdir', NB_WORKDIR))
+    stat = pull_files(rtpl['ssh_user'], rtpl['ssh_private_key'], ip, rpath,
+                      local, width)
+    _show_sync_stat(ip, stat)
+
+
+def _worker_facts(wtpl, ip=None):
+    """워커 사양 정보 얻기.
+
+    캐쉬된 호스트 사양, 인스턴스 타입 카탈로그 순으로 찾고, 둘 다 없으면
+    ip 의 인스턴스에 접속해 프로브한다.
+    """
+    facts = cached_host_facts(wtpl)
+    if facts is None and wtpl.get('type_info') is not None:
+        facts = type_facts(wtpl['type_info'])
+    if facts is None and ip is not None:
+        facts = get_host_facts(wtpl, ip, send_instance_cmd)
+    return facts
+
+
+def dask_worker_options(wtpl, ip=None):
+    """Dask 클러스터 워커 인스턴스 정보에서 워커 옵션 구하기.
+
+    Args:
+        wtpl (dict): 워커 템플릿
+        ip (str): 사양 정보가 없을 때 프로브할 워커 IP
+
+    Returns:
+        tuple: (프로세스 수, 프로세스당 쓰레드 수, 프로세스당 메모리)
+    """
+    facts = _worker_facts(wtpl, ip)
+    if facts is None:
+        raise RuntimeError("No host facts for '{}'.".format(wtpl['ec2type']))
+    wtpl['cpu_info'] = {'CoreCount': facts['CoreCount'],
+                        'ThreadsPerCore': facts['ThreadsPerCore']}
+    nproc = wtpl.get('nproc', facts['CoreCount'])
+    nthread = wtpl.get('nthread', facts['ThreadsPerCore'])
+    return nproc, nthread, facts['MemTotal'] // nproc
+
+
+def start_cluster(clinfo, init=True):
+    """클러스터 마스터 & 워커를 시작.
+
+    Args:
+        clinfo (dict): 클러스터 정보
+        init (bool): 프로파일의 초기화 명령도 실행할지 여부
+    """
     assert 'type' in clinfo
     if clinfo['type'] == 'dask':
-        start_dask_cluster(clinfo)
+        start_dask_cluster(clinfo, init)
     else:
         raise NotImplementedError()
 
@@ -765,8 +1179,12 @@ def git_clone_cmd(repo, user, passwd, workdir):
     return cmd
 
 
-def setup_aws_creds(user, private_key, ip):
-    """AWS 크레덴셜 설치."""
+def aws_creds_cmd(region=None):
+    """AWS 크레덴셜 설치 명령.
+
+    Args:
+        region (str): 원격 호스트의 기본 리전. None 이면 로컬 AWS 설정의 리전
+    """
     cmds = [
         'mkdir -p ~/.aws',
         'cd ~/.aws',
@@ -775,6 +1193,8 @@ def setup_aws_creds(user, private_key, ip):
     ]
 
     ak, sk, dr = get_aws_config()
+    if region is not None:
+        dr = region
     cmd = 'echo "aws_access_key_id = {}" >> credentials'.format(ak)
     cmds.append(cmd)
     cmd = 'echo "aws_secret_access_key = {}" >> credentials'.format(sk)
@@ -782,13 +1202,30 @@ def setup_aws_creds(user, private_key, ip):
     cmd = 'echo "region = {}" >> config'.format(dr)
     cmds.append(cmd)
 
-    cmd = '; '.join(cmds)
-    send_instance_cmd(user, private_key, ip, cmd)
+    return '; '.join(cmds)
+
+
+def init_steps(rtpl):
+    """역할 템플릿의 초기화 명령들을 부트스트랩 단계로."""
+    return [('init_cmd[{}]'.format(i + 1), cmd)
+            for i, cmd in enumerate(rtpl.get('init_cmd', []))]
 
 
-def _get_dask_scheduler_address(clinfo):
-    dns = clinfo['instance']['scheduler']['private_dns_name']
-    return "DASK_SCHEDULER_ADDRESS=tcp://{}:8786".format(dns)
+def bootstrap_host(clinfo, user, private_key, ip, role, steps):
+    """호스트 부트스트랩을 실행하고 단계별 보고를 클러스터 정보에 기록."""
+    report = run_bootstrap(user, private_key, ip, role, steps,
+                           send_instance_cmd)
+    clinfo.setdefault('bootstrap', {})[ip] = report
+    record_reachable(clinfo, ip)
+    return report
+
+
+def record_reachable(clinfo, ip):
+    """호스트에 처음 SSH 로 접속된 시간을 클러스터 정보에 기록."""
+    ts = get_pool().reachable_at(ip)
+    if ts is not None:
+        stamp = str(datetime.datetime.fromtimestamp(ts))
+        clinfo.setdefault('ssh_reachable', {})[ip] = stamp
 
 
 def _get_ip(inst, private_command):
@@ -796,15 +1233,52 @@ def _get_ip(inst, private_command):
     return inst['private_ip'] if private_command else inst['public_ip']
 
 
-def start_notebook(clinfo, retry_count=60):
+def setup_relay(clinfo):
+    """릴레이 모드이면 워커 접속이 스케쥴러를 거치도록 등록.
+
+    로컬에서는 스케쥴러에만 SSH 연결을 맺고, 워커들에는 그 연결 위의
+    터널로 Private IP 에 접속한다.
+
+    Returns:
+        bool: 릴레이 모드 여부
+    """
+    if not clinfo['profile'].get('relay') or clinfo.get('type') != 'dask':
+        return False
+    stpl = clinfo['template']['scheduler']
+    sip = _get_ip(clinfo['instance']['scheduler'],
+                  clinfo['profile'].get('private_command'))
+    jump = (stpl['ssh_user'], stpl['ssh_private_key'], sip)
+    pool = get_pool()
+    for wrk in clinfo['instance']['workers']:
+        pool.set_route(wrk['private_ip'], jump)
+    return True
+
+
+def _cmd_ip(clinfo, inst, role):
+    """명령을 내릴 인스턴스 IP.
+
+    릴레이 모드이면 워커는 스케쥴러를 거쳐 Private IP 로 접속한다.
+    """
+    if role == 'worker' and setup_relay(clinfo):
+        return inst['private_ip']
+    return _get_ip(inst, clinfo['profile'].get('private_command'))
+
+
+def start_notebook(clinfo, timeout=SERVICE_TIMEOUT, init=True):
     """노트북 시작.
 
+    AWS 크레덴셜, 작업 폴더, git, dask-labextension 설정과 Jupyter 실행,
+    초기화 명령을 하나의 부트스트랩 스크립트로 실행한다. 접속 URL 은
+    Jupyter 로그를 따라 읽어 출력되는 즉시 얻는다.
+
     Args:
         clinfo (dict): 클러스터 생성 정보
-        retry_count (int): 접속 URL 얻기 재시도 수. 기본 10
+        timeout (int): 접속 URL 을 기다릴 최대 시간 (초)
+        init (bool): 프로파일의 초기화 명령도 실행할지 여부
 
     Raises:
-        TimeoutError: 재시도 수가 넘을 때
+        TimeoutError: 시간 안에 URL 을 얻지 못할 때
+        RuntimeError: 부트스트랩 단계가 실패하거나 Jupyter 가 종료될 때
 
     """
     critical("Start notebook.")
@@ -815,18 +1289,17 @@ def start_notebook(clinfo, retry_count=60):
     inst = clinfo['instance']['notebook']
     ip = _get_ip(inst, pro.get('private_command'))
 
-    # AWS 크레덴셜 설치
-    setup_aws_creds(user, private_key, ip)
-
-    # 작업 폴더
+    # AWS 크레덴셜 설치와 작업 폴더
     nb_workdir = tpl.get('workdir', NB_WORKDIR)
-    cmd = "mkdir -p {}".format(nb_workdir)
-    send_instance_cmd(user, private_key, ip, cmd)
+    region = aws_options(clinfo)['region']
+    steps = [('aws_creds', aws_creds_cmd(region)),
+             ('workdir', "mkdir -p {}".format(nb_workdir))]
 
     # git 설정이 있으면 설정
     if 'notebook' in pro and 'git' in pro['notebook']:
         nb_git = pro['notebook']['git']
-        cloned_dir = setup_git(nb_git, user, private_key, ip, nb_workdir)
+        gsteps, cloned_dir = git_steps(nb_git, nb_workdir)
+        steps += gsteps
         clinfo['git_cloned_dir'] = cloned_dir
 
     # 클러스터 타입별 노트북 설정
@@ -839,40 +1312,48 @@ def start_notebook(clinfo, retry_count=60):
             cmd += 'echo \'{{ "defaultURL": "http://{}:8787" }}\' > ' \
                    '~/.jupyter/lab/user-settings/dask-labextension/' \
                    'plugin.jupyterlab-settings'.format(sip)
-            send_instance_cmd(user, private_key, ip, cmd)
+            steps.append(('dask_labextension', cmd))
             # 스케쥴러 주소
-            vars = _get_dask_scheduler_address(clinfo)
+            vars = get_dask_scheduler_address(clinfo)
         else:
             raise NotImplementedError()
 
     # Jupyter 시작
     ncmd = "cd {} && {} jupyter lab --ip 0.0.0.0".format(nb_workdir, vars)
-    cmd = "screen -S bilbo -d -m bash -c '{}'".format(ncmd)
-    send_instance_cmd(user, private_key, ip, cmd)
+    steps.append(('jupyter', service_cmd('jupyter', ncmd)))
+    if init:
+        steps += init_steps(tpl)
+    bootstrap_host(clinfo, user, private_key, ip, 'notebook', steps)
 
     # 접속 URL 얻기
-    cmd = "jupyter notebook list | awk '{print $1}'"
-    for i in range(retry_count):
-        stdouts, _ = send_instance_cmd(user, private_key, ip, cmd)
-        # url을 얻었으면 기록
-        if len(stdouts) > 1 and len(stdouts[1]) > 0:
-            url = stdouts[1].strip().replace('0.0.0.0', inst['public_ip'])
-            clinfo['notebook_url'] = url
-            return
-        info("Can not fetch notebook list. Wait for a while.")
-        time.sleep(TRY_SLEEP)
-    raise TimeoutError("Can not get notebook url.")
+    url = wait_service(user, private_key, ip, 'jupyter', JUPYTER_URL_PTRN,
+                       timeout=timeout)[0]
+    clinfo['notebook_url'] = public_url(url, inst['public_ip'])
+
+
+def public_url(url, public_ip):
+    """Jupyter 가 알려준 URL 의 호스트를 Public IP 로 바꿈."""
+    parts = urlsplit(url)
+    netloc = public_ip if parts.port is None else \
+        '{}:{}'.format(public_ip, parts.port)
+    return urlunsplit(parts._replace(netloc=netloc))
+
+
+def git_steps(nb_git, nb_workdir):
+    """Git 설정 및 클론 단계.
 
+    이미 클론된 저장소는 다시 클론하지 않는다.
 
-def setup_git(nb_git, user, private_key, ip, nb_workdir):
-    """Git 설정 및 클론."""
+    Returns:
+        tuple: 부트스트랩 단계 리스트, 클론될 디렉토리 리스트
+    """
     guser = nb_git['user']
     email = nb_git['email']
 
     # config
     cmd = "git config --global user.name '{}'; ".format(guser)
     cmd += "git config --global user.email '{}'".format(email)
-    send_instance_cmd(user, private_key, ip, cmd)
+    steps = [('git_config', cmd)]
 
     # 클론 (작업 디렉토리에)
     repo = nb_git['repository']
@@ -880,15 +1361,25 @@ def setup_git(nb_git, user, private_key, ip, nb_workdir):
     repos = [repo] if type(repo) is str else repo
     cdirs = []
     for repo in repos:
-        cmd = git_clone_cmd(repo, guser, passwd, nb_workdir)
-        send_instance_cmd(user, private_key, ip, cmd, show_stderr=False)
         gcdir = repo.split('/')[-1].replace('.git', '')
-        cdirs.append("{}/{}".format(nb_workdir, gcdir))
-    return cdirs
+        cdir = "{}/{}".format(nb_workdir, gcdir)
+        cmd = "test -d {} || {}".format(
+            cdir, git_clone_cmd(repo, guser, passwd, nb_workdir))
+        steps.append(('git_clone:{}'.format(gcdir), cmd))
+        cdirs.append(cdir)
+    return steps, cdirs
+
 
+def start_dask_cluster(clinfo, init=True):
+    """Dask 클러스터 마스터/워커를 시작.
 
-def start_dask_cluster(clinfo):
-    """Dask 클러스터 마스터/워커를 시작."""
+    호스트마다 AWS 크레덴셜 설치, Dask 실행, 초기화 명령을 하나의 부트스트랩
+    스크립트로 실행한다.
+
+    Args:
+        clinfo (dict): 클러스터 정보
+        init (bool): 프로파일의 초기화 명령도 실행할지 여부
+    """
     critical("Start dask scheduler & workers.")
     private_command = clinfo.get('private_command')
 
@@ -897,52 +1388,418 @@ def start_dask_cluster(clinfo):
     user, private_key = stpl['ssh_user'], stpl['ssh_private_key']
     scd = clinfo['instance']['scheduler']
     sip = _get_ip(scd, private_command)
-    scd_dns = scd['private_dns_name']
-    cmd = "screen -S bilbo -d -m dask-scheduler"
-    send_instance_cmd(user, private_key, sip, cmd)
+    region = aws_options(clinfo)['region']
+    steps = [('aws_creds', aws_creds_cmd(region)),
+             ('dask_scheduler', service_cmd('dask-scheduler',
+                                            'dask-scheduler'))]
+    if init:
+        steps += init_steps(stpl)
+    bootstrap_host(clinfo, user, private_key, sip, 'scheduler', steps)
+    wait_service(user, private_key, sip, 'dask-scheduler', SCHEDULER_PTRN)
 
-    # AWS 크레덴셜 설치
-    setup_aws_creds(user, private_key, sip)
+    # 모든 워커들에 대해
+    start_dask_workers(clinfo, clinfo['instance']['workers'], init)
 
-    # 워커 실행 옵션 구하기
-    wrks = clinfo['instance']['workers']
-    wip = _get_ip(wrks[0], private_command)
-    info("  Get worker memory from '{}'".format(wip))
-    cmd = "free -b | grep 'Mem:' | awk '{print $2}'"
-    stdouts, _ = send_instance_cmd(user, private_key, wip, cmd)
-    memory = int(stdouts[0])
-    wtpl = clinfo['template']['worker']
-    nproc, nthread, memory = dask_worker_options(wtpl, memory)
-    # 결정된 옵션 기록
+    # 워커들이 스케쥴러에 등록될 때까지 기다림
+    clinfo['dask_dashboard_url'] = 'http://{}:8787'.format(sip)
+    wait_dask_workers(clinfo)
+
+
+def worker_ec2type(clinfo, wrk):
+    """워커 인스턴스의 타입. 기록이 없으면 템플릿의 타입."""
+    return wrk.get('ec2type') or clinfo['template']['worker']['ec2type']
+
+
+def worker_options(clinfo, ec2type, ip=None):
+    """인스턴스 타입별 Dask 워커 옵션을 구하고 워커 템플릿에 기록.
+
+    템플릿의 타입은 템플릿의 nproc, nthread, memory 에, 그 외 Fleet 으로
+    생성된 타입은 `type_options` 에 기록해, 이후 시작이나 확장에서 같은
+    값을 쓴다.
+
+    Args:
+        clinfo (dict): 클러스터 정보
+        ec2type (str): 인스턴스 타입
+        ip (str): 사양 정보가 없을 때 프로브할 워커 IP
+
+    Returns:
+        tuple: (프로세스 수, 프로세스당 쓰레드 수, 프로세스당 메모리)
+    """
     wtpl = clinfo['template']['worker']
-    wtpl['nproc'] = nproc
-    wtpl['nthread'] = nthread
-    wtpl['memory'] = memory
+    if ec2type == wtpl['ec2type']:
+        if 'memory' not in wtpl:
+            nproc, nthread, memory = dask_worker_options(wtpl, ip)
+            wtpl['nproc'] = nproc
+            wtpl['nthread'] = nthread
+            wtpl['memory'] = memory
+        return wtpl['nproc'], wtpl['nthread'], wtpl['memory']
+
+    topts = wtpl.setdefault('type_options', {})
+    if ec2type not in topts:
+        # 프로파일에서 지정한 값만 타입에 상관없이 적용
+        skip = ('nproc', 'nthread', 'memory', 'cpu_info', 'type_info',
+                'type_options')
+        ttpl = {k: v for k, v in wtpl.items() if k not in skip}
+        dworker = clinfo['profile']['dask'].get('worker', {})
+        for key in ('nproc', 'nthread'):
+            if key in dworker:
+                ttpl[key] = dworker[key]
+        ttpl['ec2type'] = ec2type
+        ttpl['type_info'] = get_instance_type_info(ec2type,
+                                                   **aws_options(clinfo))
+        topts[ec2type] = list(dask_worker_options(ttpl, ip))
+    return tuple(topts[ec2type])
+
+
+def start_dask_workers(clinfo, wrks, init=True):
+    """워커 인스턴스들을 부트스트랩하고 dask-worker 를 시작.
+
+    인스턴스 타입별로 구한 nproc, nthread, memory 옵션을 사용하며, 이미
+    기록된 옵션이 있으면 그대로 쓴다.
 
-    # 모든 워커들에 대해
+    Args:
+        clinfo (dict): 클러스터 정보
+        wrks (list): 시작할 워커 인스턴스 정보 리스트
+        init (bool): 프로파일의 초기화 명령도 실행할지 여부
+    """
+    wtpl = clinfo['template']['worker']
+    scd_dns = clinfo['instance']['scheduler']['private_dns_name']
     user, private_key = wtpl['ssh_user'], wtpl['ssh_private_key']
-    for wrk in wrks:
-        wip = _get_ip(wrk, private_command)
-        # AWS 크레덴셜 설치
-        setup_aws_creds(user, private_key, wip)
+    region = aws_options(clinfo)['region']
 
-        # 워커 시작
+    # 타입별 부트스트랩 단계
+    type_steps = {}
+    for wrk in wrks:
+        ec2type = worker_ec2type(clinfo, wrk)
+        if ec2type in type_steps:
+            continue
+        wip = _cmd_ip(clinfo, wrk, 'worker')
+        nproc, nthread, memory = worker_options(clinfo, ec2type, wip)
         opts = "--nprocs {} --nthreads {} --memory-limit {}".\
             format(nproc, nthread, memory)
-        cmd = "screen -S bilbo -d -m dask-worker {}:8786 {}".\
-            format(scd_dns, opts)
-        warning("  Worker options: {}".format(opts))
-        send_instance_cmd(user, private_key, wip, cmd)
-
-    # Dask 스케쥴러의 대쉬보드 기다림
-    dash_url = 'http://{}:8787'.format(sip)
-    clinfo['dask_dashboard_url'] = dash_url
-    critical("Wait for Dask dashboard ready.")
+        warning("  Worker options for {}: {}".format(ec2type, opts))
+        cmd = "dask-worker {}:8786 {}".format(scd_dns, opts)
+        steps = [('aws_creds', aws_creds_cmd(region)),
+                 ('dask_worker', service_cmd('dask-worker', cmd))]
+        if init:
+            steps += init_steps(wtpl)
+        type_steps[ec2type] = nproc, steps
+
+    def _start_worker(wip, ec2type):
+        nproc, steps = type_steps[ec2type]
+        bootstrap_host(clinfo, user, private_key, wip, 'worker', steps)
+        # 워커 프로세스들이 모두 스케쥴러에 등록될 때까지
+        wait_service(user, private_key, wip, 'dask-worker', WORKER_PTRN,
+                     nproc)
+
+    jobs = []
+    for wrk in wrks:
+        wip = _cmd_ip(clinfo, wrk, 'worker')
+        jobs.append((wip, _start_worker,
+                     (wip, worker_ec2type(clinfo, wrk))))
+    width, fail_fast = parallel_options(clinfo)
+    run_parallel(jobs, width, fail_fast, "Start workers")
+
+
+def wait_dask_workers(clinfo):
+    """클러스터의 모든 워커가 스케쥴러에 등록될 때까지 기다림."""
+    critical("Wait for Dask workers ready.")
+    quorum = clinfo['profile']['dask'].get('worker', {}).get('quorum', 1.0)
+    nworker = nthread = 0
+    for wrk in clinfo['instance']['workers']:
+        nproc, ntpp, _ = worker_options(clinfo, worker_ec2type(clinfo, wrk))
+        nworker += nproc
+        nthread += nproc * ntpp
     try:
-        wait_until_connect(dash_url)
+        joined = wait_dask_ready(clinfo['dask_dashboard_url'], nworker,
+                                 nthread, quorum)
     except Exception as e:
         error(str(e))
         raise e
+    clinfo['worker_join_secs'] = joined
+
+
+# 스케쥴러에서 실행해 지정한 호스트의 워커들을 정상 종료
+RETIRE_PY = """
+from distributed import Client
+ips = set({ips!r})
+with Client('127.0.0.1:8786', timeout=30) as c:
+    addrs = [a for a, w in c.scheduler_info()['workers'].items()
+             if w['host'] in ips]
+    c.retire_workers(workers=addrs, close_workers=True)
+    print(len(addrs))
+"""
+
+
+def retire_dask_workers(clinfo, ips):
+    """스케쥴러를 통해 워커들을 정상 종료.
+
+    워커가 가진 데이터는 남는 워커들로 옮겨진 뒤 워커가 종료된다.
+
+    Args:
+        clinfo (dict): 클러스터 정보
+        ips (list): 종료할 워커들의 Private IP 리스트
+
+    Returns:
+        bool: 성공 여부
+    """
+    stpl = clinfo['template']['scheduler']
+    sip = _cmd_ip(clinfo, clinfo['instance']['scheduler'], 'scheduler')
+    cmd = 'python -c {}'.format(shlex.quote(RETIRE_PY.format(ips=ips)))
+    res = send_instance_cmd(stpl['ssh_user'], stpl['ssh_private_key'], sip,
+                            cmd, show_stderr=False, get_excode=True)
+    if res is None or res[2] != 0:
+        warning("Can not retire workers {}: {}".format(
+            ips, 'no connection' if res is None else res[1]))
+        return False
+    return True
+
+
+def launch_workers(clinfo, cnt):
+    """워커 템플릿으로 워커 인스턴스를 추가하고 running 상태까지 기다림.
+
+    Fleet 을 쓰는 경우 하나라도 생성되면 받아들이며, 모자란 수는
+    `fleet_pending` 에 기록한다.
+
+    Args:
+        clinfo (dict): 클러스터 정보
+        cnt (int): 추가할 인스턴스 수
+
+    Returns:
+        list: 추가된 워커 인스턴스 정보 리스트
+    """
+    ec2 = get_resource('ec2', **aws_options(clinfo))
+    wtpl = clinfo['template']['worker']
+    tpl = {'worker': dict(wtpl, count=cnt)}
+    if 'fleet' in wtpl:
+        tpl['worker']['fleet'] = dict(wtpl['fleet'], min_count=1)
+    prefix = clinfo['profile'].get('instance_prefix')
+    insts = create_inst(ec2, tpl, 'worker', clinfo['name'], prefix)
+    inst_ids = [inst.instance_id for inst in insts]
+
+    # 실패시 제거할 수 있도록 인스턴스 ID 를 먼저 저장
+    def _add(insts):
+        insts['workers'] += [{'instance_id': iid} for iid in inst_ids]
+        return insts
+
+    clinfo['instance'] = modify_cluster_field(clinfo['name'], 'instance',
+                                              _add)
+
+    try:
+        roles = {iid: 'worker' for iid in inst_ids}
+        readies = wait_instances_running(ec2.meta.client, inst_ids,
+                                         connect_on_ready(clinfo, roles))
+    except Exception:
+        # 기다리다 실패하면 새 인스턴스는 쓰지 않음
+        _drop_workers(clinfo, inst_ids)
+        raise
+    missing = [iid for iid in inst_ids if iid not in readies]
+    if len(missing) > 0:
+        warning("Workers {} did not come up.".format(missing))
+        _drop_workers(clinfo, missing)
+    added = [instance_info(readies[iid]) for iid in inst_ids
+             if iid in readies]
+    infos = {wrk['instance_id']: wrk for wrk in added}
+
+    def _replace(insts):
+        insts['workers'] = [infos.get(wrk['instance_id'], wrk)
+                            for wrk in insts['workers']]
+        return insts
+
+    clinfo['instance'] = modify_cluster_field(clinfo['name'], 'instance',
+                                              _replace)
+    if len(added) < cnt:
+        warning("{} workers are pending.".format(cnt - len(added)))
+        clinfo['fleet_pending'] = cnt - len(added)
+        update_cluster_info(clinfo['name'],
+                            {'fleet_pending': clinfo['fleet_pending']})
+    elif clinfo.pop('fleet_pending', None) is not None:
+        update_cluster_info(clinfo['name'], {}, ['fleet_pending'])
+    return added
+
+
+def fill_fleet_workers(clname, timeout=FLEET_FILL_TIMEOUT):
+    """Fleet 으로 생성하지 못한 워커들을 다시 요청해 채움.
+
+    용량이 생길 때까지 간격을 늘려가며 다시 요청하고, 생성되는 대로
+    부트스트랩해 클러스터에 추가한다.
+
+    Args:
+        clname (str): 클러스터명
+        timeout (int): 최대로 다시 요청할 시간 (초)
+
+    Returns:
+        int: 끝내 채우지 못한 워커 수
+    """
+    pending = load_cluster_info(clname).get('fleet_pending', 0)
+    if pending == 0:
+        return 0
+
+    critical("Fill {} pending workers of '{}'.".format(pending, clname))
+    for _ in backoff_wait(time.time() + timeout, base=30, cap=300):
+        # 그 사이 scale 등으로 바뀌었을 수 있어 매번 다시 읽음
+        clinfo = load_cluster_info(clname)
+        pending = clinfo.get('fleet_pending', 0)
+        if pending == 0:
+            break
+        try:
+            added = launch_workers(clinfo, pending)
+        except (RuntimeError, botocore.exceptions.ClientError) as e:
+            warning("Can not launch pending workers: {}".format(e))
+            continue
+        try:
+            start_dask_workers(clinfo, added)
+            wait_dask_workers(clinfo)
+        finally:
+            save_worker_state(clinfo)
+        pending = clinfo.get('fleet_pending', 0)
+        if pending == 0:
+            break
+
+    if pending > 0:
+        warning("{} workers are still pending. Use 'bilbo scale' later.".
+                format(pending))
+    return pending
+
+
+def fill_log_path(clname):
+    """백그라운드 워커 채우기의 로그 파일 경로."""
+    return os.path.join(log_dir, '{}_fill.log'.format(clname))
+
+
+def spawn_fill_workers(clname):
+    """`bilbo fill` 을 분리된 백그라운드 프로세스로 실행.
+
+    Returns:
+        int: 프로세스 ID
+    """
+    check_dirs()
+    path = fill_log_path(clname)
+    with open(path, 'at') as log:
+        proc = subprocess.Popen(
+            [sys.executable, '-m', 'bilbo.cli', 'fill', clname],
+            stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT,
+            start_new_session=True)
+    info("spawn_fill_workers: pid {} log {}".format(proc.pid, path))
+    return proc.pid
+
+
+# 워커를 더하거나 뺄 때 고쳐지는 클러스터 정보 필드
+WORKER_FIELDS = ('template', 'bootstrap', 'ssh_reachable',
+                 'worker_join_secs')
+
+
+def save_worker_state(clinfo):
+    """워커를 더하거나 뺀 후 바뀐 필드만 저장.
+
+    워커 목록 (`instance`) 은 launch_workers 와 terminate_workers 가 따로
+    저장한다.
+    """
+    update_cluster_info(clinfo['name'], {k: clinfo[k] for k in WORKER_FIELDS
+                                         if k in clinfo})
+
+
+def _remove_workers(clinfo, inst_ids):
+    """저장된 워커 목록에서 인스턴스들을 뺌."""
+    def _remove(insts):
+        insts['workers'] = [wrk for wrk in insts['workers']
+                            if wrk['instance_id'] not in inst_ids]
+        return insts
+
+    clinfo['instance'] = modify_cluster_field(clinfo['name'], 'instance',
+                                              _remove)
+
+
+def _drop_workers(clinfo, inst_ids):
+    """생성했지만 쓰지 못하는 워커 인스턴스를 제거하고 목록에서 뺌."""
+    ec2 = get_client('ec2', **aws_options(clinfo))
+    try:
+        ec2.terminate_instances(InstanceIds=inst_ids)
+    except botocore.exceptions.ClientError as e:
+        error("Can not terminate workers {}: {}".format(inst_ids, e))
+    _remove_workers(clinfo, inst_ids)
+
+
+def _is_worker_addr(addr, ips):
+    """스케쥴러의 워커 주소 (`tcp://ip:port`) 가 호스트들의 것인가?"""
+    return urlsplit(addr).hostname in ips
+
+
+def terminate_workers(clinfo, wrks):
+    """워커들을 스케쥴러에서 정상 종료시킨 후 인스턴스를 제거.
+
+    Args:
+        clinfo (dict): 클러스터 정보
+        wrks (list): 제거할 워커 인스턴스 정보 리스트
+    """
+    # 끝내 올라오지 않은 워커는 IP 가 없음
+    ips = [wrk['private_ip'] for wrk in wrks if wrk.get('private_ip')]
+    if len(ips) > 0:
+        warning("Retire workers: {}".format(ips))
+        retire_dask_workers(clinfo, ips)
+
+    inst_ids = [wrk['instance_id'] for wrk in wrks]
+    ec2 = get_client('ec2', **aws_options(clinfo))
+    ec2.terminate_instances(InstanceIds=inst_ids)
+    _remove_workers(clinfo, inst_ids)
+
+    pool = get_pool()
+    ips = set()
+    for wrk in wrks:
+        if wrk.get('private_ip'):
+            pool.set_route(wrk['private_ip'], None)
+        ips.update(ip for ip in (wrk.get('private_ip'), wrk.get('public_ip'))
+                   if ip)
+    for key in ('bootstrap', 'ssh_reachable'):
+        for ip in ips:
+            clinfo.get(key, {}).pop(ip, None)
+    joined = clinfo.get('worker_join_secs', {})
+    for addr in [a for a in joined if _is_worker_addr(a, ips)]:
+        del joined[addr]
+
+
+def scale_cluster(clname, nworker):
+    """Dask 클러스터의 워커 인스턴스 수를 바꿈.
+
+    늘릴 때는 추가된 인스턴스만 부트스트랩하고, 기록된 워커 옵션으로
+    dask-worker 를 시작한다. 줄일 때는 뒤쪽 워커부터 스케쥴러를 통해
+    정상 종료시킨 후 인스턴스를 제거한다. 기존 워커는 건드리지 않는다.
+
+    Args:
+        clname (str): 클러스터명
+        nworker (int): 원하는 워커 인스턴스 수
+
+    Returns:
+        dict: 클러스터 정보
+    """
+    check_cluster(clname)
+    clinfo = load_cluster_info(clname)
+    if clinfo.get('type') != 'dask':
+        raise RuntimeError("Only Dask clusters can be scaled.")
+    if nworker < 1:
+        raise RuntimeError("At least one worker is needed.")
+
+    wrks = clinfo['instance']['workers']
+    cur = len(wrks)
+    # 원하는 수가 정해졌으니 채우지 못한 Fleet 요청은 버림
+    if clinfo.pop('fleet_pending', None) is not None:
+        update_cluster_info(clname, {}, ['fleet_pending'])
+    if nworker == cur:
+        print("Cluster '{}' already has {} workers.".format(clname, cur))
+        return clinfo
+
+    critical("Scale workers of '{}': {} => {}.".format(clname, cur, nworker))
+    clinfo['template']['worker']['count'] = nworker
+    try:
+        if nworker > cur:
+            added = launch_workers(clinfo, nworker - cur)
+            start_dask_workers(clinfo, added)
+            wait_dask_workers(clinfo)
+        else:
+            terminate_workers(clinfo, wrks[nworker:])
+    finally:
+        save_worker_state(clinfo)
+    return clinfo
 
 
 def stop_cluster(clname):
@@ -965,14 +1822,16 @@ def stop_cluster(clname):
         cmd = "screen -X -S 'bilbo' quit"
         send_instance_cmd(user, private_key, sip, cmd)
 
+        # 워커 중지
         wtpl = clinfo['template']['worker']
         user, private_key = wtpl['ssh_user'], wtpl['ssh_private_key']
-        wrks = clinfo['instance']['workers']
-        for wrk in wrks:
-            # 워커 중지
-            wip = _get_ip(wrk, private_command)
-            cmd = "screen -X -S 'bilbo' quit"
-            send_instance_cmd(user, private_key, wip, cmd)
+        jobs = []
+        for wrk in clinfo['instance']['workers']:
+            wip = _cmd_ip(clinfo, wrk, 'worker')
+            jobs.append((wip, send_instance_cmd,
+                         (user, private_key, wip, cmd)))
+        width, _ = parallel_options(clinfo)
+        run_parallel(jobs, width, False, "Stop workers")
     else:
         raise NotImplementedError()
 
@@ -1045,7 +1904,7 @@ def stop_notebook_or_python(clname, path, params):
 
     ext = path.split('.')[-1].lower()
 
-    dask_scd_addr = _get_dask_scheduler_address(clinfo)
+    dask_scd_addr = get_dask_scheduler_address(clinfo)
     # 노트북 파일
     if ext == 'ipynb':
         # Run by papermill
@@ -1123,8 +1982,10 @@ def _get_run_python(path, params):
 def run_notebook_or_python(clname, path, params):
     """원격 노트북 인스턴스에서 노트북 또는 파이썬 파일 실행.
 
+    출력은 도착하는 대로 표시되며, 메모리에는 마지막 일부 줄만 유지한다.
+
     Returns:
-        tuple: (stdout, exit_code)
+        tuple: (마지막 stdout 줄 리스트, exit_code)
 
     """
     info("run_notebook_or_python: {} - {}".format(clname, path))
@@ -1147,7 +2008,7 @@ def run_notebook_or_python(clname, path, params):
     dask_scd_addr = None
     if dask:
         if 'scheduler' in clinfo['instance']:
-            dask_scd_addr = _get_dask_scheduler_address(clinfo)
+            dask_scd_addr = get_dask_scheduler_address(clinfo)
         else:
             for param in params:
                 if param.startswith('DASK_SCHEDULER_ADDRESS'):
@@ -1172,8 +2033,11 @@ def run_notebook_or_python(clname, path, params):
                                                     show_stdout=True, show_stderr=False)
         if not _check_err(err):
             cmd = 'cat {}'.format(tmp)
-            res, err = send_instance_cmd(user, private_key, nip, cmd, show_stdout=True,
-                                         show_stderr=False)
+            stream = stream_instance_cmd(user, private_key, nip, cmd)
+            for kind, line in stream:
+                if kind == STDOUT:
+                    print(line, flush=True)
+            res, err = stream.tail_out, stream.tail_err
             if len(err) > 0 and 'No such file' not in err[0]:
                 _check_err(err)
     # 파이썬 파일
@@ -1197,15 +2061,13 @@ def show_plan(profile, clname, params):
         clname = '.'.join(profile.lower().split('.')[0:-1])
     print("\nCluster name: {}\n".format(clname))
 
-    pro = read_profile(profile, params)
+    clinfo = resolve_profile(profile, clname, params)
+    pro = clinfo['profile']
     if 'dask' in pro:
         print("Bilbo will create Dask cluster with following options:")
 
-    clinfo = init_clinfo(clname)
-    clinfo['profile'] = pro
-    clinfo = resolve_instances(clinfo)
     has_instance = False
-    ntpl = clinfo['template']['notebook']
+    ntpl = clinfo['template'].get('notebook')
     if ntpl is not None:
         print("")
         print("  Notebook:")
@@ -1247,6 +2109,19 @@ def show_dask_plan(clinfo):
     print("")
     print("  {} Worker(s):".format(wtpl['count']))
     show_instance_plan(wtpl)
+    if 'fleet' in wtpl:
+        fleet = wtpl['fleet']
+        print("    Fleet Instance Types: {}".format(
+            ', '.join(fleet.get('ec2types', [wtpl['ec2type']]))))
+        if 'subnets' in fleet:
+            print("    Fleet Subnets: {}".format(', '.join(fleet['subnets'])))
+        print("    Fleet Minimum Count: {}".format(
+            fleet.get('min_count', wtpl['count'])))
+    if _worker_facts(wtpl) is not None:
+        nproc, nthread, memory = dask_worker_options(dict(wtpl))
+        print("    Worker Process: {}".format(nproc))
+        print("    Thread per Process: {}".format(nthread))
+        print("    Memory Limit per Process: {}".format(memory))
     print("")
 
 
@@ -1255,6 +2130,37 @@ def init_clinfo(clname):
     return clinfo
 
 
+def resolve_profile(profile, clname, params):
+    """프로파일을 읽고 생성할 인스턴스 정보까지 결정한 클러스터 정보.
+
+    프로파일 내용과 패러미터가 같으면 디스크에 캐쉬된 결과를 사용해
+    스키마 검증과 해석 과정을 건너뛴다.
+    """
+    clinfo = init_clinfo(clname)
+    resolved = load_resolved_profile(profile, params)
+    if resolved is not None:
+        clinfo['profile'] = resolved['profile']
+        clinfo['template'] = resolved['template']
+        _attach_type_info(clinfo)
+        return clinfo
+
+    clinfo['profile'] = read_profile(profile, params)
+    clinfo = resolve_instances(clinfo)
+    tpl = {role: {k: v for k, v in rtpl.items() if k != 'type_info'}
+           for role, rtpl in clinfo['template'].items()}
+    save_resolved_profile(profile, params,
+                          {'profile': clinfo['profile'], 'template': tpl})
+    return clinfo
+
+
+def _attach_type_info(clinfo):
+    """생성 전에 워커 사양을 알 수 있도록 카탈로그에서 얻음."""
+    tpl = clinfo['template']
+    if 'worker' in tpl:
+        tpl['worker']['type_info'] = get_instance_type_info(
+            tpl['worker']['ec2type'], **aws_options(clinfo))
+
+
 def resolve_instances(clinfo):
     """프로파일에서 생성할 인스턴스 정보 결정."""
     pro = clinfo['profile']
@@ -1297,14 +2203,15 @@ def resolve_instances(clinfo):
                 tpl['worker']['nproc'] = dworker['nproc']
             if 'nthread' in dworker:
                 tpl['worker']['nthread'] = dworker['nthread']
+            if 'fleet' in dworker:
+                tpl['worker']['fleet'] = dworker['fleet']
+        _attach_type_info(clinfo)
     return clinfo
 
 
-def check_dup_cluster(clname):
-    """클러스터 이름이 겹치는지 검사."""
-    path = os.path.join(clust_dir, clname + '.json')
-    if os.path.isfile(path):
-        raise NameError("Cluster '{}' already exist.".format(clname))
+# 서비스를 시작하며 고쳐지는 클러스터 정보 필드
+SERVICE_FIELDS = WORKER_FIELDS + ('git_cloned_dir', 'notebook_url',
+                                  'dask_dashboard_url', 'state')
 
 
 def start_services(clinfo):
@@ -1314,68 +2221,50 @@ def start_services(clinfo):
     if 'type' in clinfo:
         start_cluster(clinfo)
     # 서비스 정보 추가 후 다시 저장
-    save_cluster_info(clinfo)
+    clinfo['state'] = 'running'
+    update_cluster_info(clinfo['name'], {k: clinfo[k] for k in SERVICE_FIELDS
+                                         if k in clinfo})
     return remote_nb
 
 
-def init_instances(clinfo):
-    """인스턴스 공통 초기화."""
-    warning("init_instances")
-    tpl = clinfo['template']
-    insts = clinfo['instance']
-
-    # 초기화 명령
-    def _run_init_cmd(role):
-        rtpl = tpl[role]
-        user, private_key = rtpl['ssh_user'], rtpl['ssh_private_key']
-        if 'init_cmd' in rtpl:
-            cmds = rtpl['init_cmd']
-            if role == 'worker':
-                for winst in insts['workers']:
-                    ip = winst['public_ip']
-                    _send_cmd(user, private_key, ip, cmds)
-            else:
-                ip = insts[role]['public_ip']
-                _send_cmd(user, private_key, ip, cmds)
-
-    def _send_cmd(user, private_key, ip, cmds):
-        for cmd in cmds:
-            send_instance_cmd(user, private_key, ip, cmd)
-
-    if 'notebook' in tpl:
-        _run_init_cmd('notebook')
-    if 'scheduler' in tpl:
-        _run_init_cmd('scheduler')
-    if 'worker' in tpl:
-        _run_init_cmd('worker')
-
-
 def run_cmd_and_store_result(cluster, ssh_user, ssh_private_key, ip, cmd,
-                                       show_stdout=False, show_stderr=True, retry_count=30):
-    """인스턴스에 SSH 명령 실행 후 결과를 클러스터 파일에 저장
+                             show_stdout=True, show_stderr=True,
+                             timeout=CONNECT_TIMEOUT, prefix=''):
+    """인스턴스에 SSH 명령 실행 후 결과를 명령 기록에 추가
 
-    https://stackoverflow.com/questions/42645196/how-to-ssh-and-run-commands-in-ec2-using-boto3
+    출력은 도착하는 대로 표시하고 전체 내용은 `~/.bilbo/logs` 아래 로그
+    파일에 남기며, 메모리에는 마지막 일부 줄만 유지한다. 로그 파일은
+    클러스터와 호스트별로 최근 CMD_LOG_KEEP 개만 남긴다. 시작/종료 시간,
+    exit code, 출력 크기는 `bilbo history` 로 볼 수 있다.
 
     Args:
         cluster (str): 클러스터명
         ssh_user (str): SSH 유저
         ssh_private_key (str): SSH Private Key 경로
         ip (str): 대상 인스턴스의 Public IP
-        cmd (list): 커맨드 문자열 리스트
+        cmd (str): 커맨드 문자열
         show_stdout (bool): 표준 출력 메시지 출력 여부
         show_stderr (bool): 에러 메시지 출력 여부
-        retry_count (int): 재시도 횟수
+        timeout (int): 접속 재시도에 허용하는 전체 시간 (초)
+        prefix (str): 표시할 출력 줄 앞에 붙일 문자열
 
     Returns:
-        tuple: stdout, stderr, exit_code
+        tuple: 마지막 stdout 줄 리스트, 마지막 stderr 줄 리스트, exit_code
     """
-    stdout, stderr, excode = send_instance_cmd(ssh_user, ssh_private_key, ip, cmd,
-                                               show_stdout=True, get_excode=True)
-
-    # 호출 결과 exitcode 저장
-    clinfo = load_cluster_info(cluster)
-    if 'cmd_result' not in clinfo:
-        clinfo['cmd_result'] = {}
-    clinfo['cmd_result'][ip] = cmd, excode
-    save_cluster_info(clinfo)
-    return stdout, stderr, excode
+    prune_cmd_logs(cluster, ip, CMD_LOG_KEEP - 1)
+    log_path = cmd_log_path(cluster, ip)
+    start = time.time()
+    stream = stream_instance_cmd(ssh_user, ssh_private_key, ip, cmd,
+                                 log_path, timeout)
+    for kind, line in stream:
+        if kind == STDOUT:
+            if show_stdout:
+                print(prefix + line, flush=True)
+        elif show_stderr:
+            error(prefix + line)
+    excode = stream.excode
+    info("Full output is logged to '{}'".format(log_path))
+
+    record_command(cluster, ip, cmd, start, time.time(), excode,
+                   stream.out_size)
+    return stream.tail_out, stream.tail_err, excode
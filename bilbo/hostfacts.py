@@ -0,0 +1,111 @@
+"""호스트 사양 정보 모듈."""
+import os
+import json
+
+from bilbo.util import info, warning, bilbo_dir
+
+# CoreCount 를 물리 코어 수로 바꾸면서 파일명을 바꿔 이전 캐쉬는 쓰지 않음
+FACTS_FILE = 'hostfacts2.json'
+
+# 한 번의 SSH 명령으로 CPU, 메모리, NUMA, 디스크, 인스턴스 스토어 정보 수집
+# CoreCount 는 물리 코어 수 (vCPU 수 / 코어당 쓰레드 수)
+PROBE_CMD = r"""
+lscpu | awk -F: '
+/^CPU\(s\):/ {gsub(/ /, "", $2); cpus = $2}
+/^Thread\(s\) per core:/ {gsub(/ /, "", $2); tpc = $2;
+  print "ThreadsPerCore=" $2}
+/^NUMA node\(s\):/ {gsub(/ /, "", $2); print "NumaNodes=" $2}
+END {print "CoreCount=" int(cpus / (tpc ? tpc : 1))}'
+free -b | awk '/^Mem:/ {print "MemTotal=" $2}'
+df -B1 --output=size / | tail -n 1 | awk '{print "RootDiskSize=" $1}'
+lsblk -b -d -n -o SIZE,MODEL | grep 'Instance Storage' | \
+  awk '{n += 1; s += $1} END {print "InstanceStoreCount=" n + 0; \
+  print "InstanceStoreSize=" s + 0}'
+"""
+
+
+def facts_path():
+    return os.path.join(bilbo_dir, FACTS_FILE)
+
+
+def _facts_key(tpl):
+    return '{}:{}'.format(tpl['ec2type'], tpl['ami'])
+
+
+def _load_cache():
+    path = facts_path()
+    if not os.path.isfile(path):
+        return {}
+    with open(path, 'rt') as f:
+        try:
+            return json.loads(f.read())
+        except ValueError:
+            warning("Broken host facts cache '{}'.".format(path))
+            return {}
+
+
+def _save_cache(cache):
+    path = facts_path()
+    tmp = path + '.tmp'
+    with open(tmp, 'wt') as f:
+        f.write(json.dumps(cache, indent=4, sort_keys=True))
+    os.replace(tmp, path)
+
+
+def parse_facts(lines):
+    """프로브 명령 출력을 사양 정보로 변환."""
+    facts = {}
+    for line in lines:
+        line = line.strip()
+        if '=' not in line:
+            continue
+        key, value = line.split('=', 1)
+        try:
+            facts[key] = int(value)
+        except ValueError:
+            facts[key] = value
+    return facts
+
+
+def cached_host_facts(tpl):
+    """인스턴스 타입과 AMI 에 대해 캐쉬된 사양 정보. 없으면 None."""
+    return _load_cache().get(_facts_key(tpl))
+
+
+def probe_host_facts(tpl, ip, send_cmd):
+    """인스턴스에 한 번 접속해 사양 정보를 얻고 캐쉬에 기록.
+
+    Args:
+        tpl (dict): 인스턴스 템플릿
+        ip (str): 대상 인스턴스 IP
+        send_cmd (callable): send_instance_cmd 와 같은 형식의 명령 함수
+
+    Returns:
+        dict: 사양 정보
+    """
+    info("probe_host_facts: {}".format(ip))
+    stdouts, _ = send_cmd(tpl['ssh_user'], tpl['ssh_private_key'], ip,
+                          PROBE_CMD)
+    facts = parse_facts(stdouts)
+    if 'CoreCount' not in facts or 'MemTotal' not in facts:
+        raise RuntimeError("Can not probe host facts from '{}'.".format(ip))
+
+    cache = _load_cache()
+    cache[_facts_key(tpl)] = facts
+    _save_cache(cache)
+    return facts
+
+
+def get_host_facts(tpl, ip=None, send_cmd=None):
+    """캐쉬된 사양 정보를 우선 사용하고, 없으면 프로브.
+
+    Returns:
+        dict: 사양 정보. 캐쉬가 없고 프로브할 수 없으면 None
+    """
+    facts = cached_host_facts(tpl)
+    if facts is not None:
+        info("Use cached host facts for '{}'.".format(_facts_key(tpl)))
+        return facts
+    if ip is None:
+        return None
+    return probe_host_facts(tpl, ip, send_cmd)
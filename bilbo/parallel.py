@@ -0,0 +1,103 @@
+"""병렬 실행 모듈."""
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, \
+    ALL_COMPLETED, wait
+
+from bilbo.util import info, error
+
+DEFAULT_WIDTH = 16
+
+
+def parallel_options(clinfo):
+    """클러스터 프로파일에서 병렬 실행 옵션 얻기.
+
+    Returns:
+        tuple: (동시 실행 수, 실패시 즉시 중단 여부)
+    """
+    popt = clinfo['profile'].get('parallel', {})
+    width = popt.get('width', DEFAULT_WIDTH)
+    fail_fast = popt.get('fail_fast', True)
+    return width, fail_fast
+
+
+def _timed_call(func, args):
+    st = time.time()
+    try:
+        res = func(*args)
+    except Exception as e:
+        return None, e, time.time() - st
+    return res, None, time.time() - st
+
+
+def run_parallel(jobs, width=DEFAULT_WIDTH, fail_fast=True, title=None,
+                 status=None):
+    """호스트별 작업을 동시에 실행.
+
+    Args:
+        jobs (list): (호스트, 함수, 인자 튜플) 의 리스트
+        width (int): 최대 동시 실행 수
+        fail_fast (bool): 하나라도 실패하면 남은 작업을 취소하고 예외 발생.
+            False 면 실패를 모아서 결과로 반환
+        title (str): 타이밍 요약에 표시할 제목
+        status (callable): 타이밍 요약에 표시할 호스트별 상태 함수
+
+    Returns:
+        dict: 호스트 => {'result', 'error', 'elapsed'}
+
+    Raises:
+        RuntimeError: fail_fast 일 때 실패한 호스트가 있으면
+    """
+    info("run_parallel: {} jobs, width {}".format(len(jobs), width))
+    results = {}
+    if len(jobs) == 0:
+        return results
+
+    width = max(1, min(width, len(jobs)))
+    with ThreadPoolExecutor(max_workers=width) as exe:
+        futs = {}
+        for host, func, args in jobs:
+            futs[exe.submit(_timed_call, func, args)] = host
+
+        pending = set(futs)
+        failed = False
+        while pending and not failed:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED
+                                 if fail_fast else ALL_COMPLETED)
+            for fut in done:
+                res, err, elapsed = fut.result()
+                results[futs[fut]] = dict(result=res, error=err,
+                                          elapsed=elapsed)
+                if err is not None:
+                    error("{}: {}".format(futs[fut], err))
+                    failed = fail_fast
+            if failed:
+                for fut in pending:
+                    fut.cancel()
+
+    show_timing_summary(results, title, status)
+    errors = [h for h, r in results.items() if r['error'] is not None]
+    if fail_fast and len(errors) > 0:
+        raise RuntimeError("Failed on host(s): {}".format(', '.join(errors)))
+    return results
+
+
+def _default_status(res):
+    return 'OK' if res['error'] is None else 'FAIL'
+
+
+def show_timing_summary(results, title=None, status=None):
+    """호스트별 실행 시간 요약 표시.
+
+    Args:
+        results (dict): run_parallel 의 결과
+        title (str): 제목
+        status (callable): 결과를 받아 상태 문자열을 돌려주는 함수
+    """
+    if len(results) == 0:
+        return
+    print()
+    print("{} ({} host(s)):".format(title or "Timing", len(results)))
+    status = status or _default_status
+    for host, res in sorted(results.items(), key=lambda r: -r[1]['elapsed']):
+        print("  {:<16} {:>8.2f}s  {}".format(host, res['elapsed'],
+                                              status(res)))
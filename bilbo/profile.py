@@ -2,19 +2,20 @@
 import os
 import json
 import re
-from copy import copy
+import hashlib
+from copy import deepcopy
+from functools import lru_cache
 import codecs
 
-import boto3
 import jsonschema
 
-from bilbo.util import error, prof_dir, mod_dir, info, PARAM_PTRN
+from bilbo.version import VERSION
+from bilbo.util import error, prof_dir, mod_dir, info, PARAM_PTRN, cache_dir
 
 DEFAULT_WORKER = 1
 
 
-def get_latest_schema():
-    """최신 프로파일 json schema를 얻음."""
+def _latest_schema_path():
     scm_dir = os.path.join(mod_dir, '..', 'schemas')
     schemas = []
     for scm in os.listdir(scm_dir):
@@ -24,12 +25,27 @@ def get_latest_schema():
         schemas.append(scm)
     assert len(schemas)
     schemas = sorted(schemas)
-    path = os.path.join(scm_dir, schemas[-1])
+    return os.path.join(scm_dir, schemas[-1])
+
+
+@lru_cache(maxsize=None)
+def get_latest_schema():
+    """최신 프로파일 json schema를 얻음."""
+    path = _latest_schema_path()
     with open(path, 'rt') as f:
         parsed = json.loads(f.read())
     return parsed
 
 
+@lru_cache(maxsize=None)
+def get_validator():
+    """최신 스키마로 컴파일된 검증기를 얻음."""
+    schema = get_latest_schema()
+    cls = jsonschema.validators.validator_for(schema)
+    cls.check_schema(schema)
+    return cls(schema)
+
+
 def check_profile(proname):
     """프로파일을 확인.
 
@@ -51,9 +67,20 @@ def check_profile(proname):
 
 
 def validate_by_schema(pcfg):
-    """프로파일을 스키마로 점검."""
-    schema = get_latest_schema()
-    jsonschema.validate(pcfg, schema)
+    """프로파일을 스키마로 점검.
+
+    Raises:
+        jsonschema.exceptions.ValidationError: 실패한 모든 경로를 담은 에러
+    """
+    errors = list(get_validator().iter_errors(pcfg))
+    if len(errors) == 0:
+        return
+
+    msgs = ["Profile validation failed:"]
+    for err in sorted(errors, key=lambda e: list(map(str, e.absolute_path))):
+        epath = '.'.join(map(str, err.absolute_path)) or '(root)'
+        msgs.append('  {}: {}'.format(epath, err.message))
+    raise jsonschema.exceptions.ValidationError('\n'.join(msgs))
 
 
 def override_cfg_by_params(cfg, params):
@@ -118,20 +145,59 @@ def read_profile(profile, params=None):
         body = f.read()
         pro = json.loads(body)
 
-    # 프로파일 내용 검증
-    validate_by_schema(pro)
-
-    # Override 패러미터가 있으면 적용
-    if params is not None:
+    # Override 패러미터가 있으면 적용한 후 한 번만 검증
+    if params:
+        org = deepcopy(pro)
         override_cfg_by_params(pro, params)
-        # 덮어쓴 내용 검증
         try:
             validate_by_schema(pro)
-        except jsonschema.exceptions.ValidationError:
+        except jsonschema.exceptions.ValidationError as e:
+            # 원래 프로파일 문제인지 확인
+            validate_by_schema(org)
             msgs = ["There is an incorrect parameter:"]
             for param in params:
                 msgs.append('  {}'.format(param))
+            msgs.append(e.message)
             raise RuntimeError('\n'.join(msgs))
+    else:
+        validate_by_schema(pro)
 
     pro['name'] = os.path.basename(path)
     return pro
+
+
+def _cache_path(profile, params):
+    """프로파일 내용, 패러미터, 스키마로 결정되는 캐쉬 파일 경로."""
+    path = check_profile(profile)
+    with open(path, 'rb') as f:
+        body = f.read()
+    scm_path = _latest_schema_path()
+    h = hashlib.sha256(path.encode('utf-8'))
+    h.update(body)
+    h.update(json.dumps(list(params or [])).encode('utf-8'))
+    h.update('{}:{}:{}'.format(os.path.basename(scm_path),
+                               os.path.getmtime(scm_path),
+                               VERSION).encode('utf-8'))
+    return os.path.join(cache_dir, 'profile-{}.json'.format(h.hexdigest()))
+
+
+def load_resolved_profile(profile, params):
+    """디스크에 캐쉬된 해석된 프로파일 읽기. 없으면 None."""
+    path = _cache_path(profile, params)
+    if not os.path.isfile(path):
+        return None
+    info("load_resolved_profile: {}".format(path))
+    with open(path, 'rt') as f:
+        try:
+            return json.loads(f.read())
+        except ValueError:
+            return None
+
+
+def save_resolved_profile(profile, params, resolved):
+    """해석된 프로파일을 디스크에 캐쉬."""
+    path = _cache_path(profile, params)
+    tmp = path + '.tmp'
+    with open(tmp, 'wt') as f:
+        f.write(json.dumps(resolved, ensure_ascii=False))
+    os.replace(tmp, path)
@@ -0,0 +1,462 @@
+"""SSH 연결 모듈."""
+import time
+import errno
+import codecs
+import select
+import socket
+import logging
+from collections import deque
+import atexit
+import threading
+from contextlib import contextmanager
+from os.path import expanduser
+
+import paramiko
+
+from bilbo.util import info, warning, error, backoff_wait
+
+logging.getLogger("paramiko").setLevel(logging.WARNING)
+
+SSH_PORT = 22
+# 접속 시도 전체에 허용하는 시간 (초)
+CONNECT_TIMEOUT = 300
+# TCP 포트 확인 한 번에 기다리는 시간 (초)
+PROBE_TIMEOUT = 2
+BANNER_TIMEOUT = 15
+KEEPALIVE = 60
+MAX_IDLE = 300
+RECV_SIZE = 1024 * 64
+SELECT_TIMEOUT = 1
+TAIL_SIZE = 200
+STDOUT = 'stdout'
+STDERR = 'stderr'
+
+
+def probe_port(host, port=SSH_PORT, timeout=PROBE_TIMEOUT):
+    """논블로킹 TCP 연결로 포트가 열렸는지 확인.
+
+    Returns:
+        bool: 연결이 맺어지면 True
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setblocking(False)
+    try:
+        rv = sock.connect_ex((host, port))
+        if rv not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            return False
+        _, writable, _ = select.select([], [sock], [], timeout)
+        if len(writable) == 0:
+            return False
+        return sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+
+def wait_port(host, port=SSH_PORT, deadline=None):
+    """포트가 열릴 때까지 짧은 지수 백오프로 확인.
+
+    Args:
+        host (str): 대상 호스트
+        port (int): 대상 포트
+        deadline (float): 마감 시간 (epoch 초). 기본은 지금부터
+            CONNECT_TIMEOUT 초 뒤
+
+    Returns:
+        bool: 마감 시간 안에 포트가 열리면 True
+    """
+    if deadline is None:
+        deadline = time.time() + CONNECT_TIMEOUT
+    st = time.time()
+    for _ in backoff_wait(deadline, base=0.2, cap=2):
+        remain = deadline - time.time()
+        if probe_port(host, port, max(min(PROBE_TIMEOUT, remain), 0.1)):
+            info("Port {} of '{}' is open ({:.1f} secs).".
+                 format(port, host, time.time() - st))
+            return True
+    return False
+
+
+class SSHPool:
+    """(유저, 키, 호스트, 압축 여부, 경유 호스트) 별로 SSH 연결을 재사용하는
+    풀.
+
+    연결(Transport)은 열어둔 채로 두고, 명령마다 새 채널을 연다. 채널이나
+    SFTP 세션을 쓰고 있는 연결은 유휴 연결로 닫지 않는다. 파일
+    전송용으로는 압축을 켠 연결을 따로 둔다. 경유 호스트가 등록된 호스트는
+    경유 호스트 연결 위의 direct-tcpip 채널로 접속해, 로컬에서는 경유 호스트
+    하나에만 TCP 연결을 맺는다.
+    """
+
+    def __init__(self, keepalive=KEEPALIVE, max_idle=MAX_IDLE):
+        self.keepalive = keepalive
+        self.max_idle = max_idle
+        self._lock = threading.Lock()
+        self._keys = {}
+        # (user, key_path, host, compress, jump) =>
+        #   [client, last_used, 사용 중인 채널 수]
+        self._conns = {}
+        # 같은 호스트에 대한 동시 연결 방지용
+        self._host_locks = {}
+        # 호스트 => 경유 호스트 (user, private_key, host)
+        self._routes = {}
+        # 호스트 => 처음 SSH 로 접속된 시간 (epoch 초)
+        self._reachable = {}
+
+    def reachable_at(self, host):
+        """호스트에 처음 SSH 로 접속된 시간 (epoch 초). 없으면 None."""
+        with self._lock:
+            return self._reachable.get(host)
+
+    def set_route(self, host, jump):
+        """호스트에 접속할 때 거칠 경유 호스트 등록.
+
+        Args:
+            host (str): 대상 호스트. 경유 호스트에서 접근할 수 있는 주소
+            jump (tuple): 경유 호스트의 (유저, Private Key 경로, 호스트).
+                None 이면 직접 접속
+        """
+        with self._lock:
+            if jump is None:
+                self._routes.pop(host, None)
+            else:
+                juser, jkey, jhost = jump
+                self._routes[host] = (juser, expanduser(jkey), jhost)
+
+    def _ckey(self, user, private_key, host, compress):
+        with self._lock:
+            jump = self._routes.get(host)
+        return (user, expanduser(private_key), host, compress, jump)
+
+    def _load_key(self, key_path):
+        """Private key 를 한 번만 읽어 재사용."""
+        with self._lock:
+            if key_path not in self._keys:
+                self._keys[key_path] = paramiko.RSAKey.\
+                    from_private_key_file(key_path)
+            return self._keys[key_path]
+
+    def _host_lock(self, ckey):
+        with self._lock:
+            if ckey not in self._host_locks:
+                self._host_locks[ckey] = threading.Lock()
+            return self._host_locks[ckey]
+
+    def _connect(self, user, key_path, host, timeout, compress=False,
+                 jump=None):
+        """마감 시간까지 재시도하며 SSH 접속.
+
+        직접 접속하는 경우, 먼저 가벼운 TCP 포트 확인으로 sshd 가 뜨기를
+        기다린 뒤 핸드셰이크를 한다.
+        """
+        key = self._load_key(key_path)
+        deadline = time.time() + timeout
+        if jump is None and not wait_port(host, SSH_PORT, deadline):
+            error("Port {} of '{}' is not open in {} secs.".
+                  format(SSH_PORT, host, timeout))
+            return None
+
+        for _ in backoff_wait(deadline, base=1):
+            client = paramiko.SSHClient()
+            client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            try:
+                sock = None
+                if jump is not None:
+                    # 경유 호스트에서 대상 호스트로의 터널
+                    sock = jump.get_transport().open_channel(
+                        'direct-tcpip', (host, SSH_PORT), ('127.0.0.1', 0))
+                client.connect(hostname=host, username=user, pkey=key,
+                               compress=compress, sock=sock,
+                               timeout=PROBE_TIMEOUT,
+                               banner_timeout=BANNER_TIMEOUT,
+                               auth_timeout=BANNER_TIMEOUT)
+            except (paramiko.SSHException, socket.timeout, OSError,
+                    EOFError) as e:
+                # 배너 교환 중 끊김, 아직 키가 설치되지 않은 인증 실패 등
+                client.close()
+                warning("Connection failed to '{}' ({}: {}). Retry.".
+                        format(host, type(e).__name__, e))
+            else:
+                client.get_transport().set_keepalive(self.keepalive)
+                return client
+
+        error("Connection failed to '{}' in {} secs.".format(host, timeout))
+        return None
+
+    def evict_idle(self):
+        """오래 사용되지 않은 연결을 닫음."""
+        now = time.time()
+        with self._lock:
+            # 다른 연결이 거쳐가는 경유 호스트 연결은 남겨둠
+            jumps = set(ckey[4] for ckey in self._conns if ckey[4])
+            for ckey, (client, last_used, active) in \
+                    list(self._conns.items()):
+                if ckey[:3] in jumps and not ckey[3]:
+                    continue
+                if active == 0 and now - last_used > self.max_idle:
+                    info("evict idle ssh connection: {}".format(ckey[2]))
+                    client.close()
+                    del self._conns[ckey]
+
+    def get(self, user, private_key, host, timeout=CONNECT_TIMEOUT,
+            compress=False):
+        """연결된 SSH 클라이언트 얻기.
+
+        Args:
+            user (str): SSH 유저
+            private_key (str): SSH Private Key 경로
+            host (str): 대상 호스트
+            timeout (int): 접속 재시도에 허용하는 전체 시간 (초)
+            compress (bool): 전송 데이터 압축 여부
+
+        Returns:
+            paramiko.SSHClient: 연결된 클라이언트. 실패시 None
+        """
+        self.evict_idle()
+        ckey = self._ckey(user, private_key, host, compress)
+        key_path, jump = ckey[1], ckey[4]
+        jump_client = None
+        if jump is not None:
+            jump_client = self.get(*jump, timeout=timeout)
+            if jump_client is None:
+                return None
+        with self._host_lock(ckey):
+            with self._lock:
+                conn = self._conns.get(ckey)
+            if conn is not None:
+                client = conn[0]
+                transport = client.get_transport()
+                if transport is not None and transport.is_active():
+                    conn[1] = time.time()
+                    return client
+                # 끊어진 연결은 다시 연결
+                info("stale ssh connection to {}, reconnect.".format(host))
+                client.close()
+                with self._lock:
+                    self._conns.pop(ckey, None)
+
+            client = self._connect(user, key_path, host, timeout,
+                                   compress=compress, jump=jump_client)
+            if client is not None:
+                with self._lock:
+                    self._conns[ckey] = [client, time.time(), 0]
+                    self._reachable.setdefault(host, time.time())
+            return client
+
+    def _lease(self, ckey, client):
+        with self._lock:
+            conn = self._conns.get(ckey)
+            if conn is not None and conn[0] is client:
+                conn[2] += 1
+                return True
+        return False
+
+    def _release(self, ckey, client):
+        with self._lock:
+            conn = self._conns.get(ckey)
+            if conn is not None and conn[0] is client:
+                conn[2] = max(0, conn[2] - 1)
+                conn[1] = time.time()
+
+    @contextmanager
+    def hold(self, user, private_key, host, timeout=CONNECT_TIMEOUT,
+             compress=False):
+        """연결을 쓰는 동안 유휴 연결로 닫히지 않도록 잡아둠.
+
+        Yields:
+            paramiko.SSHClient: 연결된 클라이언트. 실패시 None
+        """
+        client = self.get(user, private_key, host, timeout, compress)
+        ckey = self._ckey(user, private_key, host, compress)
+        leased = client is not None and self._lease(ckey, client)
+        try:
+            yield client
+        finally:
+            if leased:
+                self._release(ckey, client)
+
+    def open_session(self, user, private_key, host,
+                     timeout=CONNECT_TIMEOUT):
+        """연결에서 새 세션 채널을 염.
+
+        채널을 닫을 때까지 연결은 유휴 연결로 닫히지 않는다.
+
+        Returns:
+            paramiko.Channel: 세션 채널. 연결 실패시 None
+        """
+        client = self.get(user, private_key, host, timeout)
+        if client is None:
+            return None
+        try:
+            channel = client.get_transport().open_session()
+        except (paramiko.SSHException, EOFError):
+            # 서버측에서 끊어진 연결이면 한 번 다시 연결
+            self.discard(user, private_key, host)
+            client = self.get(user, private_key, host, timeout)
+            if client is None:
+                return None
+            channel = client.get_transport().open_session()
+
+        ckey = self._ckey(user, private_key, host, False)
+        if self._lease(ckey, client):
+            close = channel.close
+            released = []
+
+            def _close():
+                close()
+                with self._lock:
+                    if len(released) > 0:
+                        return
+                    released.append(True)
+                self._release(ckey, client)
+
+            channel.close = _close
+        return channel
+
+    def discard(self, user, private_key, host, compress=False):
+        """연결을 풀에서 제거."""
+        ckey = self._ckey(user, private_key, host, compress)
+        with self._lock:
+            if ckey in self._conns:
+                self._conns[ckey][0].close()
+                del self._conns[ckey]
+
+    def close(self):
+        """모든 연결을 닫음."""
+        with self._lock:
+            for conn in self._conns.values():
+                conn[0].close()
+            self._conns.clear()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """프로세스 공용 SSH 연결 풀."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SSHPool()
+            atexit.register(_pool.close)
+    return _pool
+
+
+def open_channel(user, private_key, host, timeout=CONNECT_TIMEOUT):
+    """풀의 연결에서 새 세션 채널을 염.
+
+    Returns:
+        paramiko.Channel: 세션 채널. 연결 실패시 None
+    """
+    return get_pool().open_session(user, private_key, host, timeout)
+
+
+def iter_channel(channel):
+    """채널의 표준 출력/에러를 데이터가 오는 대로 읽음.
+
+    멀티바이트 문자가 잘리지 않도록 스트림별 점진적 디코더를 사용.
+
+    Args:
+        channel (paramiko.Channel): exec_command 를 호출한 채널
+
+    Yields:
+        tuple: (STDOUT 또는 STDERR, 디코딩된 문자열 조각)
+    """
+    streams = [
+        (STDOUT, channel.recv_ready, channel.recv,
+         codecs.getincrementaldecoder('utf-8')(errors='replace')),
+        (STDERR, channel.recv_stderr_ready, channel.recv_stderr,
+         codecs.getincrementaldecoder('utf-8')(errors='replace')),
+    ]
+
+    while True:
+        select.select([channel], [], [], SELECT_TIMEOUT)
+        for stream, ready, recv, decoder in streams:
+            while ready():
+                text = decoder.decode(recv(RECV_SIZE))
+                if len(text) > 0:
+                    yield stream, text
+        if channel.exit_status_ready() and not channel.recv_ready() and \
+                not channel.recv_stderr_ready():
+            break
+
+    # 남은 바이트 처리
+    for stream, _, _, decoder in streams:
+        text = decoder.decode(b'', final=True)
+        if len(text) > 0:
+            yield stream, text
+
+
+def read_channel(channel, on_stdout=None, on_stderr=None):
+    """채널의 출력을 모두 읽어 핸들러로 전달.
+
+    Args:
+        channel (paramiko.Channel): exec_command 를 호출한 채널
+        on_stdout (callable): 디코딩된 표준 출력 조각을 받을 함수
+        on_stderr (callable): 디코딩된 표준 에러 조각을 받을 함수
+
+    Returns:
+        int: 원격 명령의 exit code
+    """
+    handlers = {STDOUT: on_stdout, STDERR: on_stderr}
+    for stream, text in iter_channel(channel):
+        if handlers[stream] is not None:
+            handlers[stream](text)
+    return channel.recv_exit_status()
+
+
+class CmdStream:
+    """원격 명령 출력을 줄 단위로 흘려보내는 스트림.
+
+    전체 출력은 로그 파일로만 남기고, 메모리에는 마지막 일부 줄만 유지한다.
+    """
+
+    def __init__(self, channel, log_path=None, tail_size=TAIL_SIZE):
+        self.channel = channel
+        self.log_path = log_path
+        self.excode = None
+        self.out_size = 0
+        self._tails = {STDOUT: deque(maxlen=tail_size),
+                       STDERR: deque(maxlen=tail_size)}
+
+    @property
+    def tail_out(self):
+        """표준 출력의 마지막 줄들."""
+        return list(self._tails[STDOUT])
+
+    @property
+    def tail_err(self):
+        """표준 에러의 마지막 줄들."""
+        return list(self._tails[STDERR])
+
+    def __iter__(self):
+        """(STDOUT 또는 STDERR, 줄) 을 도착하는 대로 생성."""
+        log = None
+        if self.log_path is not None:
+            log = open(self.log_path, 'at', encoding='utf-8')
+        partial = {STDOUT: '', STDERR: ''}
+
+        def _line(stream, line):
+            self._tails[stream].append(line)
+            if log is not None:
+                prefix = '' if stream == STDOUT else '[stderr] '
+                log.write(prefix + line + '\n')
+            return stream, line
+
+        try:
+            for stream, text in iter_channel(self.channel):
+                self.out_size += len(text.encode('utf-8'))
+                lines = (partial[stream] + text).split('\n')
+                partial[stream] = lines.pop()
+                for line in lines:
+                    yield _line(stream, line)
+            for stream, rest in partial.items():
+                if len(rest) > 0:
+                    yield _line(stream, rest)
+            self.excode = self.channel.recv_exit_status()
+        finally:
+            if log is not None:
+                log.close()
+            self.channel.close()
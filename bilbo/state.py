@@ -0,0 +1,696 @@
+"""클러스터 정보 모듈.
+
+클러스터 정보는 상태 저장소에 기록한다. 기본은 SQLite 저장소이며,
+환경 변수 `BILBO_STATE_BACKEND=json` 으로 클러스터별 JSON 파일 저장소를
+쓸 수 있다.
+"""
+import os
+import json
+import time
+import sqlite3
+import datetime
+import threading
+from contextlib import contextmanager
+
+from bilbo.util import warning, error, info, clust_dir, pprint
+
+INDEX_FILE = '.index'
+DB_FILE = 'state.db'
+JOURNAL_FILE = 'journal.jsonl'
+IMPORTED_EXT = '.imported'
+DEFAULT_BACKEND = 'sqlite'
+# 목록 표시용 요약 정보를 만드는 데 필요한 필드
+SUMMARY_FIELDS = ('name', 'description', 'type', 'instance', 'state',
+                  'saved_time')
+# 명령 기록 항목의 필드
+JOURNAL_FIELDS = ('cluster', 'host', 'cmd', 'start', 'end', 'duration',
+                  'excode', 'out_size')
+
+
+def _json_default(value):
+    if isinstance(value, datetime.date):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    raise TypeError('not JSON serializable')
+
+
+def _dumps(value, indent=None):
+    return json.dumps(value, default=_json_default, indent=indent,
+                      sort_keys=True, ensure_ascii=False)
+
+
+def _count_instances(clinfo):
+    cnt = 0
+    for role, inst in clinfo.get('instance', {}).items():
+        cnt += len(inst) if role == 'workers' else 1
+    return cnt
+
+
+def _index_entry(clinfo):
+    """클러스터 정보에서 목록 표시에 필요한 요약만 추림."""
+    return {
+        'name': clinfo['name'],
+        'description': clinfo.get('description'),
+        'type': clinfo.get('type'),
+        'instance_count': _count_instances(clinfo),
+        'state': clinfo.get('state'),
+        'saved_time': clinfo.get('saved_time')
+    }
+
+
+class JSONStore:
+    """클러스터별 JSON 파일 저장소.
+
+    `ls` 를 위해 클러스터 파일들의 요약을 `.index` 파일로 유지한다.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, clname):
+        return os.path.join(self.root, clname + '.json')
+
+    def _index_path(self):
+        return os.path.join(self.root, INDEX_FILE)
+
+    def _write(self, path, body):
+        # 중간에 실패해도 기존 파일이 깨지지 않도록 교체
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp, 'wt') as f:
+            f.write(body)
+        os.replace(tmp, path)
+
+    def _read_index(self):
+        path = self._index_path()
+        if not os.path.isfile(path):
+            return {}
+        with open(path, 'rt') as f:
+            try:
+                return json.loads(f.read())
+            except ValueError:
+                warning("Broken cluster index. Rebuild it.")
+                return {}
+
+    def _scan_files(self):
+        """클러스터 파일명과 수정 시간. 파일 내용은 읽지 않는다."""
+        files = {}
+        for entry in os.scandir(self.root):
+            if entry.name.endswith('.json') and entry.is_file():
+                name = entry.name[:-len('.json')]
+                files[name] = entry.stat().st_mtime
+        return files
+
+    def _update_index(self, clname, clinfo=None):
+        index = self._read_index()
+        if clinfo is None:
+            index.pop(clname, None)
+        else:
+            entry = _index_entry(clinfo)
+            entry['mtime'] = os.path.getmtime(self._path(clname))
+            index[clname] = entry
+        self._write(self._index_path(), json.dumps(index, ensure_ascii=False))
+
+    def index(self):
+        """인덱스가 없거나 파일과 맞지 않으면 바뀐 파일만 다시 읽어 갱신."""
+        index = self._read_index()
+        files = self._scan_files()
+        stale = False
+        for name in list(index):
+            if name not in files:
+                del index[name]
+                stale = True
+        for name, mtime in files.items():
+            if name in index and index[name].get('mtime') == mtime:
+                continue
+            info("Update cluster index for '{}'.".format(name))
+            try:
+                clinfo = self.load(name)
+            except ValueError:
+                warning("Broken cluster file '{}'.".format(name))
+                continue
+            index[name] = _index_entry(clinfo)
+            index[name]['mtime'] = mtime
+            stale = True
+        if stale:
+            self._write(self._index_path(),
+                        json.dumps(index, ensure_ascii=False))
+        return index
+
+    def exists(self, clname):
+        return clname in self.index()
+
+    def save(self, clinfo):
+        clname = clinfo['name']
+        self._write(self._path(clname), _dumps(clinfo, 4))
+        self._update_index(clname, clinfo)
+
+    def update(self, clname, fields, remove=()):
+        clinfo = self.load(clname)
+        clinfo.update(fields)
+        for key in remove:
+            clinfo.pop(key, None)
+        self.save(clinfo)
+
+    def modify(self, clname, key, func, default=None):
+        clinfo = self.load(clname)
+        clinfo[key] = func(clinfo.get(key, default))
+        self.save(clinfo)
+        return clinfo[key]
+
+    def load(self, clname):
+        with open(self._path(clname), 'rt') as f:
+            return json.loads(f.read())
+
+    def remove(self, clname):
+        os.unlink(self._path(clname))
+        self._update_index(clname)
+
+    def append_journal(self, entry):
+        # O_APPEND 로 한 줄씩 쓰기에 여러 프로세스가 동시에 써도 섞이지 않음
+        line = json.dumps(entry, ensure_ascii=False) + '\n'
+        path = os.path.join(self.root, JOURNAL_FILE)
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line.encode('utf-8'))
+        finally:
+            os.close(fd)
+
+    def journal(self, clname, host=None):
+        path = os.path.join(self.root, JOURNAL_FILE)
+        if not os.path.isfile(path):
+            return []
+        entries = []
+        with open(path, 'rt') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry['cluster'] != clname:
+                    continue
+                if host is not None and entry['host'] != host:
+                    continue
+                entries.append(entry)
+        return entries
+
+
+class SQLiteStore:
+    """SQLite 저장소.
+
+    클러스터 정보의 최상위 필드를 행 단위로 저장해 필드별로 갱신하며, WAL
+    모드와 트랜잭션으로 여러 bilbo 프로세스의 동시 접근을 처리한다.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS clusters (
+        name TEXT PRIMARY KEY,
+        description TEXT,
+        type TEXT,
+        instance_count INTEGER,
+        state TEXT,
+        saved_time TEXT
+    );
+    CREATE TABLE IF NOT EXISTS fields (
+        cluster TEXT NOT NULL,
+        key TEXT NOT NULL,
+        value TEXT,
+        PRIMARY KEY (cluster, key)
+    );
+    CREATE TABLE IF NOT EXISTS journal (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        cluster TEXT NOT NULL,
+        host TEXT,
+        cmd TEXT,
+        start REAL,
+        end REAL,
+        duration REAL,
+        excode INTEGER,
+        out_size INTEGER
+    );
+    CREATE INDEX IF NOT EXISTS journal_cluster ON journal (cluster, host);
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.path = os.path.join(root, DB_FILE)
+        self._local = threading.local()
+        self._conn().executescript(self.SCHEMA)
+        self.import_json()
+
+    def _conn(self):
+        con = getattr(self._local, 'con', None)
+        if con is None:
+            con = sqlite3.connect(self.path, timeout=30,
+                                  isolation_level=None)
+            con.execute('PRAGMA journal_mode=WAL')
+            con.execute('PRAGMA synchronous=NORMAL')
+            self._local.con = con
+        return con
+
+    @contextmanager
+    def transaction(self):
+        """쓰기 잠금을 먼저 잡는 트랜잭션."""
+        con = self._conn()
+        con.execute('BEGIN IMMEDIATE')
+        try:
+            yield con
+        except BaseException:
+            con.execute('ROLLBACK')
+            raise
+        else:
+            con.execute('COMMIT')
+
+    def import_json(self):
+        """기존 JSON 클러스터 파일을 가져옴."""
+        for fname in os.listdir(self.root):
+            if not fname.endswith('.json'):
+                continue
+            path = os.path.join(self.root, fname)
+            with open(path, 'rt') as f:
+                try:
+                    clinfo = json.loads(f.read())
+                except ValueError:
+                    warning("Can not import broken '{}'.".format(path))
+                    continue
+            if not self.exists(clinfo['name']):
+                info("Import cluster info '{}'.".format(path))
+                self.save(clinfo)
+            os.replace(path, path + IMPORTED_EXT)
+
+    def _refresh_summary(self, con, clname):
+        rows = con.execute(
+            'SELECT key, value FROM fields WHERE cluster = ? AND key IN '
+            '({})'.format(','.join('?' * len(SUMMARY_FIELDS))),
+            (clname,) + SUMMARY_FIELDS).fetchall()
+        clinfo = {k: json.loads(v) for k, v in rows}
+        clinfo['name'] = clname
+        e = _index_entry(clinfo)
+        con.execute(
+            'INSERT OR REPLACE INTO clusters (name, description, type, '
+            'instance_count, state, saved_time) VALUES (?, ?, ?, ?, ?, ?)',
+            (clname, e['description'], e['type'], e['instance_count'],
+             e['state'], e['saved_time']))
+
+    def _write_fields(self, con, clname, fields):
+        con.executemany(
+            'INSERT OR REPLACE INTO fields (cluster, key, value) '
+            'VALUES (?, ?, ?)',
+            [(clname, k, _dumps(v)) for k, v in fields.items()])
+
+    def index(self):
+        con = self._conn()
+        rows = con.execute(
+            'SELECT name, description, type, instance_count, state, '
+            'saved_time FROM clusters ORDER BY name').fetchall()
+        keys = ('name', 'description', 'type', 'instance_count', 'state',
+                'saved_time')
+        return {row[0]: dict(zip(keys, row)) for row in rows}
+
+    def exists(self, clname):
+        row = self._conn().execute(
+            'SELECT 1 FROM clusters WHERE name = ?', (clname,)).fetchone()
+        return row is not None
+
+    def save(self, clinfo):
+        clname = clinfo['name']
+        with self.transaction() as con:
+            # 없어진 필드 제거
+            keys = list(clinfo)
+            con.execute(
+                'DELETE FROM fields WHERE cluster = ? AND key NOT IN '
+                '({})'.format(','.join('?' * len(keys))),
+                [clname] + keys)
+            self._write_fields(con, clname, clinfo)
+            self._refresh_summary(con, clname)
+
+    def update(self, clname, fields, remove=()):
+        with self.transaction() as con:
+            self._write_fields(con, clname, fields)
+            con.executemany(
+                'DELETE FROM fields WHERE cluster = ? AND key = ?',
+                [(clname, key) for key in remove])
+            self._refresh_summary(con, clname)
+
+    def modify(self, clname, key, func, default=None):
+        with self.transaction() as con:
+            row = con.execute(
+                'SELECT value FROM fields WHERE cluster = ? AND key = ?',
+                (clname, key)).fetchone()
+            value = func(default if row is None else json.loads(row[0]))
+            self._write_fields(con, clname, {key: value})
+            if key in SUMMARY_FIELDS:
+                self._refresh_summary(con, clname)
+        return value
+
+    def load(self, clname):
+        rows = self._conn().execute(
+            'SELECT key, value FROM fields WHERE cluster = ?',
+            (clname,)).fetchall()
+        if len(rows) == 0:
+            raise FileNotFoundError(clname)
+        return {k: json.loads(v) for k, v in rows}
+
+    def remove(self, clname):
+        with self.transaction() as con:
+            con.execute('DELETE FROM fields WHERE cluster = ?', (clname,))
+            con.execute('DELETE FROM clusters WHERE name = ?', (clname,))
+
+    def append_journal(self, entry):
+        sql = 'INSERT INTO journal ({}) VALUES ({})'.format(
+            ', '.join(JOURNAL_FIELDS), ', '.join('?' * len(JOURNAL_FIELDS)))
+        self._conn().execute(sql, [entry[k] for k in JOURNAL_FIELDS])
+
+    def journal(self, clname, host=None):
+        sql = 'SELECT {} FROM journal WHERE cluster = ?'.format(
+            ', '.join(JOURNAL_FIELDS))
+        args = [clname]
+        if host is not None:
+            sql += ' AND host = ?'
+            args.append(host)
+        rows = self._conn().execute(sql + ' ORDER BY id', args).fetchall()
+        return [dict(zip(JOURNAL_FIELDS, row)) for row in rows]
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store():
+    """설정된 클러스터 상태 저장소."""
+    backend = os.environ.get('BILBO_STATE_BACKEND', DEFAULT_BACKEND)
+    key = (backend, clust_dir)
+    with _stores_lock:
+        if key not in _stores:
+            if backend == 'sqlite':
+                _stores[key] = SQLiteStore(clust_dir)
+            elif backend == 'json':
+                _stores[key] = JSONStore(clust_dir)
+            else:
+                raise RuntimeError("Unknown state backend: '{}'".
+                                   format(backend))
+        return _stores[key]
+
+
+def load_index():
+    """클러스터 인덱스 얻기.
+
+    Returns:
+        dict: 클러스터명 => 요약 정보
+    """
+    return get_store().index()
+
+
+def cluster_info_exists(clname):
+    """클러스터 정보가 존재하는가?"""
+    return get_store().exists(clname)
+
+
+def save_cluster_info(clinfo):
+    """클러스터 정보 전체 쓰기.
+
+    저장소의 기존 정보를 통째로 바꾸기에 클러스터 생성시에만 쓰고, 이후의
+    변경은 update_cluster_info 나 modify_cluster_field 로 한다.
+    """
+    clname = clinfo['name']
+    warning("save_cluster_info: '{}'".format(clname))
+    clinfo['saved_time'] = str(datetime.datetime.now())
+    get_store().save(clinfo)
+
+
+def update_cluster_info(clname, fields, remove=()):
+    """클러스터 정보의 일부 필드만 갱신.
+
+    다른 필드는 읽거나 쓰지 않기에, 같은 클러스터의 다른 필드를 고치는
+    프로세스와 함께 써도 서로의 변경을 덮어쓰지 않는다.
+
+    Args:
+        clname (str): 클러스터명
+        fields (dict): 갱신할 필드
+        remove (list): 제거할 필드명
+    """
+    warning("update_cluster_info: '{}' {} {}".format(clname, list(fields),
+                                                     list(remove)))
+    fields = dict(fields, saved_time=str(datetime.datetime.now()))
+    get_store().update(clname, fields, remove)
+
+
+def modify_cluster_field(clname, key, func, default=None):
+    """클러스터 정보의 필드 하나를 원자적으로 읽고 고쳐 씀.
+
+    Args:
+        clname (str): 클러스터명
+        key (str): 필드명
+        func (callable): 기존 값을 받아 새 값을 돌려주는 함수
+        default: 필드가 없을 때 func 에 전달할 값
+
+    Returns:
+        새 값
+    """
+    return get_store().modify(clname, key, func, default)
+
+
+def remove_cluster_info(clname):
+    """클러스터 정보 제거."""
+    warning("remove_cluster_info: '{}'".format(clname))
+    get_store().remove(clname)
+
+
+def load_cluster_info(clname):
+    """클러스터 정보 읽기."""
+    warning("load_cluster_info: '{}'".format(clname))
+    return get_store().load(clname)
+
+
+def record_command(clname, host, cmd, start, end, excode, out_size):
+    """원격 명령 실행 기록을 명령 기록에 추가.
+
+    클러스터 정보를 고쳐 쓰지 않고 기록만 덧붙인다.
+
+    Args:
+        clname (str): 클러스터명
+        host (str): 대상 인스턴스 IP
+        cmd (str): 커맨드 문자열
+        start (float): 시작 시간 (epoch 초)
+        end (float): 종료 시간 (epoch 초)
+        excode (int): exit code
+        out_size (int): 출력 크기 (바이트)
+    """
+    get_store().append_journal({
+        'cluster': clname, 'host': host, 'cmd': cmd, 'start': start,
+        'end': end, 'duration': end - start, 'excode': excode,
+        'out_size': out_size
+    })
+
+
+def load_journal(clname, host=None, failed=False, since=None):
+    """명령 기록 읽기.
+
+    Args:
+        clname (str): 클러스터명
+        host (str): 이 인스턴스 IP 의 기록만
+        failed (bool): 실패한 명령의 기록만
+        since (float): 이 시간 (epoch 초) 이후 시작한 기록만
+
+    Returns:
+        list: 시작 순서대로 정렬된 기록 리스트
+    """
+    entries = get_store().journal(clname, host)
+    if failed:
+        entries = [e for e in entries if e['excode'] != 0]
+    if since is not None:
+        entries = [e for e in entries if e['start'] >= since]
+    return entries
+
+
+def percentile(values, pct):
+    """nearest-rank 방식의 백분위 값."""
+    if len(values) == 0:
+        return None
+    values = sorted(values)
+    rank = max(int(-(-pct * len(values) // 100)), 1)
+    return values[rank - 1]
+
+
+def summarize_journal(entries):
+    """명령 기록을 호스트별로 집계.
+
+    Returns:
+        dict: 호스트 => count, failed, p50, p95, max, out_size
+    """
+    hosts = {}
+    for entry in entries:
+        hosts.setdefault(entry['host'], []).append(entry)
+    summary = {}
+    for host, hentries in hosts.items():
+        durs = [e['duration'] for e in hentries]
+        summary[host] = {
+            'count': len(hentries),
+            'failed': len([e for e in hentries if e['excode'] != 0]),
+            'p50': percentile(durs, 50),
+            'p95': percentile(durs, 95),
+            'max': max(durs),
+            'out_size': sum(e['out_size'] or 0 for e in hentries)
+        }
+    return summary
+
+
+def _fmt_time(epoch):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(epoch))
+
+
+def show_history(clname, host=None, failed=False, last=None, summary=False,
+                 as_json=False, minutes=None):
+    """클러스터의 원격 명령 기록을 표시.
+
+    Args:
+        clname (str): 클러스터명
+        host (str): 이 인스턴스 IP 의 기록만
+        failed (bool): 실패한 명령의 기록만
+        last (int): 마지막 N 개 기록만
+        summary (bool): 호스트별 횟수, 실패 수, p50/p95/최대 소요 시간 표시
+        as_json (bool): 쉘 도구용 JSON 으로 출력
+        minutes (float): 최근 이 시간 (분) 안에 시작한 기록만
+    """
+    since = None
+    if minutes is not None:
+        since = time.time() - minutes * 60
+    entries = load_journal(clname, host, failed, since)
+    if last is not None:
+        entries = entries[-last:]
+
+    if summary:
+        result = summarize_journal(entries)
+        if as_json:
+            print(json.dumps(result, ensure_ascii=False))
+            return
+        print("HOST\tCOUNT\tFAILED\tP50\tP95\tMAX\tOUTPUT")
+        for h, s in sorted(result.items()):
+            print("{}\t{}\t{}\t{:.2f}\t{:.2f}\t{:.2f}\t{}".format(
+                h, s['count'], s['failed'], s['p50'], s['p95'], s['max'],
+                s['out_size']))
+        return
+
+    if as_json:
+        print(json.dumps(entries, ensure_ascii=False))
+        return
+    for e in entries:
+        print("{}\t{}\t{:.2f}s\t{}\t{}\t{}".format(
+            _fmt_time(e['start']), e['host'], e['duration'], e['excode'],
+            e['out_size'], e['cmd']))
+
+
+def show_all_cluster(long=False, as_json=False):
+    """모든 클러스터를 표시.
+
+    클러스터 파일을 모두 읽지 않고 인덱스를 사용한다.
+
+    Args:
+        long (bool): 타입, 인스턴스 수, 상태, 저장 시간도 표시
+        as_json (bool): 쉘 도구용 JSON 으로 출력
+    """
+    index = load_index()
+    if as_json:
+        entries = [{k: v for k, v in e.items() if k != 'mtime'}
+                   for _, e in sorted(index.items())]
+        print(json.dumps(entries, ensure_ascii=False))
+        return
+
+    for _, entry in sorted(index.items()):
+        name = entry['name']
+        desc = entry.get('description')
+        if long:
+            msg = '{}\t{}\t{}\t{}\t{}'.format(
+                name, entry['type'] or '-', entry['instance_count'],
+                entry['state'] or '-', entry['saved_time'])
+            if desc is not None:
+                msg += '\t{}'.format(desc)
+        elif desc is not None:
+            msg = '{} : {}'.format(name, desc)
+        else:
+            msg = name
+        print(msg)
+
+
+def check_cluster(clname):
+    """프로파일을 확인.
+
+    Args:
+        clname (str): 클러스터명 (.json 확장자 제외)
+    """
+    info(f"check_cluster {clname}")
+    if clname.lower().endswith('.json'):
+        rname = '.'.join(clname.split('.')[0:-1])
+        msg = "Wrong cluster name '{}'. Use '{}' instead.". \
+              format(clname, rname)
+        raise NameError(msg)
+
+    # existence
+    if not cluster_info_exists(clname):
+        error("Cluster '{}' does not exist.".format(clname))
+        raise(FileNotFoundError(clname))
+
+
+def show_cluster(clname, detail=False):
+    """클러스터 정보를 표시."""
+    warning(f"show_cluster {clname}")
+    check_cluster(clname)
+    if detail:
+        clinfo = load_cluster_info(clname)
+        pprint(clinfo)
+        return
+
+    clinfo = load_cluster_info(clname)
+
+    print()
+    print("Cluster Name: {}".format(clinfo['name']))
+    print("Ready Time: {}".format(clinfo['saved_time']))
+
+    insts = clinfo['instance']
+    idx = 1
+    if 'notebook' in insts:
+        print()
+        print("Notebook:")
+        idx = show_instance(idx, insts['notebook'])
+        print()
+
+    if 'type' in clinfo:
+        cltype = clinfo['type']
+        print("Cluster Type: {}".format(cltype))
+        if cltype == 'dask':
+            show_dask_cluster(idx, clinfo)
+        else:
+            raise NotImplementedError()
+    print()
+
+
+def show_instance(idx, inst):
+    print("  [{}] instance_id: {}, public_ip: {}, private_ip: {}".
+          format(idx, inst['instance_id'], inst.get('public_ip'),
+                 inst.get('private_ip')))
+    return idx + 1
+
+
+def show_dask_cluster(idx, clinfo):
+    """Dask 클러스터 표시."""
+    print()
+    insts = clinfo['instance']
+    print("Scheduler:")
+    scd = insts['scheduler']
+    idx = show_instance(idx, scd)
+    print("       {}".format(get_dask_scheduler_address(clinfo)))
+
+    print()
+    print("Workers:")
+    wrks = insts['workers']
+    for wrk in wrks:
+        idx = show_instance(idx, wrk)
+
+
+def check_dup_cluster(clname):
+    """클러스터 이름이 겹치는지 검사."""
+    if cluster_info_exists(clname):
+        raise NameError("Cluster '{}' already exist.".format(clname))
+
+
+def get_dask_scheduler_address(clinfo):
+    dns = clinfo['instance']['scheduler']['private_dns_name']
+    return "DASK_SCHEDULER_ADDRESS=tcp://{}:8786".format(dns)
@@ -0,0 +1,434 @@
+"""파일 동기화 모듈.
+
+로컬과 원격의 파일 해쉬를 비교해 바뀐 파일만 SFTP 로 전송한다. 전송용
+연결은 압축을 켜고, 여러 SFTP 세션으로 파일을 동시에 주고 받는다.
+"""
+import io
+import os
+import shlex
+import hashlib
+import posixpath
+from secrets import token_hex
+from concurrent.futures import ThreadPoolExecutor
+
+import paramiko
+
+from bilbo.ssh import get_pool, open_channel, read_channel
+from bilbo.parallel import run_parallel
+from bilbo.util import info, warning
+
+HASH_CHUNK = 1024 * 1024
+DEFAULT_WIDTH = 8
+
+
+def file_hash(path):
+    """파일의 SHA-256 해쉬."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def remote_dir(path):
+    """SFTP 에서 쓸 수 있도록 `~` 로 시작하는 원격 경로를 홈 기준으로."""
+    if path == '~':
+        return '.'
+    if path.startswith('~/'):
+        return path[2:]
+    return path
+
+
+def local_manifest(base, name):
+    """로컬 파일들의 해쉬.
+
+    Args:
+        base (str): 기준 디렉토리
+        name (str): 기준 디렉토리 아래 파일 또는 디렉토리 이름
+
+    Returns:
+        dict: 기준 디렉토리에 대한 상대 경로 (/ 구분) => (해쉬, 크기)
+    """
+    top = os.path.join(base, name)
+    if os.path.isfile(top):
+        return {name: (file_hash(top), os.path.getsize(top))}
+
+    manifest = {}
+    for dirpath, _, fnames in os.walk(top):
+        for fname in fnames:
+            path = os.path.join(dirpath, fname)
+            rel = os.path.relpath(path, base).replace(os.sep, '/')
+            manifest[rel] = (file_hash(path), os.path.getsize(path))
+    return manifest
+
+
+def parse_sha256sum(lines):
+    """sha256sum 출력을 상대 경로 => 해쉬로 변환."""
+    hashes = {}
+    for line in lines:
+        line = line.rstrip('\n')
+        # 특수 문자가 있어 이스케이프된 이름은 항상 다시 전송
+        if len(line) < 66 or line.startswith('\\'):
+            continue
+        hashes[line[66:]] = line[:64]
+    return hashes
+
+
+def remote_manifest(user, private_key, host, base, name):
+    """원격 파일들의 해쉬를 한 번의 명령으로 얻기.
+
+    Returns:
+        dict: 기준 디렉토리에 대한 상대 경로 => 해쉬
+    """
+    cmd = "cd {} 2>/dev/null && find {} -type f -exec sha256sum {{}} + " \
+          "2>/dev/null".format(shlex.quote(remote_dir(base)),
+                               shlex.quote(name))
+    channel = open_channel(user, private_key, host)
+    if channel is None:
+        raise RuntimeError("Can not connect to '{}'.".format(host))
+    chunks = []
+    channel.exec_command(cmd)
+    read_channel(channel, chunks.append)
+    channel.close()
+    return parse_sha256sum(''.join(chunks).split('\n'))
+
+
+def changed_files(src, dst):
+    """원본 중 대상에 없거나 해쉬가 다른 파일들.
+
+    Args:
+        src (dict): 상대 경로 => (해쉬, 크기)
+        dst (dict): 상대 경로 => 해쉬
+
+    Returns:
+        list: 큰 파일부터 정렬된 상대 경로 리스트
+    """
+    changed = [rel for rel, (h, _) in src.items() if dst.get(rel) != h]
+    return sorted(changed, key=lambda rel: -src[rel][1])
+
+
+def split_batches(files, sizes, width):
+    """전송할 파일들을 크기가 비슷한 묶음으로 나눔.
+
+    Args:
+        files (list): 큰 파일부터 정렬된 상대 경로 리스트
+        sizes (dict): 상대 경로 => 크기
+        width (int): 묶음 수
+
+    Returns:
+        list: 상대 경로 리스트의 리스트
+    """
+    width = max(1, min(width, len(files)))
+    batches = [[] for _ in range(width)]
+    loads = [0] * width
+    for rel in files:
+        i = loads.index(min(loads))
+        batches[i].append(rel)
+        loads[i] += sizes[rel]
+    return batches
+
+
+def _run_batches(user, private_key, host, batches, func):
+    """묶음마다 SFTP 세션을 열어 동시에 전송.
+
+    모든 세션은 풀의 압축된 연결 하나를 공유한다.
+    """
+    with get_pool().hold(user, private_key, host, compress=True) as client:
+        if client is None:
+            raise RuntimeError("Can not connect to '{}'.".format(host))
+
+        def _transfer(batch):
+            sftp = client.open_sftp()
+            try:
+                for rel in batch:
+                    func(sftp, rel)
+            finally:
+                sftp.close()
+
+        with ThreadPoolExecutor(max_workers=len(batches)) as exe:
+            for fut in [exe.submit(_transfer, b) for b in batches]:
+                fut.result()
+
+
+def push_files(user, private_key, host, local_path, remote_base,
+               width=DEFAULT_WIDTH):
+    """로컬 파일 또는 디렉토리를 원격 디렉토리 아래로 동기화.
+
+    Args:
+        user (str): SSH 유저
+        private_key (str): SSH Private Key 경로
+        host (str): 대상 호스트
+        local_path (str): 로컬 파일 또는 디렉토리
+        remote_base (str): 원격 디렉토리. 이 아래에 같은 이름으로 전송
+        width (int): 동시 전송 수
+
+    Returns:
+        dict: files (전송한 파일 수), bytes (전송한 크기), skipped (같아서
+            건너뛴 파일 수)
+    """
+    local_path = os.path.abspath(os.path.expanduser(local_path))
+    if not os.path.exists(local_path):
+        raise FileNotFoundError(local_path)
+    base, name = os.path.split(local_path.rstrip(os.sep))
+    src = local_manifest(base, name)
+    dst = remote_manifest(user, private_key, host, remote_base, name)
+    files = changed_files(src, dst)
+    info("push_files: {} of {} file(s) changed on {}".
+         format(len(files), len(src), host))
+    stat = dict(files=len(files), skipped=len(src) - len(files),
+                bytes=sum(src[rel][1] for rel in files))
+    if len(files) == 0:
+        return stat
+
+    # 필요한 원격 디렉토리를 한 번에 만듦
+    rbase = remote_dir(remote_base)
+    dirs = sorted(set(posixpath.dirname(posixpath.join(rbase, rel))
+                      for rel in files))
+    channel = open_channel(user, private_key, host)
+    if channel is None:
+        raise RuntimeError("Can not connect to '{}'.".format(host))
+    channel.exec_command('mkdir -p ' + ' '.join(shlex.quote(d)
+                                                for d in dirs))
+    if read_channel(channel) != 0:
+        raise RuntimeError("Can not make directories on '{}'.".format(host))
+    channel.close()
+
+    def _put(sftp, rel):
+        sftp.put(os.path.join(base, *rel.split('/')),
+                 posixpath.join(rbase, rel))
+
+    sizes = {rel: size for rel, (_, size) in src.items()}
+    _run_batches(user, private_key, host, split_batches(files, sizes, width),
+                 _put)
+    return stat
+
+
+def pull_files(user, private_key, host, remote_path, local_base,
+               width=DEFAULT_WIDTH):
+    """원격 파일 또는 디렉토리를 로컬 디렉토리 아래로 동기화.
+
+    Args:
+        user (str): SSH 유저
+        private_key (str): SSH Private Key 경로
+        host (str): 대상 호스트
+        remote_path (str): 원격 파일 또는 디렉토리
+        local_base (str): 로컬 디렉토리. 이 아래에 같은 이름으로 전송
+        width (int): 동시 전송 수
+
+    Returns:
+        dict: files (전송한 파일 수), bytes (전송한 크기), skipped (같아서
+            건너뛴 파일 수)
+    """
+    base, name = posixpath.split(remote_path.rstrip('/'))
+    src = remote_manifest(user, private_key, host, base or '.', name)
+    if len(src) == 0:
+        raise FileNotFoundError("{}:{}".format(host, remote_path))
+    local_base = os.path.abspath(os.path.expanduser(local_base))
+    dst = {}
+    for rel in src:
+        path = os.path.join(local_base, *rel.split('/'))
+        if os.path.isfile(path):
+            dst[rel] = file_hash(path)
+    files = [rel for rel, h in src.items() if dst.get(rel) != h]
+    info("pull_files: {} of {} file(s) changed on {}".
+         format(len(files), len(src), host))
+    stat = dict(files=len(files), skipped=len(src) - len(files), bytes=0)
+    if len(files) == 0:
+        return stat
+
+    rbase = remote_dir(base or '.')
+    for rel in files:
+        os.makedirs(os.path.join(local_base, *rel.split('/')[:-1]),
+                    exist_ok=True)
+
+    def _get(sftp, rel):
+        path = os.path.join(local_base, *rel.split('/'))
+        sftp.get(posixpath.join(rbase, rel), path)
+
+    # 원격 크기를 모르므로 개수로 나눔
+    sizes = {rel: 1 for rel in files}
+    _run_batches(user, private_key, host, split_batches(files, sizes, width),
+                 _get)
+    for rel in files:
+        path = os.path.join(local_base, *rel.split('/'))
+        stat['bytes'] += os.path.getsize(path)
+        if file_hash(path) != src[rel]:
+            warning("Checksum mismatch for '{}'.".format(path))
+    return stat
+
+
+RELAY_KEY = '.bilbo_relay_key'
+RELAY_KEY_BITS = 2048
+RELAY_SSH_OPTS = "-i ~/{} -o StrictHostKeyChecking=no " \
+    "-o UserKnownHostsFile=/dev/null -o LogLevel=ERROR -o BatchMode=yes " \
+    "-o ControlMaster=auto -o ControlPath=/tmp/bilbo-relay-%r@%h:%p " \
+    "-o ControlPersist=60".format(RELAY_KEY)
+
+
+def relay_rounds(cnt):
+    """한 곳에서 시작해 cnt 개 수신자에게 전달하는 트리의 라운드.
+
+    라운드마다 파일을 가진 모든 호스트가 아직 받지 못한 호스트 하나에 전송
+    하기에, 파일을 가진 호스트가 두 배씩 늘어나 라운드 수는 log2(cnt + 1)
+    정도가 된다.
+
+    Args:
+        cnt (int): 수신자 수
+
+    Returns:
+        list: 라운드별 (송신자, 수신자) 리스트. 0 은 시작 호스트, 1 부터는
+            수신자 번호
+    """
+    rounds = []
+    holders = [0]
+    nxt = 1
+    while nxt <= cnt:
+        edges = []
+        for sender in holders:
+            if nxt > cnt:
+                break
+            edges.append((sender, nxt))
+            nxt += 1
+        holders += [r for _, r in edges]
+        rounds.append(edges)
+    return rounds
+
+
+def relay_keypair():
+    """전달에만 쓰는 임시 키 쌍 생성.
+
+    Returns:
+        tuple: (Private key 문자열, authorized_keys 에 넣을 공개키 줄,
+            공개키 줄 끝의 식별 주석)
+    """
+    key = paramiko.RSAKey.generate(RELAY_KEY_BITS)
+    buf = io.StringIO()
+    key.write_private_key(buf)
+    tag = 'bilbo-relay-{}'.format(token_hex(8))
+    pub = '{} {} {}'.format(key.get_name(), key.get_base64(), tag)
+    return buf.getvalue(), pub, tag
+
+
+def authorize_cmd(pub):
+    """공개키를 authorized_keys 에 추가하는 명령."""
+    return "mkdir -p ~/.ssh && chmod 700 ~/.ssh && " \
+        "echo {} >> ~/.ssh/authorized_keys".format(shlex.quote(pub))
+
+
+def unauthorize_cmd(tag):
+    """임시 키를 지우고 authorized_keys 에서 공개키를 빼는 명령."""
+    return "rm -f ~/{}; sed -i {} ~/.ssh/authorized_keys".format(
+        RELAY_KEY, shlex.quote('/ {}$/d'.format(tag)))
+
+
+def relay_cmd(path, digest, user, private_ip, dest_path=None):
+    """송신 호스트에서 실행해 수신 호스트로 파일과 임시 키를 전달하고,
+    수신 호스트에서 체크섬을 확인하는 명령.
+
+    Args:
+        path (str): 송신 호스트의 홈 기준 원격 파일 경로
+        digest (str): 파일의 SHA-256 해쉬
+        user (str): 수신 호스트의 SSH 유저
+        private_ip (str): 수신 호스트의 Private IP
+        dest_path (str): 수신 호스트의 홈 기준 파일 경로. 기본은 path
+    """
+    dest = '{}@{}'.format(user, private_ip)
+    dest_path = dest_path or path
+    rdir = posixpath.dirname(dest_path) or '.'
+    check = "echo {} | sha256sum -c --quiet".format(
+        shlex.quote('{}  {}'.format(digest, dest_path)))
+    return " && ".join([
+        "ssh {} {} {}".format(RELAY_SSH_OPTS, dest, shlex.quote(
+            'mkdir -p {}'.format(shlex.quote(rdir)))),
+        "scp -q -p {} ~/{} {}:{}".format(RELAY_SSH_OPTS, RELAY_KEY, dest,
+                                         RELAY_KEY),
+        "scp -q {} {} {}:{}".format(RELAY_SSH_OPTS, shlex.quote(path), dest,
+                                    shlex.quote(dest_path)),
+        "ssh {} {} {}".format(RELAY_SSH_OPTS, dest, shlex.quote(check))
+    ])
+
+
+def _exec(host, cmd):
+    """호스트에서 명령을 실행하고 실패하면 예외 발생."""
+    channel = open_channel(host['user'], host['key'], host['addr'])
+    if channel is None:
+        raise RuntimeError("Can not connect to '{}'.".format(host['addr']))
+    errs = []
+    channel.exec_command(cmd)
+    excode = read_channel(channel, None, errs.append)
+    channel.close()
+    if excode != 0:
+        raise RuntimeError("exit {}: {}".format(excode, ''.join(errs).strip()))
+
+
+def broadcast_file(root, receivers, local_path, remote_base, width):
+    """파일을 시작 호스트에 한 번 올린 뒤 트리 형태로 수신자들에 전달.
+
+    수신자 사이의 전달은 VPC 내부망 (Private IP) 으로 scp 를 이용한다.
+    이를 위해 이번 전달에만 쓰는 임시 키 쌍을 만들어, 공개키는 수신자들의
+    authorized_keys 에 넣고 Private key 는 파일을 가진 호스트에 둔다.
+    전달이 끝나면 둘 다 지운다. 사용자의 SSH 키는 호스트에 복사하지 않는다.
+
+    Args:
+        root (dict): 시작 호스트. addr (접속 IP), user, key, private_ip 와
+            선택적으로 호스트별 원격 디렉토리 base
+        receivers (list): 수신 호스트 리스트. 시작 호스트와 같은 형식
+        local_path (str): 로컬 파일
+        remote_base (str): base 가 없는 호스트의 원격 디렉토리. 이 아래에
+            같은 이름으로 전송
+        width (int): 동시 전달 수
+
+    Returns:
+        list: 전달에 실패한 수신 호스트의 addr 리스트
+    """
+    local_path = os.path.abspath(os.path.expanduser(local_path))
+    if not os.path.isfile(local_path):
+        raise FileNotFoundError(local_path)
+    digest = file_hash(local_path)
+
+    def _path(host):
+        return posixpath.join(remote_dir(host.get('base', remote_base)),
+                              os.path.basename(local_path))
+
+    push_files(root['user'], root['key'], root['addr'], local_path,
+               root.get('base', remote_base))
+    if len(receivers) == 0:
+        return []
+
+    hosts = [root] + list(receivers)
+    done = {0}
+    failed = []
+    pkey, pub, tag = relay_keypair()
+    try:
+        jobs = [(h['addr'], _exec, (h, authorize_cmd(pub)))
+                for h in receivers]
+        run_parallel(jobs, width, False, "Authorize relay key")
+        # 시작 호스트에 임시 Private key
+        with get_pool().hold(root['user'], root['key'], root['addr'],
+                             compress=True) as client:
+            sftp = client.open_sftp()
+            sftp.putfo(io.BytesIO(pkey.encode('utf-8')), RELAY_KEY)
+            sftp.chmod(RELAY_KEY, 0o600)
+            sftp.close()
+
+        for rnd, edges in enumerate(relay_rounds(len(receivers))):
+            # 앞 라운드에서 실패한 송신자의 몫은 받은 호스트들이 나눠 맡음
+            senders = sorted(done)
+            jobs = []
+            for i, (_, rcv) in enumerate(edges):
+                snd = hosts[senders[i % len(senders)]]
+                cmd = relay_cmd(_path(snd), digest, hosts[rcv]['user'],
+                                hosts[rcv]['private_ip'], _path(hosts[rcv]))
+                jobs.append((hosts[rcv]['addr'], _exec, (snd, cmd)))
+            results = run_parallel(jobs, width, False,
+                                   "Broadcast round {}".format(rnd + 1))
+            for _, rcv in edges:
+                if results[hosts[rcv]['addr']]['error'] is None:
+                    done.add(rcv)
+                else:
+                    failed.append(hosts[rcv]['addr'])
+    finally:
+        jobs = [(h['addr'], _exec, (h, unauthorize_cmd(tag)))
+                for h in hosts]
+        run_parallel(jobs, width, False, "Remove relay key")
+    return failed
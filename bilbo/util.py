@@ -1,6 +1,8 @@
 """각종 유틸리티 함수."""
 import os
 import sys
+import time
+import random
 import logging
 from configparser import ConfigParser
 from logging.handlers import RotatingFileHandler
@@ -9,7 +11,6 @@ import json
 
 
 LOG_FILE = 'bilbo_log.txt'
-RCMD_DONE_FILE = '/tmp/bilbo_rcmd_done'
 CTRL_C_EXCODE = 130
 PARAM_PTRN = re.compile(r'^([\w\.]+)=(.+)?$')
 
@@ -20,6 +21,10 @@ log_dir = os.path.join(bilbo_dir, 'logs')
 log_path = os.path.join(log_dir, LOG_FILE)
 prof_dir = os.path.join(bilbo_dir, 'profiles')
 clust_dir = os.path.join(bilbo_dir, 'clusters')
+cache_dir = os.path.join(bilbo_dir, 'cache')
+
+_dirs_checked = False
+_log_configured = False
 
 
 def pprint(data):
@@ -39,8 +44,12 @@ def make_dir(dir_name, log=True):
         sys.exit(-1)
 
 
-def _check_dirs():
+def check_dirs():
     """필요한 디렉토리 체크."""
+    global _dirs_checked
+    if _dirs_checked:
+        return
+    _dirs_checked = True
     if not os.path.isdir(bilbo_dir):
         make_dir(bilbo_dir, False)
     if not os.path.isdir(log_dir):
@@ -49,9 +58,8 @@ def _check_dirs():
         make_dir(prof_dir, False)
     if not os.path.isdir(clust_dir):
         make_dir(clust_dir, False)
-
-
-_check_dirs()
+    if not os.path.isdir(cache_dir):
+        make_dir(cache_dir, False)
 
 
 def log_level_from_verbosity(verbosity):
@@ -75,12 +83,26 @@ def query_stream_log_handler(logger):
 
 
 def set_log_verbosity(verbosity):
-    """Verbosity로 로그 레벨 지정."""
+    """Verbosity로 로그 레벨 지정.
+
+    로그 핸들러는 프로세스에서 한 번만 설치하며, 로그 파일은 처음 기록할
+    때 열린다.
+    """
+    global _log_configured
+    check_dirs()
     level = log_level_from_verbosity(verbosity)
+    if _log_configured:
+        for handler in logging.getLogger().handlers:
+            if type(handler) is logging.StreamHandler:
+                handler.setLevel(level)
+        return
+    _log_configured = True
+
     rotfile = RotatingFileHandler(
         log_path,
         maxBytes=1024 * 1024 * 10,
-        backupCount=10
+        backupCount=10,
+        delay=True
     )
     rotfile.setLevel(logging.INFO)
 
@@ -196,3 +218,31 @@ def get_aws_config_from_envvars():
     sa = os.environ['AWS_SECRET_ACCESS_KEY']
     dr = os.environ['AWS_DEFAULT_REGION']
     return ak, sa, dr
+
+
+def backoff_wait(deadline, base=0.5, cap=10, factor=2):
+    """마감 시간까지 지수 백오프와 지터로 기다리며 반복.
+
+    처음에는 바로, 이후에는 기다린 뒤 시도 번호를 생성한다. 기다리는 시간은
+    base 부터 factor 배씩 cap 까지 늘어나며, 여러 호스트가 같은 시점에
+    몰리지 않도록 절반 ~ 전체 사이의 임의 값을 쓴다.
+
+    Args:
+        deadline (float): 마감 시간 (epoch 초)
+        base (float): 처음 기다릴 시간 (초)
+        cap (float): 최대로 기다릴 시간 (초)
+        factor (float): 기다릴 시간의 증가 배수
+
+    Yields:
+        int: 시도 번호
+    """
+    delay = base
+    attempt = 0
+    while True:
+        yield attempt
+        attempt += 1
+        remain = deadline - time.time()
+        if remain <= 0:
+            return
+        time.sleep(min(random.uniform(delay / 2, delay), remain))
+        delay = min(delay * factor, cap)
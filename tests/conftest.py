@@ -0,0 +1,126 @@
+import pytest
+
+import bilbo.cluster
+import bilbo.state
+from bilbo.state import save_cluster_info
+
+TPL = {'ssh_user': 'ubuntu', 'ssh_private_key': '~/.ssh/key.pem',
+       'ami': 'ami-0', 'ec2type': 'm5.large', 'keyname': 'k',
+       'security_group': 'sg-0'}
+
+
+class FakeInstance:
+    def __init__(self, iid):
+        self.instance_id = iid
+
+
+class FakeEC2:
+    """인스턴스 생성/제거 요청을 기록하는 EC2 리소스 겸 클라이언트.
+
+    `capacity` 에 타입별 남은 용량을 넣으면 Fleet 요청은 그만큼만 생성한다.
+    """
+
+    def __init__(self):
+        self.meta = self
+        self.client = self
+        self.created = []
+        self.terminated = []
+        self.types = {}
+        self.capacity = None
+        self.templates = []
+
+    def _launch(self, cnt, ec2type):
+        start = len(self.created)
+        insts = [FakeInstance('i-new{}'.format(i))
+                 for i in range(start, start + cnt)]
+        for inst in insts:
+            self.types[inst.instance_id] = ec2type
+        self.created += insts
+        return insts
+
+    def create_instances(self, **kwargs):
+        return self._launch(kwargs['MaxCount'], kwargs['InstanceType'])
+
+    def Instance(self, iid):
+        return FakeInstance(iid)
+
+    def create_launch_template(self, LaunchTemplateName, LaunchTemplateData):
+        self.templates.append(LaunchTemplateName)
+        return {'LaunchTemplate': {'LaunchTemplateId': LaunchTemplateName}}
+
+    def delete_launch_template(self, LaunchTemplateId):
+        self.templates.remove(LaunchTemplateId)
+
+    def create_fleet(self, **kwargs):
+        remain = kwargs['TargetCapacitySpecification']['TotalTargetCapacity']
+        overrides = kwargs['LaunchTemplateConfigs'][0]['Overrides']
+        launched, errors = [], []
+        for over in sorted(overrides, key=lambda o: o['Priority']):
+            ec2type = over['InstanceType']
+            cnt = remain
+            if self.capacity is not None:
+                cnt = min(remain, self.capacity.get(ec2type, 0))
+                self.capacity[ec2type] = self.capacity.get(ec2type, 0) - cnt
+            if cnt == 0:
+                errors.append({'LaunchTemplateAndOverrides': {
+                    'Overrides': over},
+                    'ErrorCode': 'InsufficientInstanceCapacity'})
+                continue
+            insts = self._launch(cnt, ec2type)
+            launched.append({'InstanceIds': [i.instance_id for i in insts],
+                             'InstanceType': ec2type})
+            remain -= cnt
+            if remain == 0:
+                break
+        return {'Instances': launched, 'Errors': errors}
+
+    def terminate_instances(self, InstanceIds):
+        self.terminated += InstanceIds
+
+    def describe(self, iid):
+        num = int(iid[5:])
+        return {'InstanceId': iid, 'InstanceType': self.types[iid],
+                'PublicIpAddress': '1.0.2.{}'.format(num),
+                'PrivateIpAddress': '10.0.2.{}'.format(num),
+                'PrivateDnsName': 'ip-10-0-2-{}'.format(num)}
+
+
+@pytest.fixture
+def dask_cluster(tmp_path, monkeypatch):
+    """워커 2 개짜리 Dask 클러스터와 EC2, 원격 명령 스텁."""
+    monkeypatch.setattr(bilbo.state, 'clust_dir', str(tmp_path))
+    ec2 = FakeEC2()
+    monkeypatch.setattr(bilbo.cluster, 'get_resource', lambda *a, **k: ec2)
+    monkeypatch.setattr(bilbo.cluster, 'get_client', lambda *a, **k: ec2)
+    monkeypatch.setattr(bilbo.cluster, 'wait_instances_running',
+                        lambda client, ids, on_ready=None:
+                        {iid: ec2.describe(iid) for iid in ids})
+    ec2.started = []
+    ec2.cmds = []
+
+    def _start(clinfo, wrks, init=True):
+        ec2.started += [wrk['private_ip'] for wrk in wrks]
+
+    def _send(user, key, ip, cmd, **kwargs):
+        ec2.cmds.append((ip, cmd))
+        return ['1'], '', 0
+
+    monkeypatch.setattr(bilbo.cluster, 'start_dask_workers', _start)
+    monkeypatch.setattr(bilbo.cluster, 'wait_dask_workers', lambda c: None)
+    monkeypatch.setattr(bilbo.cluster, 'send_instance_cmd', _send)
+    wtpl = dict(TPL, count=2, nproc=2, nthread=1, memory=1024)
+    save_cluster_info({
+        'name': 'sc',
+        'type': 'dask',
+        'profile': {'dask': {}},
+        'template': {'scheduler': TPL, 'worker': wtpl},
+        'instance': {
+            'scheduler': {'instance_id': 'i-sc', 'public_ip': '1.0.0.2',
+                          'private_ip': '10.0.0.2'},
+            'workers': [{'instance_id': 'i-w{}'.format(i),
+                         'public_ip': '1.0.1.{}'.format(i),
+                         'private_ip': '10.0.1.{}'.format(i)}
+                        for i in range(2)]
+        }
+    })
+    return ec2
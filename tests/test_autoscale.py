@@ -0,0 +1,120 @@
+import json
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+import bilbo.autoscale
+from bilbo.autoscale import decide, load_metrics, autoscale_cluster, \
+    autoscale_options, load_decisions, AUTOSCALE_DEFAULTS
+from bilbo.state import load_cluster_info, save_cluster_info
+
+
+def _identity(nworker, ready=0, executing=0, memory=0):
+    """워커마다 쓰레드 2 개, 메모리 한도 1000 인 스케쥴러 정보."""
+    workers = {}
+    for i in range(nworker):
+        workers['tcp://10.0.1.{}:40000'.format(i)] = {
+            'nthreads': 2, 'memory_limit': 1000,
+            'metrics': {'ready': ready, 'executing': executing,
+                        'memory': memory}}
+    return {'type': 'Scheduler', 'workers': workers}
+
+
+BUSY = _identity(2, ready=10, executing=2, memory=300)
+IDLE = _identity(2, memory=100)
+
+
+def test_load_metrics():
+    metrics = load_metrics(BUSY)
+    assert metrics == {'workers': 2, 'threads': 4, 'backlog': 20,
+                       'occupancy': 1.0, 'memory': 0.3}
+    assert load_metrics({'workers': {}})['occupancy'] == 0.0
+
+
+def test_decide():
+    """늘리는 기준과 줄이는 기준, 쿨다운."""
+    opts = dict(AUTOSCALE_DEFAULTS, min=2, max=10)
+    busy, idle = load_metrics(BUSY), load_metrics(IDLE)
+    state = {}
+    # 쓰레드당 대기 작업 5 개 => 2.5 배, 한 번에 최대 두 배
+    assert decide(busy, 2, opts, state, 1000) == (4, 'busy')
+    assert decide(busy, 10, opts, state, 1000) == (10, 'busy at max')
+    state['last_up'] = 1000
+    assert decide(busy, 4, opts, state, 1060) == (4, 'busy in cooldown')
+    assert decide(busy, 4, opts, state, 1200)[1] == 'busy'
+
+    # 한가한 상태가 이어져야 줄임
+    state = {'last_up': 0}
+    for i in range(opts['idle_polls'] - 1):
+        assert decide(idle, 8, opts, state, 5000) == (8, 'steady')
+    assert decide(idle, 8, opts, state, 5000) == (6, 'idle')
+    assert decide(idle, 2, opts, state, 5000) == (2, 'idle at min')
+    state['last_down'] = 4800
+    assert decide(idle, 6, opts, state, 5000) == (6, 'idle in cooldown')
+    # 바쁘지도 한가하지도 않으면 유지
+    mid = load_metrics(_identity(2, ready=2, executing=2, memory=500))
+    assert decide(mid, 6, opts, state, 9000) == (6, 'steady')
+    assert state['idle'] == 0
+
+    assert decide(idle, 1, opts, {}, 0) == (2, 'below min')
+    assert decide(busy, 12, opts, {}, 0) == (10, 'above max')
+
+
+def test_autoscale_options():
+    clinfo = {'profile': {'dask': {'autoscale': {'min': 2, 'max': 4,
+                                                 'idle_polls': 5}}}}
+    opts = autoscale_options(clinfo, max_worker=8)
+    assert (opts['min'], opts['max'], opts['idle_polls']) == (2, 8, 5)
+    with pytest.raises(RuntimeError):
+        autoscale_options(clinfo, min_worker=10)
+    with pytest.raises(RuntimeError):
+        autoscale_options({'profile': {}})
+
+
+@pytest.fixture
+def metrics_server():
+    """요청마다 정해진 순서로 스케쥴러 정보를 돌려주는 가짜 엔드포인트."""
+    seq = []
+
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            assert self.path == '/json/identity.json'
+            body = json.dumps(seq.pop(0) if len(seq) > 1 else seq[0])
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(body.encode('utf-8'))
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), _Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.seq = seq
+    server.url = 'http://127.0.0.1:{}'.format(server.server_port)
+    yield server
+    server.shutdown()
+
+
+def test_autoscale_cluster(dask_cluster, metrics_server, monkeypatch,
+                           tmp_path):
+    """부하에 따라 늘리고 줄이며 결정을 기록."""
+    monkeypatch.setattr(bilbo.autoscale, 'log_dir', str(tmp_path))
+    monkeypatch.setattr(bilbo.autoscale.time, 'sleep', lambda sec: None)
+    clinfo = load_cluster_info('sc')
+    clinfo['dask_dashboard_url'] = metrics_server.url
+    clinfo['profile']['dask']['autoscale'] = {
+        'up_cooldown': 0, 'down_cooldown': 0, 'idle_polls': 2}
+    save_cluster_info(clinfo)
+    metrics_server.seq.extend([BUSY, IDLE, IDLE, IDLE])
+
+    autoscale_cluster('sc', 2, 6, rounds=4)
+    assert len(dask_cluster.created) == 2
+    assert dask_cluster.terminated == ['i-new1']
+    decisions = load_decisions('sc')
+    assert [(d['current'], d['target'], d['reason'])
+            for d in decisions] == [(2, 4, 'busy'), (4, 3, 'idle')]
+    assert decisions[0]['backlog'] == 20
+    assert len(load_cluster_info('sc')['instance']['workers']) == 3
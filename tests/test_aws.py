@@ -0,0 +1,54 @@
+import threading
+
+from bilbo.aws import get_client, get_resource, get_session, aws_options, \
+    reset, DEFAULT_MAX_POOL
+
+
+def test_shared_client():
+    """같은 서비스, 리전에는 같은 클라이언트를 여러 쓰레드에서 공유."""
+    reset()
+    clients = []
+
+    def _get():
+        clients.append(get_client('ec2', 'us-east-1'))
+
+    threads = [threading.Thread(target=_get) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(id(c) for c in clients)) == 1
+    client = clients[0]
+    assert client.meta.region_name == 'us-east-1'
+    assert client.meta.config.retries['mode'] == 'adaptive'
+    assert client.meta.config.max_pool_connections == DEFAULT_MAX_POOL
+
+    # 리전이나 연결 수가 다르면 다른 클라이언트
+    other = get_client('ec2', 'ap-northeast-2', max_pool=100)
+    assert other is not client
+    assert other.meta.region_name == 'ap-northeast-2'
+    assert other.meta.config.max_pool_connections == 100
+    assert get_session('us-east-1') is get_session('us-east-1')
+
+
+def test_resource_per_thread():
+    """리소스는 쓰레드별로 만듦."""
+    reset()
+    main = get_resource('ec2', 'us-east-1')
+    assert get_resource('ec2', 'us-east-1') is main
+    others = []
+    thread = threading.Thread(
+        target=lambda: others.append(get_resource('ec2', 'us-east-1')))
+    thread.start()
+    thread.join()
+    assert others[0] is not main
+    assert others[0].meta.client.meta.region_name == 'us-east-1'
+
+
+def test_aws_options():
+    clinfo = {'profile': {}}
+    assert aws_options(clinfo) == {'region': None,
+                                   'max_pool': DEFAULT_MAX_POOL}
+    clinfo = {'profile': {'aws': {'region': 'us-west-2',
+                                  'max_pool_connections': 64}}}
+    assert aws_options(clinfo) == {'region': 'us-west-2', 'max_pool': 64}
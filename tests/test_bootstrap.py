@@ -0,0 +1,156 @@
+import os
+import shlex
+import subprocess
+
+import pytest
+
+import bilbo.bootstrap
+from bilbo.bootstrap import run_bootstrap, parse_report, step_name, \
+    service_cmd, match_service_log, EXIT_MARK, JUPYTER_URL_PTRN, \
+    SCHEDULER_PTRN, WORKER_PTRN, wait_service
+from bilbo.cluster import public_url
+
+
+def _local_send_cmd(home):
+    """원격 명령 대신 로컬 bash 로 실행."""
+    calls = []
+
+    def _send(user, key, ip, cmd, show_stderr=True, get_excode=False):
+        calls.append(cmd)
+        env = dict(os.environ, HOME=str(home))
+        ret = subprocess.run(['bash', '-c', cmd], env=env,
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        return ret.stdout.decode().split('\n'), ret.stderr.decode(), \
+            ret.returncode
+    _send.calls = calls
+    return _send
+
+
+def test_bootstrap(tmp_path):
+    """모든 단계를 한 번의 명령으로 실행하고 단계별로 보고."""
+    send = _local_send_cmd(tmp_path)
+    steps = [('workdir', 'mkdir -p ~/works && cd ~/works'),
+             ('write', "echo 'it''s ok' > ~/works/a.txt"),
+             ('init_cmd[1]', 'pwd > ~/pwd.txt')]
+    report = run_bootstrap('ubuntu', 'key', 'ip', 'notebook', steps, send)
+    assert len(send.calls) == 1
+    assert [s['step'] for s in report] == ['workdir', 'write', 'init_cmd[1]']
+    assert all(s['excode'] == 0 for s in report)
+    assert (tmp_path / 'works' / 'a.txt').read_text() == "its ok\n"
+    # 단계마다 서브쉘이라 cd 가 이어지지 않음
+    assert (tmp_path / 'pwd.txt').read_text().strip() != \
+        str(tmp_path / 'works')
+    assert (tmp_path / '.bilbo_bootstrap_notebook.log').exists()
+
+
+def test_bootstrap_fail_fast(tmp_path):
+    """처음 실패한 단계에서 멈춤."""
+    send = _local_send_cmd(tmp_path)
+    steps = [('ok', 'true'), ('bad', 'echo oops >&2; exit 3'),
+             ('never', 'touch ~/never')]
+    with pytest.raises(RuntimeError, match="step 'bad' \\(exit 3\\)"):
+        run_bootstrap('ubuntu', 'key', 'ip', 'worker', steps, send)
+    assert not (tmp_path / 'never').exists()
+
+
+def test_bootstrap_no_connection():
+    """접속하지 못하면 호스트를 알려주는 예외."""
+    def _send(user, key, ip, cmd, show_stderr=True, get_excode=False):
+        return None
+
+    with pytest.raises(RuntimeError, match="worker '10.0.0.5'.*connect"):
+        run_bootstrap('ubuntu', 'key', '10.0.0.5', 'worker', [('ok', 'true')],
+                      _send)
+
+
+def test_parse_report():
+    lines = ['noise', 'BILBO_STEP {"step": "a", "excode": 0, '
+             '"duration": 1500}', 'BILBO_STEP broken']
+    assert parse_report(lines) == [{'step': 'a', 'excode': 0,
+                                    'duration': 1.5}]
+    assert step_name('git_clone:my "repo"') == 'git_clone:my__repo_'
+
+
+JUPYTER_LOG = """[I 2021-01-01 ServerApp] Jupyter Server 1.4 is running at:
+[I 2021-01-01 ServerApp] http://ip-172-31-1-2:8888/lab?token=abc123
+[I 2021-01-01 ServerApp]  or http://127.0.0.1:8888/lab?token=abc123
+""".split('\n')
+
+
+def test_match_service_log():
+    """준비 완료 패턴이 나오는 즉시 결과를 얻음."""
+    def _lines():
+        yield from JUPYTER_LOG
+        raise AssertionError("read after ready")
+
+    url = match_service_log(_lines(), JUPYTER_URL_PTRN)[0]
+    assert url == 'http://ip-172-31-1-2:8888/lab?token=abc123'
+    assert public_url(url, '1.2.3.4') == \
+        'http://1.2.3.4:8888/lab?token=abc123'
+
+    lines = ['distributed.nanny - INFO - Start Nanny',
+             'distributed.worker - INFO - Registered to: tcp://10.0.0.2:8786',
+             'distributed.worker - INFO - Registered to: tcp://10.0.0.2:8786']
+    assert len(match_service_log(lines, WORKER_PTRN, 2)) == 2
+    with pytest.raises(TimeoutError):
+        match_service_log(lines, WORKER_PTRN, 3)
+
+
+def test_match_service_exit():
+    """준비 전에 서비스가 끝나면 바로 실패."""
+    lines = ['Traceback (most recent call last):', 'ImportError: dask',
+             EXIT_MARK + '1', 'Scheduler at: tcp://10.0.0.2:8786']
+    with pytest.raises(RuntimeError, match='exited with 1') as e:
+        match_service_log(lines, SCHEDULER_PTRN)
+    assert 'ImportError' in str(e.value)
+
+
+def test_wait_service_pty(monkeypatch):
+    """pty 를 받은 채널로 로그를 따라 읽고, 준비되면 채널을 닫음."""
+    calls = []
+
+    class _Channel:
+        def get_pty(self):
+            calls.append('pty')
+
+        def exec_command(self, cmd):
+            calls.append('exec')
+
+        def close(self):
+            calls.append('close')
+
+    def _stream(channel):
+        # pty 출력은 줄 끝이 \r\n
+        for line in ['Scheduler at:   tcp://10.0.0.2:8786\r']:
+            yield bilbo.bootstrap.STDOUT, line
+        raise AssertionError("read after ready")
+
+    monkeypatch.setattr(bilbo.bootstrap, 'open_channel',
+                        lambda *args: _Channel())
+    monkeypatch.setattr(bilbo.bootstrap, 'CmdStream', _stream)
+    found = wait_service('ubuntu', 'key.pem', '1.2.3.4', 'dask-scheduler',
+                         SCHEDULER_PTRN)
+    assert found == ['tcp://10.0.0.2:8786']
+    assert calls == ['pty', 'exec', 'close']
+
+
+def test_service_cmd(tmp_path):
+    """서비스 출력과 종료 코드가 로그 파일에 남음."""
+    cmd = service_cmd('svc', 'echo started; exit 7')
+    # screen 없이 같은 명령을 실행
+    inner = shlex.split(cmd.split('bash -c ', 1)[1])[0]
+    env = dict(os.environ, HOME=str(tmp_path))
+    subprocess.run(['bash', '-c', inner], env=env)
+    lines = (tmp_path / '.bilbo_svc.log').read_text().split('\n')
+    assert lines[:2] == ['started', EXIT_MARK + '7']
+
+
+def test_bootstrap_no_script_file(tmp_path):
+    """크레덴셜이 든 스크립트는 원격 디스크에 남지 않고, 로그는 본인만 읽음."""
+    send = _local_send_cmd(tmp_path)
+    run_bootstrap('ubuntu', 'key', 'ip', 'worker',
+                  [('secret', 'export AWS_SECRET=abc; cat > /dev/null')],
+                  send)
+    assert sorted(os.listdir(str(tmp_path))) == ['.bilbo_bootstrap_worker.log']
+    log = tmp_path / '.bilbo_bootstrap_worker.log'
+    assert log.stat().st_mode & 0o777 == 0o600
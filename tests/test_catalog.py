@@ -0,0 +1,81 @@
+import pytest
+
+import bilbo.catalog
+import bilbo.hostfacts
+from bilbo.catalog import get_instance_type_info, load_catalog
+from bilbo.cluster import dask_worker_options
+
+
+class StubPaginator:
+    def __init__(self, client):
+        self.client = client
+
+    def paginate(self, InstanceTypes):
+        self.client.calls += 1
+        yield {'InstanceTypes': [self.client.TYPES[t] for t in InstanceTypes]}
+
+
+class StubEC2:
+    TYPES = {
+        'm5.xlarge': {
+            'InstanceType': 'm5.xlarge',
+            'VCpuInfo': {'DefaultVCpus': 4, 'DefaultCores': 2,
+                         'DefaultThreadsPerCore': 2},
+            'MemoryInfo': {'SizeInMiB': 16384}
+        }
+    }
+
+    def __init__(self):
+        self.calls = 0
+
+    def get_paginator(self, name):
+        assert name == 'describe_instance_types'
+        return StubPaginator(self)
+
+
+@pytest.fixture
+def catalog_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(bilbo.catalog, 'bilbo_dir', str(tmp_path))
+    monkeypatch.setattr(bilbo.hostfacts, 'bilbo_dir', str(tmp_path))
+    return tmp_path
+
+
+def test_catalog(catalog_dir):
+    """카탈로그에 없을 때만 DescribeInstanceTypes 호출."""
+    client = StubEC2()
+    entry = get_instance_type_info('m5.xlarge', client)
+    assert entry['VCpus'] == 4
+    assert entry['Cores'] == 2
+    assert entry['MemTotal'] == 16 * 1024 ** 3
+    assert 'm5.xlarge' in load_catalog()
+
+    get_instance_type_info('m5.xlarge', client)
+    assert client.calls == 1
+
+    # TTL 이 지나면 갱신
+    get_instance_type_info('m5.xlarge', client, ttl=0)
+    assert client.calls == 2
+
+
+def test_catalog_sizing(catalog_dir):
+    """카탈로그 정보로 생성 전에 워커 옵션 결정."""
+    wtpl = {'ec2type': 'm5.xlarge', 'ami': 'ami-0123',
+            'type_info': get_instance_type_info('m5.xlarge', StubEC2())}
+    nproc, nthread, memory = dask_worker_options(wtpl)
+    # 물리 코어마다 프로세스, 코어의 하드웨어 쓰레드마다 쓰레드
+    assert (nproc, nthread) == (2, 2)
+    # OS 몫을 뺀 메모리를 나눔
+    assert memory == int(16 * 1024 ** 3 * 0.9) // 2
+
+
+def test_catalog_region(catalog_dir, monkeypatch):
+    """기본 client 는 프로파일의 리전으로 얻음."""
+    regions = []
+
+    def _get_client(service, region=None, max_pool=None):
+        regions.append(region)
+        return StubEC2()
+
+    monkeypatch.setattr(bilbo.catalog, 'get_client', _get_client)
+    get_instance_type_info('m5.xlarge', region='us-west-2', max_pool=10)
+    assert regions == ['us-west-2']
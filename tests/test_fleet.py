@@ -0,0 +1,116 @@
+import pytest
+
+import bilbo.cluster
+import bilbo.util
+from bilbo.cluster import create_fleet_instances, fill_fleet_workers, \
+    worker_options, wait_dask_workers, scale_cluster, spawn_fill_workers
+from bilbo.state import load_cluster_info, save_cluster_info
+from conftest import FakeEC2, TPL
+
+FLEET = {'ec2types': ['m5.large', 'c5.xlarge'],
+         'subnets': ['subnet-a', 'subnet-b'], 'min_count': 3}
+
+
+def test_create_fleet_instances():
+    """용량이 모자라면 다음 타입으로, 최소 수 이상이면 일부만 받아들임."""
+    ec2 = FakeEC2()
+    ec2.capacity = {'m5.large': 2, 'c5.xlarge': 2}
+    tpl = dict(TPL, fleet=FLEET)
+    insts = create_fleet_instances(ec2, tpl, 6, [])
+    assert len(insts) == 4
+    assert [ec2.types[i.instance_id] for i in insts] == \
+        ['m5.large'] * 2 + ['c5.xlarge'] * 2
+    # 시작 템플릿은 바로 제거
+    assert ec2.templates == []
+
+    # 최소 수보다 적으면 생성된 것도 제거하고 실패
+    with pytest.raises(RuntimeError, match='InsufficientInstanceCapacity'):
+        create_fleet_instances(ec2, tpl, 6, [])
+    assert ec2.terminated == []
+    ec2.capacity = {'c5.xlarge': 2}
+    with pytest.raises(RuntimeError):
+        create_fleet_instances(ec2, tpl, 6, [])
+    assert len(ec2.terminated) == 2
+
+
+def test_worker_options_per_type(monkeypatch):
+    """인스턴스 타입별로 워커 옵션을 구하고 기록."""
+    entries = {'c5.xlarge': {'VCpus': 4, 'Cores': 2, 'ThreadsPerCore': 2,
+                             'MemTotal': 8000}}
+    monkeypatch.setattr(bilbo.cluster, 'get_instance_type_info',
+                        lambda ec2type, **kw: entries.get(ec2type))
+    monkeypatch.setattr(bilbo.cluster, 'cached_host_facts', lambda tpl: None)
+    clinfo = {
+        'profile': {'dask': {'worker': {'nthread': 1}}},
+        'template': {'worker': dict(TPL, nproc=2, nthread=1, memory=1024)},
+        'instance': {'workers': [{'ec2type': 'm5.large'},
+                                 {'ec2type': 'c5.xlarge'},
+                                 {'ec2type': 'c5.xlarge'}]},
+        'dask_dashboard_url': 'url'
+    }
+    assert worker_options(clinfo, 'm5.large') == (2, 1, 1024)
+    # 프로파일에서 지정한 nthread 만 공통으로 적용
+    assert worker_options(clinfo, 'c5.xlarge') == (2, 1, 3600)
+    wtpl = clinfo['template']['worker']
+    assert wtpl['type_options'] == {'c5.xlarge': [2, 1, 3600]}
+
+    # 기록된 옵션을 다시 사용
+    entries.clear()
+    assert worker_options(clinfo, 'c5.xlarge') == (2, 1, 3600)
+
+    waits = []
+    monkeypatch.setattr(bilbo.cluster, 'wait_dask_ready',
+                        lambda *args: waits.append(args) or {})
+    wait_dask_workers(clinfo)
+    assert waits == [('url', 6, 6, 1.0)]
+
+
+def test_fill_fleet_workers(dask_cluster, monkeypatch):
+    """모자란 워커는 용량이 생길 때까지 다시 요청해 채움."""
+    monkeypatch.setattr(bilbo.util.time, 'sleep', lambda sec: None)
+    clinfo = load_cluster_info('sc')
+    clinfo['template']['worker']['fleet'] = FLEET
+    save_cluster_info(clinfo)
+    dask_cluster.capacity = {'c5.xlarge': 1}
+
+    scale_cluster('sc', 5)
+    clinfo = load_cluster_info('sc')
+    assert len(clinfo['instance']['workers']) == 3
+    assert clinfo['instance']['workers'][-1]['ec2type'] == 'c5.xlarge'
+    assert clinfo['fleet_pending'] == 2
+
+    # 용량이 없는 동안은 다시 요청
+    calls = []
+    launch = bilbo.cluster.launch_workers
+
+    def _launch(clinfo, cnt):
+        calls.append(cnt)
+        if len(calls) == 2:
+            dask_cluster.capacity['m5.large'] = 5
+        return launch(clinfo, cnt)
+
+    monkeypatch.setattr(bilbo.cluster, 'launch_workers', _launch)
+    assert fill_fleet_workers('sc') == 0
+    assert calls == [2, 2]
+    clinfo = load_cluster_info('sc')
+    assert len(clinfo['instance']['workers']) == 5
+    assert 'fleet_pending' not in clinfo
+    assert dask_cluster.started == ['10.0.2.0', '10.0.2.1', '10.0.2.2']
+
+
+def test_spawn_fill_workers(tmp_path, monkeypatch):
+    """워커 채우기는 분리된 프로세스로 실행하고 로그를 남김."""
+    monkeypatch.setattr(bilbo.cluster, 'log_dir', str(tmp_path))
+    spawned = []
+
+    class _Popen:
+        def __init__(self, args, **kwargs):
+            spawned.append((args, kwargs))
+            self.pid = 123
+
+    monkeypatch.setattr(bilbo.cluster.subprocess, 'Popen', _Popen)
+    assert spawn_fill_workers('sc') == 123
+    args, kwargs = spawned[0]
+    assert args[1:] == ['-m', 'bilbo.cli', 'fill', 'sc']
+    assert kwargs['start_new_session']
+    assert kwargs['stdout'].name == str(tmp_path / 'sc_fill.log')
@@ -0,0 +1,50 @@
+import pytest
+
+import bilbo.hostfacts
+from bilbo.hostfacts import parse_facts, get_host_facts
+from bilbo.cluster import dask_worker_options
+
+PROBE_OUT = """CoreCount=4
+ThreadsPerCore=2
+NumaNodes=1
+MemTotal=33285996544
+RootDiskSize=8319852544
+InstanceStoreCount=1
+InstanceStoreSize=474998784000
+""".split('\n')
+
+TPL = {'ec2type': 'm5d.2xlarge', 'ami': 'ami-0123', 'ssh_user': 'ubuntu',
+       'ssh_private_key': '~/.ssh/key.pem'}
+
+
+@pytest.fixture
+def facts_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(bilbo.hostfacts, 'bilbo_dir', str(tmp_path))
+    return tmp_path
+
+
+def test_parse_facts():
+    facts = parse_facts(PROBE_OUT)
+    assert facts['CoreCount'] == 4
+    assert facts['ThreadsPerCore'] == 2
+    assert facts['InstanceStoreCount'] == 1
+
+
+def test_host_facts_cache(facts_dir):
+    """한 번 프로브하면 같은 타입/AMI 는 캐쉬를 사용."""
+    calls = []
+
+    def send_cmd(user, key, ip, cmd):
+        calls.append(ip)
+        return PROBE_OUT, ''
+
+    facts = get_host_facts(TPL, '1.2.3.4', send_cmd)
+    assert facts['MemTotal'] == 33285996544
+    assert get_host_facts(dict(TPL), '1.2.3.5', send_cmd) == facts
+    assert calls == ['1.2.3.4']
+
+    # 캐쉬가 있으면 SSH 프로브 없이 워커 옵션 결정
+    wtpl = dict(TPL, nthread=1)
+    nproc, nthread, memory = dask_worker_options(wtpl)
+    assert (nproc, nthread) == (4, 1)
+    assert memory == 33285996544 // 4
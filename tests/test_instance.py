@@ -0,0 +1,117 @@
+import datetime
+import queue
+
+import pytest
+
+import bilbo.cluster
+import bilbo.state
+from bilbo.cluster import wait_instances_running, instance_info, \
+    create_cluster, create_inst, collect_cluster_instances, connect_on_ready
+from bilbo.state import load_cluster_info
+from conftest import FakeEC2, TPL
+
+
+class StubPaginator:
+    def __init__(self, client):
+        self.client = client
+
+    def paginate(self, Filters):
+        ids = Filters[0]['Values']
+        self.client.calls += 1
+        insts = [self.client.describe(iid) for iid in ids]
+        yield {'Reservations': [{'Instances': insts}]}
+
+
+class StubEC2:
+    """n 번째 조회부터 running 이 되는 EC2 client."""
+
+    def __init__(self, ready_at):
+        self.ready_at = ready_at
+        self.calls = 0
+        self.launch = datetime.datetime.now(datetime.timezone.utc)
+
+    def get_paginator(self, name):
+        assert name == 'describe_instances'
+        return StubPaginator(self)
+
+    def describe(self, iid):
+        running = self.calls >= self.ready_at[iid]
+        desc = {
+            'InstanceId': iid,
+            'State': {'Name': 'running' if running else 'pending'},
+            'LaunchTime': self.launch,
+            'PrivateIpAddress': '10.0.0.1',
+            'PrivateDnsName': 'ip-10-0-0-1',
+        }
+        if running:
+            desc['PublicIpAddress'] = '1.2.3.4'
+        return desc
+
+
+def test_wait_instances_running():
+    """모든 인스턴스를 한 번에 폴링하고, 준비되는 순서대로 보고."""
+    client = StubEC2({'i-1': 1, 'i-2': 3, 'i-3': 2})
+    order = []
+    readies = wait_instances_running(
+        client, ['i-1', 'i-2', 'i-3'],
+        on_ready=lambda d: order.append(d['InstanceId']), delay=0)
+    assert order == ['i-1', 'i-3', 'i-2']
+    assert list(readies) == order
+    assert client.calls == 3
+    assert set(readies) == {'i-1', 'i-2', 'i-3'}
+    iinfo = instance_info(readies['i-2'])
+    assert iinfo['public_ip'] == '1.2.3.4'
+    assert iinfo['running_secs'] >= 0
+
+
+def test_connect_on_ready(monkeypatch):
+    """준비된 인스턴스부터 역할의 SSH 계정으로 연결. 릴레이 모드는 제외."""
+    connected = queue.Queue()
+
+    class _Pool:
+        def get(self, user, private_key, host):
+            connected.put((user, private_key, host))
+
+    monkeypatch.setattr(bilbo.cluster, 'get_pool', lambda: _Pool())
+    clinfo = {'profile': {}, 'template': {
+        'scheduler': {'ssh_user': 'ubuntu', 'ssh_private_key': 's.pem'},
+        'worker': {'ssh_user': 'ec2-user', 'ssh_private_key': 'w.pem'}}}
+    roles = {'i-1': 'scheduler', 'i-2': 'worker'}
+    client = StubEC2({'i-1': 1, 'i-2': 2})
+    wait_instances_running(client, ['i-1', 'i-2'],
+                           connect_on_ready(clinfo, roles), delay=0)
+    got = [connected.get(timeout=5) for _ in range(2)]
+    assert sorted(got) == [('ec2-user', 'w.pem', '1.2.3.4'),
+                           ('ubuntu', 's.pem', '1.2.3.4')]
+
+    clinfo['profile']['relay'] = True
+    assert connect_on_ready(clinfo, roles) is None
+
+
+def test_create_records_launched(tmp_path, monkeypatch):
+    """다른 역할의 생성이 실패해도 이미 생성된 인스턴스는 저장됨."""
+    monkeypatch.setattr(bilbo.state, 'clust_dir', str(tmp_path))
+    ec2 = FakeEC2()
+    tpl = {'scheduler': dict(TPL), 'worker': dict(TPL, count=2),
+           'notebook': dict(TPL)}
+    clinfo = {'name': 'cc', 'profile': {'dask': {}, 'notebook': {}},
+              'template': tpl, 'instance': {}}
+    monkeypatch.setattr(bilbo.cluster, 'resolve_profile',
+                        lambda profile, clname, params: clinfo)
+    monkeypatch.setattr(bilbo.cluster, 'get_resource', lambda *a, **k: ec2)
+    monkeypatch.setattr(bilbo.cluster, 'get_root_dm', lambda ec2, tpl: [])
+
+    def _create(ec2, tpl, role, clname, prefix):
+        if role == 'notebook':
+            raise RuntimeError('no capacity')
+        return create_inst(ec2, tpl, role, clname, prefix)
+
+    monkeypatch.setattr(bilbo.cluster, 'create_inst', _create)
+    with pytest.raises(RuntimeError):
+        create_cluster('cc.json', 'cc', [])
+    saved = load_cluster_info('cc')
+    assert saved['state'] == 'launching'
+    assert saved['instance']['scheduler'] == {'instance_id': 'i-new0'}
+    assert [w['instance_id'] for w in saved['instance']['workers']] == \
+        ['i-new1', 'i-new2']
+    assert collect_cluster_instances(saved) == ['i-new0', 'i-new1', 'i-new2']
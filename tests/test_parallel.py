@@ -0,0 +1,39 @@
+import time
+
+import pytest
+
+from bilbo.parallel import run_parallel
+
+
+def _work(sec, fail=False):
+    time.sleep(sec)
+    if fail:
+        raise ValueError("failed")
+    return sec
+
+
+def test_run_parallel():
+    """호스트별 작업이 동시에 실행."""
+    jobs = [('host{}'.format(i), _work, (0.1,)) for i in range(8)]
+    st = time.time()
+    res = run_parallel(jobs, width=8)
+    assert time.time() - st < 0.5
+    assert len(res) == 8
+    assert res['host0']['result'] == 0.1
+    assert res['host0']['error'] is None
+
+
+def test_run_parallel_tolerate():
+    """실패를 허용하면 결과로 반환."""
+    jobs = [('ok', _work, (0.01,)), ('bad', _work, (0.01, True))]
+    res = run_parallel(jobs, width=2, fail_fast=False)
+    assert res['ok']['error'] is None
+    assert isinstance(res['bad']['error'], ValueError)
+
+
+def test_run_parallel_fail_fast():
+    """실패하면 남은 작업 취소 후 예외."""
+    jobs = [('bad', _work, (0.01, True))]
+    jobs += [('host{}'.format(i), _work, (0.2,)) for i in range(4)]
+    with pytest.raises(RuntimeError, match='bad'):
+        run_parallel(jobs, width=1, fail_fast=True)
@@ -0,0 +1,76 @@
+import os
+
+import jsonschema
+import pytest
+
+import bilbo.cluster
+import bilbo.profile
+from bilbo.util import prof_dir
+from bilbo.profile import read_profile, validate_by_schema
+from bilbo.cluster import resolve_profile
+
+PRO_NAME = '_bilboproftest_.json'
+PRO_BODY = """
+{
+    "instance": {
+        "ami": "ami-0f49fa254e1806b72",
+        "ec2type": "t3.micro",
+        "security_group": "sg-0bc538e0a7c089b4d",
+        "keyname": "wzdat-seoul",
+        "ssh_user": "ubuntu",
+        "ssh_private_key": "~/.ssh/my-private.pem"
+    },
+    "notebook": {}
+}
+"""
+
+
+@pytest.fixture
+def profile(tmp_path, monkeypatch):
+    monkeypatch.setattr(bilbo.profile, 'cache_dir', str(tmp_path))
+    path = os.path.join(prof_dir, PRO_NAME)
+    with open(path, 'wt') as f:
+        f.write(PRO_BODY)
+    yield PRO_NAME
+    os.unlink(path)
+
+
+def test_validate_all_errors():
+    """실패한 모든 경로를 보고."""
+    pro = {
+        'instance': {'ami': 'wrong', 'vol_size': 1},
+        'unknown': 1
+    }
+    with pytest.raises(jsonschema.exceptions.ValidationError) as e:
+        validate_by_schema(pro)
+    msg = e.value.message
+    assert 'instance.ami' in msg
+    assert 'instance.vol_size' in msg
+    assert '(root)' in msg
+
+
+def test_read_profile_params(profile):
+    pro = read_profile(profile, ['instance.ec2type=t3.nano'])
+    assert pro['instance']['ec2type'] == 't3.nano'
+    assert pro['name'] == PRO_NAME
+
+    with pytest.raises(RuntimeError, match='instance.vol_size=1'):
+        read_profile(profile, ['instance.vol_size=1'])
+
+
+def test_resolved_profile_cache(profile, monkeypatch):
+    """같은 프로파일과 패러미터는 캐쉬된 결과 사용."""
+    clinfo = resolve_profile(profile, 'test', ['instance.ec2type=t3.nano'])
+    assert clinfo['template']['notebook']['ec2type'] == 't3.nano'
+
+    def _fail(*args):
+        raise AssertionError("Should use cache")
+
+    monkeypatch.setattr(bilbo.cluster, 'read_profile', _fail)
+    cached = resolve_profile(profile, 'test', ['instance.ec2type=t3.nano'])
+    assert cached['template'] == clinfo['template']
+    assert cached['profile'] == clinfo['profile']
+
+    # 패러미터가 다르면 다시 해석
+    with pytest.raises(AssertionError):
+        resolve_profile(profile, 'test', ['instance.ec2type=t3.small'])
@@ -0,0 +1,118 @@
+import os
+
+import pytest
+
+import bilbo.cluster
+import bilbo.state
+from bilbo.state import save_cluster_info
+from bilbo.ssh import SSHPool, CONNECT_TIMEOUT
+from bilbo.cluster import select_instances, run_cmd_on_instances, \
+    prune_cmd_logs
+
+TPL = {'ssh_user': 'ubuntu', 'ssh_private_key': '~/.ssh/key.pem'}
+
+
+def _clinfo(nwork=4):
+    return {
+        'name': 'rc',
+        'type': 'dask',
+        'profile': {'parallel': {'width': 8}},
+        'template': {'notebook': TPL, 'scheduler': TPL, 'worker': TPL},
+        'instance': {
+            'notebook': {'instance_id': 'i-nb', 'public_ip': '1.0.0.1',
+                         'private_ip': '10.0.0.1'},
+            'scheduler': {'instance_id': 'i-sc', 'public_ip': '1.0.0.2',
+                          'private_ip': '10.0.0.2'},
+            'workers': [{'instance_id': 'i-w{}'.format(i),
+                         'public_ip': '1.0.1.{}'.format(i),
+                         'private_ip': '10.0.1.{}'.format(i)}
+                        for i in range(nwork)]
+        }
+    }
+
+
+def _ips(hosts):
+    return [inst['public_ip'] for inst, _ in hosts]
+
+
+def test_select_instances():
+    clinfo = _clinfo()
+    assert len(select_instances(clinfo, 'all')) == 6
+    assert _ips(select_instances(clinfo, 'scheduler')) == ['1.0.0.2']
+    assert [r for _, r in select_instances(clinfo, 'workers')] == \
+        ['worker'] * 4
+    # desc 번호: 1 노트북, 2 스케쥴러, 3~ 워커
+    assert _ips(select_instances(clinfo, '3-4')) == ['1.0.1.0', '1.0.1.1']
+    assert _ips(select_instances(clinfo, '5-')) == ['1.0.1.2', '1.0.1.3']
+    # 조합과 중복 제거, desc 순서로 정렬
+    assert _ips(select_instances(clinfo, 'i-w3,10.0.0.1,1.0.1.3,1')) == \
+        ['1.0.0.1', '1.0.1.3']
+
+    for bad in ('7', '0-2', 'i-none', '9.9.9.9'):
+        with pytest.raises(RuntimeError):
+            select_instances(clinfo, bad)
+
+
+def test_run_cmd_on_instances(tmp_path, monkeypatch, capsys):
+    """선택한 호스트에 동시에 실행하고 exit code 를 모음."""
+    monkeypatch.setattr(bilbo.state, 'clust_dir', str(tmp_path))
+    save_cluster_info(_clinfo())
+    calls = []
+
+    def _run(clname, user, key, ip, cmd, show_stdout=True, show_stderr=True,
+             timeout=CONNECT_TIMEOUT, prefix=''):
+        assert timeout == CONNECT_TIMEOUT
+        calls.append((ip, prefix))
+        if ip == '1.0.1.3':
+            raise RuntimeError("can not connect")
+        print(prefix + 'hello')
+        return ['hello'], [], 2 if ip == '1.0.1.2' else 0
+
+    monkeypatch.setattr(bilbo.cluster, 'run_cmd_and_store_result', _run)
+    assert run_cmd_on_instances('rc', 'workers', 'echo hello') == 255
+    out = capsys.readouterr().out
+    assert '[1.0.1.0] hello' in out
+    assert 'exit 2' in out
+    assert '4 host(s): 2 succeeded, 2 failed.' in out
+
+    # 한 호스트면 접두어 없이 실행
+    calls.clear()
+    assert run_cmd_on_instances('rc', '1.0.0.2', 'echo hello') == 0
+    assert calls == [('1.0.0.2', '')]
+
+
+def test_relay_mode(tmp_path, monkeypatch):
+    """릴레이 모드이면 워커는 스케쥴러를 거쳐 Private IP 로 접속."""
+    monkeypatch.setattr(bilbo.state, 'clust_dir', str(tmp_path))
+    pool = SSHPool()
+    monkeypatch.setattr(bilbo.cluster, 'get_pool', lambda: pool)
+    clinfo = _clinfo(2)
+    clinfo['profile']['relay'] = True
+    for wrk in clinfo['instance']['workers']:
+        wrk['public_ip'] = None
+    save_cluster_info(clinfo)
+    ips = []
+
+    def _run(clname, user, key, ip, cmd, *args, **kwargs):
+        ips.append(ip)
+        return [], [], 0
+
+    monkeypatch.setattr(bilbo.cluster, 'run_cmd_and_store_result', _run)
+    assert run_cmd_on_instances('rc', 'scheduler,workers', 'ls') == 0
+    assert sorted(ips) == ['1.0.0.2', '10.0.1.0', '10.0.1.1']
+    assert pool._routes['10.0.1.1'][2] == '1.0.0.2'
+
+
+def test_prune_cmd_logs(tmp_path, monkeypatch):
+    """클러스터와 호스트별로 최근 로그만 남김."""
+    monkeypatch.setattr(bilbo.cluster, 'log_dir', str(tmp_path))
+    for i in range(5):
+        (tmp_path / 'rc_1.0.0.1_20240101_00000{}.log'.format(i)).write_text('')
+    (tmp_path / 'rc_1.0.0.2_20240101_000000.log').write_text('')
+    (tmp_path / 'rc_autoscale.jsonl').write_text('')
+
+    removed = prune_cmd_logs('rc', '1.0.0.1', 2)
+    assert len(removed) == 3
+    assert sorted(os.listdir(str(tmp_path))) == [
+        'rc_1.0.0.1_20240101_000003.log', 'rc_1.0.0.1_20240101_000004.log',
+        'rc_1.0.0.2_20240101_000000.log', 'rc_autoscale.jsonl']
@@ -0,0 +1,62 @@
+import time
+
+import pytest
+
+import bilbo.util
+from bilbo.util import backoff_wait
+from bilbo.cluster import wait_dask_ready
+
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(bilbo.util.time, 'sleep', sleeps.append)
+    return sleeps
+
+
+def _identity(nworkers, nthreads=2):
+    return {'type': 'Scheduler', 'workers': {
+        'tcp://10.0.1.{}:40000'.format(i): {'nthreads': nthreads}
+        for i in range(nworkers)}}
+
+
+def test_backoff_wait(no_sleep):
+    """지수 백오프와 지터로 기다리며 상한을 넘지 않음."""
+    attempts = iter(backoff_wait(time.time() + 3600, base=1, cap=8))
+    for _ in range(7):
+        next(attempts)
+    assert len(no_sleep) == 6
+    for sec, delay in zip(no_sleep, [1, 2, 4, 8, 8, 8]):
+        assert delay / 2 <= sec <= delay
+    # 마감 시간이 지나면 멈춤
+    assert list(backoff_wait(time.time() - 1)) == [0]
+
+
+def test_wait_dask_ready(no_sleep):
+    """기대한 워커와 쓰레드가 모두 등록될 때까지 기다림."""
+    seq = [ConnectionError('refused'), _identity(0), _identity(2),
+           _identity(4)]
+
+    def _fetch(url):
+        res = seq.pop(0)
+        if isinstance(res, Exception):
+            raise res
+        return res
+
+    joined = wait_dask_ready('http://1.2.3.4:8787', 4, 8, fetch=_fetch)
+    assert len(joined) == 4
+    assert len(seq) == 0
+    assert len(no_sleep) == 3
+
+
+def test_wait_dask_quorum(no_sleep):
+    """쿼럼에 도달하면 준비된 것으로 봄."""
+    seq = [_identity(2), _identity(3)]
+    joined = wait_dask_ready('url', 4, 8, quorum=0.75,
+                             fetch=lambda url: seq.pop(0))
+    assert len(joined) == 3
+
+    # 쓰레드 수가 모자라면 기다림
+    with pytest.raises(TimeoutError, match='4/4 workers, 4/8 threads'):
+        wait_dask_ready('url', 4, 8, max_wait=0,
+                        fetch=lambda url: _identity(4, 1))
@@ -0,0 +1,74 @@
+import shlex
+
+import pytest
+
+import bilbo.cluster
+from bilbo.state import load_cluster_info, update_cluster_info
+from bilbo.cluster import scale_cluster
+
+
+def _worker_ids(clname):
+    clinfo = load_cluster_info(clname)
+    return [wrk['instance_id'] for wrk in clinfo['instance']['workers']]
+
+
+def test_scale_up(dask_cluster):
+    """늘어난 인스턴스만 만들고 시작."""
+    scale_cluster('sc', 5)
+    assert len(dask_cluster.created) == 3
+    assert dask_cluster.started == ['10.0.2.0', '10.0.2.1', '10.0.2.2']
+    assert _worker_ids('sc') == ['i-w0', 'i-w1', 'i-new0', 'i-new1',
+                                 'i-new2']
+    clinfo = load_cluster_info('sc')
+    assert clinfo['template']['worker']['count'] == 5
+    # 기존 워커 옵션 유지
+    assert clinfo['template']['worker']['nproc'] == 2
+
+
+def test_scale_down(dask_cluster):
+    """뒤쪽 워커부터 스케쥴러를 통해 종료한 후 제거."""
+    scale_cluster('sc', 4)
+    scale_cluster('sc', 1)
+    assert dask_cluster.terminated == ['i-w1', 'i-new0', 'i-new1']
+    assert _worker_ids('sc') == ['i-w0']
+    ip, cmd = dask_cluster.cmds[0]
+    assert ip == '1.0.0.2'
+    code = shlex.split(cmd)[2]
+    assert 'retire_workers' in code
+    assert "['10.0.1.1', '10.0.2.0', '10.0.2.1']" in code
+
+    scale_cluster('sc', 1)
+    assert len(dask_cluster.cmds) == 1
+    with pytest.raises(RuntimeError):
+        scale_cluster('sc', 0)
+
+
+def test_scale_up_failed_wait(dask_cluster, monkeypatch):
+    """올라오지 않은 인스턴스는 제거하고 목록에 남기지 않음."""
+    def _fail(client, ids, on_ready=None):
+        raise TimeoutError('not running')
+
+    monkeypatch.setattr(bilbo.cluster, 'wait_instances_running', _fail)
+    with pytest.raises(TimeoutError):
+        scale_cluster('sc', 4)
+    assert dask_cluster.terminated == ['i-new0', 'i-new1']
+    assert _worker_ids('sc') == ['i-w0', 'i-w1']
+
+    # 일부만 올라오면 나머지는 제거하고 모자란 수로 기록
+    monkeypatch.setattr(bilbo.cluster, 'wait_instances_running',
+                        lambda client, ids, on_ready=None:
+                        {ids[0]: dask_cluster.describe(ids[0])})
+    scale_cluster('sc', 4)
+    assert dask_cluster.terminated[2:] == ['i-new3']
+    assert _worker_ids('sc') == ['i-w0', 'i-w1', 'i-new2']
+    assert load_cluster_info('sc')['fleet_pending'] == 1
+
+
+def test_scale_down_join_secs(dask_cluster):
+    """종료한 워커의 등록 시간 기록은 스케쥴러 주소로 찾아 지움."""
+    update_cluster_info('sc', {'worker_join_secs': {
+        'tcp://10.0.1.0:40001': 3.0, 'tcp://10.0.1.1:40001': 4.0,
+        'tcp://10.0.1.1:40002': 4.5}})
+    scale_cluster('sc', 1)
+    joined = load_cluster_info('sc')['worker_join_secs']
+    assert joined == {'tcp://10.0.1.0:40001': 3.0}
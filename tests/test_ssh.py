@@ -0,0 +1,272 @@
+import os
+import time
+import socket
+
+from bilbo.ssh import SSHPool, CmdStream, STDOUT, read_channel, probe_port, \
+    wait_port
+
+
+class FakeSession:
+    def close(self):
+        self.closed = True
+
+
+class FakeTransport:
+    def __init__(self):
+        self.active = True
+
+    def is_active(self):
+        return self.active
+
+    def open_session(self):
+        return FakeSession()
+
+
+class FakeClient:
+    def __init__(self):
+        self.transport = FakeTransport()
+        self.closed = False
+
+    def get_transport(self):
+        return self.transport
+
+    def close(self):
+        self.closed = True
+        self.transport.active = False
+
+
+def _fake_pool(**kwargs):
+    pool = SSHPool(**kwargs)
+    pool.connects = 0
+
+    def _connect(user, key_path, host, timeout, **kwargs):
+        pool.connects += 1
+        return FakeClient()
+
+    pool._connect = _connect
+    return pool
+
+
+def test_pool_reuse():
+    """같은 호스트에는 연결을 재사용."""
+    pool = _fake_pool()
+    c1 = pool.get('ubuntu', '~/.ssh/key.pem', '1.2.3.4')
+    c2 = pool.get('ubuntu', '~/.ssh/key.pem', '1.2.3.4')
+    assert c1 is c2
+    assert pool.connects == 1
+
+    c3 = pool.get('ubuntu', '~/.ssh/key.pem', '1.2.3.5')
+    assert c3 is not c1
+    assert pool.connects == 2
+
+
+def test_pool_reconnect_stale():
+    """끊어진 연결은 다시 연결."""
+    pool = _fake_pool()
+    c1 = pool.get('ubuntu', '~/.ssh/key.pem', '1.2.3.4')
+    c1.transport.active = False
+    c2 = pool.get('ubuntu', '~/.ssh/key.pem', '1.2.3.4')
+    assert c2 is not c1
+    assert c1.closed
+    assert pool.connects == 2
+
+
+def test_pool_evict_idle():
+    """유휴 연결은 제거."""
+    pool = _fake_pool(max_idle=0.01)
+    c1 = pool.get('ubuntu', '~/.ssh/key.pem', '1.2.3.4')
+    time.sleep(0.02)
+    pool.evict_idle()
+    assert c1.closed
+    pool.close()
+
+
+def test_pool_keep_open_channel():
+    """채널을 쓰는 연결은 유휴 시간이 지나도 제거하지 않음."""
+    pool = _fake_pool(max_idle=0.01)
+    ch = pool.open_session('ubuntu', '~/.ssh/key.pem', '1.2.3.4')
+    c1 = pool.get('ubuntu', '~/.ssh/key.pem', '1.2.3.4')
+    time.sleep(0.02)
+    # 다른 호스트의 get 이 유휴 연결 정리를 일으킴
+    pool.get('ubuntu', '~/.ssh/key.pem', '1.2.3.5')
+    assert not c1.closed
+
+    # 채널을 닫으면 그 때부터 유휴 시간을 셈
+    ch.close()
+    ch.close()
+    assert pool._conns[pool._ckey('ubuntu', '~/.ssh/key.pem', '1.2.3.4',
+                                  False)][2] == 0
+    pool.evict_idle()
+    assert not c1.closed
+    time.sleep(0.02)
+    pool.evict_idle()
+    assert c1.closed
+
+    with pool.hold('ubuntu', '~/.ssh/key.pem', '1.2.3.6') as c2:
+        time.sleep(0.02)
+        pool.evict_idle()
+        assert not c2.closed
+    pool.close()
+
+
+class FakeChannel:
+    """미리 정해진 조각을 돌려주는 채널."""
+
+    def __init__(self, outs, errs, excode):
+        self.outs = list(outs)
+        self.errs = list(errs)
+        self.excode = excode
+        self.rfd, wfd = os.pipe()
+        os.write(wfd, b'x')
+
+    def fileno(self):
+        return self.rfd
+
+    def recv_ready(self):
+        return len(self.outs) > 0
+
+    def recv(self, size):
+        return self.outs.pop(0)
+
+    def recv_stderr_ready(self):
+        return len(self.errs) > 0
+
+    def recv_stderr(self, size):
+        return self.errs.pop(0)
+
+    def exit_status_ready(self):
+        return True
+
+    def recv_exit_status(self):
+        return self.excode
+
+
+def test_read_channel_multibyte():
+    """멀티바이트 문자가 조각 사이에서 잘려도 올바르게 디코딩."""
+    body = '안녕하세요 bilbo\n'.encode('utf-8')
+    outs = [body[:1], body[1:4], body[4:]]
+    errs = ['에러'.encode('utf-8')[:2], '에러'.encode('utf-8')[2:]]
+    chan = FakeChannel(outs, errs, 3)
+    stdouts, stderrs = [], []
+    excode = read_channel(chan, stdouts.append, stderrs.append)
+    assert ''.join(stdouts) == '안녕하세요 bilbo\n'
+    assert ''.join(stderrs) == '에러'
+    assert excode == 3
+
+
+def test_cmd_stream(tmp_path):
+    """줄 단위로 흘려보내고, 메모리에는 마지막 줄만 유지."""
+    body = ''.join('line {}\n'.format(i) for i in range(100)).encode('utf-8')
+    outs = [body[i:i + 7] for i in range(0, len(body), 7)]
+    chan = FakeChannel(outs, [b'oops'], 1)
+    chan.close = lambda: None
+    log_path = str(tmp_path / 'cmd.log')
+    stream = CmdStream(chan, log_path, tail_size=5)
+    lines = [line for kind, line in stream if kind == STDOUT]
+    assert len(lines) == 100
+    assert lines[-1] == 'line 99'
+    assert stream.tail_out == ['line {}'.format(i) for i in range(95, 100)]
+    assert stream.tail_err == ['oops']
+    assert stream.excode == 1
+    with open(log_path) as f:
+        logged = f.read().split('\n')
+    assert len(logged) == 102
+    assert '[stderr] oops' in logged
+
+
+def test_pool_jump_route():
+    """경유 호스트가 등록되면 경유 호스트 연결을 거쳐 접속."""
+    pool = SSHPool()
+    jumps = []
+
+    def _connect(user, key_path, host, timeout, compress=False,
+                 jump=None):
+        jumps.append((host, jump))
+        return FakeClient()
+
+    pool._connect = _connect
+    pool.set_route('10.0.0.5', ('ubuntu', '~/.ssh/key.pem', '1.2.3.4'))
+    pool.set_route('10.0.0.6', ('ubuntu', '~/.ssh/key.pem', '1.2.3.4'))
+    w1 = pool.get('ubuntu', '~/.ssh/key.pem', '10.0.0.5')
+    pool.get('ubuntu', '~/.ssh/key.pem', '10.0.0.6')
+    # 경유 호스트에는 한 번만 연결
+    assert [h for h, _ in jumps] == ['1.2.3.4', '10.0.0.5', '10.0.0.6']
+    jump_client = jumps[1][1]
+    assert jumps[2][1] is jump_client
+    assert jumps[0][1] is None
+
+    # 경유 연결이 쓰이는 동안은 유휴 연결로 제거하지 않음
+    pool.max_idle = -1
+    pool.evict_idle()
+    assert w1.closed
+    assert not jump_client.closed
+
+    pool.set_route('10.0.0.5', None)
+    pool.get('ubuntu', '~/.ssh/key.pem', '10.0.0.5')
+    assert jumps[-1] == ('10.0.0.5', None)
+
+
+def test_probe_port():
+    """열린 포트와 닫힌 포트를 구분하고, 마감 시간까지만 기다림."""
+    srv = socket.socket()
+    srv.bind(('127.0.0.1', 0))
+    srv.listen(1)
+    port = srv.getsockname()[1]
+    assert probe_port('127.0.0.1', port)
+    assert wait_port('127.0.0.1', port, time.time() + 1)
+    srv.close()
+
+    assert not probe_port('127.0.0.1', port)
+    st = time.time()
+    assert not wait_port('127.0.0.1', port, time.time() + 0.5)
+    assert time.time() - st < 2
+
+
+def test_pool_reachable():
+    """처음 접속된 시간을 기록."""
+    pool = _fake_pool()
+    assert pool.reachable_at('1.2.3.4') is None
+    st = time.time()
+    c1 = pool.get('ubuntu', '~/.ssh/key.pem', '1.2.3.4')
+    first = pool.reachable_at('1.2.3.4')
+    assert first >= st
+    # 다시 연결해도 처음 시간은 유지
+    c1.transport.active = False
+    pool.get('ubuntu', '~/.ssh/key.pem', '1.2.3.4')
+    assert pool.reachable_at('1.2.3.4') == first
+
+
+def test_connect_retry(monkeypatch):
+    """배너 교환 중 끊김, 타임아웃은 마감 시간까지 재시도."""
+    import paramiko
+    import bilbo.ssh
+    import bilbo.util
+
+    errors = [socket.timeout('timed out'),
+              paramiko.SSHException('Error reading SSH protocol banner'),
+              EOFError()]
+
+    class _Client(FakeClient):
+        def set_missing_host_key_policy(self, policy):
+            pass
+
+        def connect(self, **kwargs):
+            if len(errors) > 0:
+                raise errors.pop(0)
+
+        def get_transport(self):
+            self.transport.set_keepalive = lambda sec: None
+            return self.transport
+
+    monkeypatch.setattr(bilbo.ssh.paramiko, 'SSHClient', _Client)
+    monkeypatch.setattr(bilbo.ssh, 'wait_port', lambda *args: True)
+    monkeypatch.setattr(bilbo.util.time, 'sleep', lambda sec: None)
+    pool = SSHPool()
+    pool._load_key = lambda key_path: None
+    client = pool.get('ubuntu', '~/.ssh/key.pem', '1.2.3.4', timeout=60)
+    assert isinstance(client, _Client)
+    assert len(errors) == 0
+
+    # 마감 시간이 지나면 포기
+    errors.extend([socket.timeout()] * 1000)
+    assert pool._connect('ubuntu', 'key', '1.2.3.5', 0) is None
@@ -0,0 +1,45 @@
+import os
+import sys
+import json
+import subprocess
+
+# `bilbo version` 의 임포트 + 실행 시간 예산 (초)
+STARTUP_BUDGET = 0.5
+HEAVY_MODULES = ['boto3', 'botocore', 'paramiko', 'jsonschema',
+                 'bilbo.cluster']
+
+SCRIPT = """
+import sys, time, json
+st = time.perf_counter()
+from click.testing import CliRunner
+from bilbo.cli import main
+res = CliRunner().invoke(main, {args!r})
+elapsed = time.perf_counter() - st
+heavy = [m for m in {heavy!r} if m in sys.modules]
+print(json.dumps(dict(elapsed=elapsed, heavy=heavy, code=res.exit_code)))
+"""
+
+
+def _run_cli(args, home):
+    script = SCRIPT.format(args=args, heavy=HEAVY_MODULES)
+    # 사용자의 ~/.bilbo 를 건드리지 않도록 임시 홈에서 실행
+    env = dict(os.environ, HOME=str(home))
+    out = subprocess.check_output([sys.executable, '-c', script], env=env)
+    return json.loads(out.decode('utf-8').strip().split('\n')[-1])
+
+
+def test_version_startup(tmp_path):
+    """`bilbo version` 은 무거운 모듈 없이 예산 안에 끝나야 함."""
+    res = _run_cli(['version'], tmp_path)
+    assert res['code'] == 0
+    assert res['heavy'] == []
+    assert res['elapsed'] < STARTUP_BUDGET, \
+        "bilbo version took {:.3f}s".format(res['elapsed'])
+
+
+def test_cheap_commands_no_heavy_import(tmp_path):
+    """가벼운 명령은 AWS/SSH 라이브러리를 임포트하지 않음."""
+    for args in (['profiles'], ['ls']):
+        res = _run_cli(args, tmp_path)
+        assert res['code'] == 0
+        assert res['heavy'] == [], args
@@ -0,0 +1,167 @@
+import os
+import json
+import time
+import threading
+
+import pytest
+
+import bilbo.state
+from bilbo.state import save_cluster_info, load_index, cluster_info_exists, \
+    remove_cluster_info, show_all_cluster, check_dup_cluster, \
+    update_cluster_info, modify_cluster_field, load_cluster_info, \
+    SQLiteStore, record_command, load_journal, summarize_journal, \
+    show_history, percentile
+
+
+@pytest.fixture(params=['sqlite', 'json'])
+def clust_dir(request, tmp_path, monkeypatch):
+    monkeypatch.setattr(bilbo.state, 'clust_dir', str(tmp_path))
+    monkeypatch.setenv('BILBO_STATE_BACKEND', request.param)
+    return tmp_path
+
+
+@pytest.fixture
+def json_dir(clust_dir, monkeypatch):
+    monkeypatch.setenv('BILBO_STATE_BACKEND', 'json')
+    return clust_dir
+
+
+def _clinfo(name, nwork=2):
+    return {
+        'name': name,
+        'type': 'dask',
+        'description': 'test cluster',
+        'instance': {
+            'scheduler': {'instance_id': 'i-s'},
+            'workers': [{'instance_id': 'i-{}'.format(i)}
+                        for i in range(nwork)]
+        }
+    }
+
+
+def test_index(clust_dir, capsys):
+    """저장할 때 인덱스가 갱신되고, ls 는 인덱스를 사용."""
+    save_cluster_info(_clinfo('a'))
+    save_cluster_info(_clinfo('b', 4))
+    index = load_index()
+    assert set(index) == {'a', 'b'}
+    assert index['b']['instance_count'] == 5
+    assert cluster_info_exists('a')
+    with pytest.raises(NameError):
+        check_dup_cluster('a')
+
+    show_all_cluster(as_json=True)
+    out = json.loads(capsys.readouterr().out)
+    assert [e['name'] for e in out] == ['a', 'b']
+
+    remove_cluster_info('a')
+    assert not cluster_info_exists('a')
+
+
+def test_index_rebuild(json_dir):
+    """인덱스와 맞지 않는 클러스터 파일은 다시 읽어 갱신."""
+    save_cluster_info(_clinfo('a'))
+    # 인덱스를 거치지 않고 파일이 추가/제거된 경우
+    with open(os.path.join(str(json_dir), 'c.json'), 'wt') as f:
+        f.write(json.dumps(_clinfo('c', 1)))
+    os.unlink(os.path.join(str(json_dir), 'a.json'))
+    index = load_index()
+    assert set(index) == {'c'}
+    assert index['c']['instance_count'] == 2
+
+    os.unlink(os.path.join(str(json_dir), '.index'))
+    assert set(load_index()) == {'c'}
+
+
+def test_field_update(clust_dir):
+    """필드 단위 갱신."""
+    save_cluster_info(_clinfo('a'))
+    update_cluster_info('a', {'state': 'paused'})
+    assert load_cluster_info('a')['state'] == 'paused'
+    assert load_index()['a']['state'] == 'paused'
+
+    modify_cluster_field('a', 'cnt', lambda v: v + 1, 0)
+    modify_cluster_field('a', 'cnt', lambda v: v + 1, 0)
+    clinfo = load_cluster_info('a')
+    assert clinfo['cnt'] == 2
+    assert clinfo['instance'] == _clinfo('a')['instance']
+
+    # 필드 제거와 요약 갱신
+    update_cluster_info('a', {}, ['cnt'])
+    assert 'cnt' not in load_cluster_info('a')
+
+    def _add(insts):
+        insts['workers'].append({'instance_id': 'i-new'})
+        return insts
+
+    modify_cluster_field('a', 'instance', _add)
+    assert load_index()['a']['instance_count'] == 4
+
+
+def test_sqlite_import_json(tmp_path, monkeypatch):
+    """기존 JSON 클러스터 파일을 SQLite 저장소로 가져옴."""
+    with open(str(tmp_path / 'old.json'), 'wt') as f:
+        f.write(json.dumps(_clinfo('old')))
+    store = SQLiteStore(str(tmp_path))
+    assert store.exists('old')
+    assert store.load('old')['description'] == 'test cluster'
+    assert not (tmp_path / 'old.json').exists()
+    # 다시 열어도 중복으로 가져오지 않음
+    assert list(SQLiteStore(str(tmp_path)).index()) == ['old']
+
+
+def test_sqlite_concurrent_modify(tmp_path):
+    """여러 쓰레드에서 같은 필드를 고쳐도 잃어버리는 갱신이 없음."""
+    store = SQLiteStore(str(tmp_path))
+    store.save(_clinfo('a'))
+
+    def _add(i):
+        for j in range(20):
+            store.modify('a', 'cmd_result', lambda v: dict(v, **{
+                '{}-{}'.format(i, j): 0}), {})
+
+    threads = [threading.Thread(target=_add, args=(i,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(store.load('a')['cmd_result']) == 80
+
+
+def test_journal(clust_dir, capsys):
+    """명령 기록은 덧붙이기만 하고 호스트별로 집계."""
+    save_cluster_info(_clinfo('a'))
+    for i in range(20):
+        record_command('a', '1.1.1.1', 'ls', 100.0 + i, 101.0 + i * 2,
+                       0 if i < 19 else 1, 10)
+    record_command('a', '2.2.2.2', 'pwd', 100.0, 100.5, 0, 5)
+    record_command('b', '1.1.1.1', 'ls', 100.0, 100.5, 0, 5)
+    # 클러스터 정보는 건드리지 않음
+    assert 'cmd_result' not in load_cluster_info('a')
+
+    assert len(load_journal('a')) == 21
+    assert len(load_journal('a', '1.1.1.1')) == 20
+    assert len(load_journal('a', failed=True)) == 1
+    assert len(load_journal('a', since=110.0)) == 10
+
+    summary = summarize_journal(load_journal('a'))
+    s = summary['1.1.1.1']
+    assert (s['count'], s['failed'], s['out_size']) == (20, 1, 200)
+    assert (s['p50'], s['p95'], s['max']) == (10.0, 19.0, 20.0)
+    assert summary['2.2.2.2']['p95'] == 0.5
+
+    show_history('a', summary=True, as_json=True)
+    assert json.loads(capsys.readouterr().out)['1.1.1.1']['count'] == 20
+    show_history('a', last=2)
+    assert len(capsys.readouterr().out.strip().split('\n')) == 2
+
+    # 최근 기록만
+    record_command('a', '2.2.2.2', 'df', time.time() - 30, time.time(), 0, 5)
+    show_history('a', minutes=1, as_json=True)
+    assert [e['cmd'] for e in json.loads(capsys.readouterr().out)] == ['df']
+
+
+def test_percentile():
+    assert percentile([], 50) is None
+    assert percentile([3, 1, 2], 50) == 2
+    assert percentile(list(range(1, 101)), 95) == 95